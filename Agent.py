@@ -8,8 +8,11 @@ local_search_agents = {
 
 class Agent():
     # How to handle variable arguments
+    # @param max_turns  The most turns an agent enumerating turns considers
+    #                   per decision (None for all); needed to play with 3 or
+    #                   4 pieces moved per turn
     def __init__(self, color, time_limit, local_search_method,
-        local_search_init_args, local_search_run_args):
+        local_search_init_args, local_search_run_args, max_turns=None):
         self.color = color
         self.opponent_color = "blue" if self.color == "brown" else "brown"
         self.time_limit = time_limit
@@ -17,6 +20,7 @@ class Agent():
             self.local_search_method = local_search_agents[
                 local_search_method](**local_search_init_args)
         self.local_search_run_args = local_search_run_args # Dictionary
+        self.max_turns = max_turns
 
     # @return   A list of (origin, new location) pairs
     def get_choice(self, board):
@@ -35,33 +39,61 @@ class HumanAgent(Agent):
 
 class RandomAgent(Agent):
     def get_choice(self, board):
-        return board.get_random_move(self.color)[0]
+        return board.get_random_turn(self.color)
 
-# @param dict1      INITIAL dictionary (i.e. start state)
-# @param dict2      RESULT dictionary (i.e. result state)
-# @param keys       Optional list of keys of interest
-def any_value_change(dict1, dict2, keys=list()):
-    check_keys = keys if len(keys) > 0 else list(dict1.keys())
+# @param dict1      INITIAL counts (i.e. start state), indexed by type code
+# @param dict2      RESULT counts (i.e. result state)
+# @param keys       Optional sequence of type codes of interest
+def any_value_change(dict1, dict2, keys=()):
+    check_keys = keys if len(keys) > 0 else range(len(dict1))
     difference = 0
     for k in check_keys:
         difference += dict1[k] - dict2[k]
     return difference
 
+# The turns the piece greedy agents rank: every capture turn, or with
+# max_turns the best max_turns turns by captured value (see Board.get_turns)
+def greedy_turns(board, color, max_turns):
+    if max_turns is None:
+        return board.get_capture_turns(color)
+    return board.get_turns(color, TURNS_BEST, max_turns)
+
+# The greedy_turns that eliminate enemy royalty and those that eliminate other
+# enemy pieces, each as (turn, number eliminated) pairs in turn order. Every
+# capture turn is ranked in place (see Board.for_each_turn).
+def rank_greedy_turns(board, color, max_turns):
+    opponent_color = "blue" if color == "brown" else "brown"
+    current_counts = list(board.get_counts(opponent_color))
+    opponent_counts = board.get_counts(opponent_color)
+    some_royalty_eliminated = [] # Keep tuples of move, difference
+    some_enemy_eliminated = [] # Keep tuples of move, difference
+    def rank(moves):
+        royalty_difference = any_value_change(current_counts,
+            opponent_counts, ROYALTY)
+        other_difference = any_value_change(current_counts,
+            opponent_counts, NON_ROYALTY)
+        if royalty_difference:
+            some_royalty_eliminated.append((moves[:], royalty_difference))
+        if other_difference:
+            some_enemy_eliminated.append((moves[:], other_difference))
+    # Only turns that capture can change the counts
+    if max_turns is None:
+        board.for_each_turn(color, rank, captures=True)
+    else:
+        for moves in greedy_turns(board, color, max_turns):
+            saves = board.apply_moves(moves, color)
+            rank(moves)
+            board.reverse_apply_moves(saves, color)
+    return some_royalty_eliminated, some_enemy_eliminated
+
 class PureGreedyRandomAgent(Agent):
     def get_choice(self, board):
-        chosen_move = None
-        # Make copy of current counts.
-        current_counts = dict(board.get_counts(self.opponent_color))
-        for moves in board.get_all_moves_ref(self.color):
-            # Apply moves.
-            saves = board.apply_moves(moves, self.color)
-            if any_value_change(current_counts,
-                board.get_counts(self.opponent_color)):
-                return moves
-            board.reverse_apply_moves(saves, self.color)
+        # Take the first turn that eliminates any enemy piece
+        capture_turn = board.for_each_turn(self.color, list, captures=True)
+        if capture_turn:
+            return capture_turn
         # If no pure "greedy" move has been found, take a random action
-        if chosen_move is None:
-            return board.get_random_move(self.color)[0]
+        return board.get_random_turn(self.color)
 
 # Greedy w.r.t. "best" difference among enemy counts from start to result
 # Simple preferences in order:
@@ -70,26 +102,8 @@ class PureGreedyRandomAgent(Agent):
 #   3. Random move
 class PieceGreedyRandomAgent(Agent):
     def get_choice(self, board):
-        current_counts = dict(board.get_counts(self.opponent_color))
-        some_royalty_eliminated = [] # Keep tuples of difference, move
-        some_enemy_eliminated = [] # Keep tuples of difference, move
-        for moves in board.get_all_moves_ref(self.color):
-            # Apply sequence of moves to the board. 
-            saves = board.apply_moves(moves, self.color)
-            
-            royalty_difference = any_value_change(current_counts,
-                board.get_counts(self.opponent_color), ["king", "prince",
-                "duke"])
-            other_difference = any_value_change(current_counts,
-                board.get_counts(self.opponent_color), ["knight",
-                    "sergeant", "pikemen", "squire", "archer"])
-            if royalty_difference:
-                some_royalty_eliminated.append((moves, royalty_difference))
-            if other_difference:
-                some_enemy_eliminated.append((moves, other_difference))
-
-            # Undo moves.
-            board.reverse_apply_moves(saves, self.color)
+        some_royalty_eliminated, some_enemy_eliminated = rank_greedy_turns(
+            board, self.color, self.max_turns)
 
         # For either royalty or enemy eliminated moves (in that priority order)
         # sort the lists by the difference associated with each move, then
@@ -99,6 +113,6 @@ class PieceGreedyRandomAgent(Agent):
         elif len(some_enemy_eliminated) > 0:
             return sorted(some_enemy_eliminated, key=lambda x : x[1])[-1][0]
         else: # If no good move has been found, take a random action
-            return board.get_random_move(self.color)[0]
+            return board.get_random_turn(self.color)
 
 
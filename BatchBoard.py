@@ -0,0 +1,376 @@
+# Vectorized (NumPy) engine playing many Feudal games at once
+# N boards are kept as a struct of arrays rather than N Board objects:
+#   squares     int16[N, 26]    the square (row*24 + col) of every piece slot,
+#                               blue slots 0-12 then brown slots 13-25, as
+#                               in Board.to_bytes (SLOT_RANKS order, a
+#                               rank's units in number order); -1 once
+#                               captured
+#   castles     int16[N, 4]     blue green, blue interior, brown green and
+#                               brown interior squares
+#   owner       int8[N, 577]    per square: -1 empty, 0 blue, 1 brown
+# Square 576 is an off-board sentinel that is never empty terrain, so rays can
+# be padded with it. Terrain is shared: the boards must come from the same
+# terrain file and only differ in where the castles (which clear terrain) are.
+# Move generation, random move application and game over checks each handle
+# all N boards in a few array operations. MCTS_UCT_LP_Agent runs its
+# simulations on one with batch_playouts. This is the only module needing
+# NumPy; the rest of the game does not use it.
+import numpy as np
+from time import time
+from Board import Board, KING, SQUIRE, ARCHER, MOUNTED, ROYALTY, \
+    TARGET_COUNTS, MOVEMENT, SQUIRE_DIRECTIONS, NO_SQUARE, piece_squares
+
+BLUE, BROWN = 0, 1
+COLOR_INDEX = {"blue" : BLUE, "brown" : BROWN}
+OFF_BOARD = 576
+NUM_SLOTS = 13
+
+# Rank of each of a color's piece slots (King first, Archer last)
+SLOT_RANKS = np.array([rank for rank in range(KING, ARCHER + 1)
+    for _ in range(TARGET_COUNTS[rank])], dtype=np.int8)
+SLOT_MOUNTED = np.isin(SLOT_RANKS, MOUNTED)
+SLOT_ARCHER = SLOT_RANKS == ARCHER
+SLOT_SQUIRE = SLOT_RANKS == SQUIRE
+ROYALTY_SLOTS = np.nonzero(np.isin(SLOT_RANKS, ROYALTY))[0]
+
+# Geometric rays (bounds only, no terrain) for every rank and square:
+# RAYS[rank, sq, direction, step] holds the squares in order of increasing
+# distance from sq, padded (and for the sentinel square filled) with OFF_BOARD
+MAX_STEPS = 23
+def _build_rays():
+    rays = np.full((ARCHER + 1, OFF_BOARD + 1, 8, MAX_STEPS), OFF_BOARD,
+        dtype=np.int16)
+    for rank in range(KING, ARCHER + 1):
+        for sq in range(OFF_BOARD):
+            (i,j) = divmod(sq, 24)
+            for d, (direction, limit) in enumerate(MOVEMENT[rank]):
+                for step in range(limit):
+                    (x,y) = (i + direction[0]*(step + 1),
+                             j + direction[1]*(step + 1))
+                    if x < 0 or x > 23 or y < 0 or y > 23:
+                        break
+                    rays[rank, sq, d, step] = x*24 + y
+    return rays
+
+RAYS = _build_rays()
+RAYS_FLAT = RAYS.ravel().astype(np.int64)
+# Square terrain classes of BatchBoard.square_codes
+PLAIN, GREEN, INTERIOR, ROUGH, BLOCKED = range(5)
+# Occupant code of an owner (-1 empty, 0 blue, 1 brown, indexed from the end
+# for -1) seen by each color: 0 empty, 1 friendly, 2 opponent
+OCCUPANT_CODES = np.array([[1, 2, 0], [2, 1, 0]], dtype=np.int16)
+
+# What a ray does on reaching a square, by square code * 16 + ray flags
+# (see BatchBoard.move_lists): bit 0 the square is a move, bit 1 the ray goes
+# on, bit 3 an archer has now shot past a castle green. This is
+# Piece.moves_into applied to one square.
+def _build_step_actions():
+    actions = np.zeros(15 * 16, dtype=np.int16)
+    for terrain in range(5):
+        for occupant in range(3):
+            for flags in range(16):
+                mounted, archer = flags & 1, flags & 2
+                from_green, past_green = flags & 4, flags & 8
+                if terrain == BLOCKED or occupant == 1 or \
+                    (terrain == ROUGH and mounted):
+                    continue
+                plain = terrain in (PLAIN, ROUGH)
+                green = terrain == GREEN
+                action = 0
+                if green or (terrain == INTERIOR and from_green and
+                    not archer) or (plain and (occupant == 2 or
+                    not past_green)):
+                    action |= 1
+                if (green and archer) or (plain and occupant == 0):
+                    action |= 2
+                if green and archer:
+                    action |= 8
+                actions[(terrain * 3 + occupant) * 16 + flags] = action
+    return actions
+
+STEP_ACTIONS = _build_step_actions()
+# The square a Squire jumps "over" for each of its moves (see the castle
+# jumping check in Board.build_rays), OFF_BOARD where it is off the board
+def _build_squire_over():
+    over = np.full((OFF_BOARD + 1, 8), OFF_BOARD, dtype=np.int16)
+    for sq in range(OFF_BOARD):
+        (i,j) = divmod(sq, 24)
+        for d, direction in enumerate(SQUIRE_DIRECTIONS):
+            if direction[1] in (-1,1):
+                (x,y) = (i + (-1 if direction[0] < 0 else 1), j)
+            else:
+                (x,y) = (i, j + (-1 if direction[1] < 0 else 1))
+            if 0 <= x <= 23 and 0 <= y <= 23:
+                over[sq, d] = x*24 + y
+    return over
+
+OVER = _build_squire_over()
+
+class BatchBoard():
+    # Build a batch mirroring fully set up Boards (pieces may have been
+    # captured since)
+    # @param boards     A list of Boards sharing a terrain file
+    def __init__(self, boards):
+        n = len(boards)
+        self.n = n
+        self.squares = np.full((n, 2 * NUM_SLOTS), -1, dtype=np.int16)
+        self.castles = np.zeros((n, 4), dtype=np.int16)
+        self.owner = np.full((n, OFF_BOARD + 1), -1, dtype=np.int8)
+        # Shared terrain: every rough square or mountain of any board (each
+        # board only lacks those under its own castles)
+        self.mountains = np.zeros(OFF_BOARD + 1, dtype=bool)
+        self.rough = np.zeros(OFF_BOARD + 1, dtype=bool)
+        for board in boards:
+            for (i,j) in board.mountains:
+                self.mountains[i*24 + j] = True
+            for (i,j) in board.rough:
+                self.rough[i*24 + j] = True
+        self.mountains[OFF_BOARD] = True
+
+        for b, board in enumerate(boards):
+            castle = board.blue_castle + board.brown_castle
+            self.castles[b] = [l[0]*24 + l[1] for l in castle]
+            # The piece slots of Board.to_bytes, so get_board can rebuild
+            # the Pieces with their numbers
+            for slot, sq in enumerate(piece_squares(board.blue_pieces,
+                board.brown_pieces)):
+                if sq != NO_SQUARE:
+                    self.squares[b, slot] = sq
+                    self.owner[b, sq] = slot // NUM_SLOTS
+
+        # Per board castle masks; castles clear the shared terrain
+        rows = np.arange(n)
+        self.greens = np.zeros((n, OFF_BOARD + 1), dtype=bool)
+        self.interiors = np.zeros((n, OFF_BOARD + 1), dtype=bool)
+        for k in (0, 2):
+            self.greens[rows, self.castles[:, k]] = True
+            self.interiors[rows, self.castles[:, k + 1]] = True
+        castle_squares = self.greens | self.interiors
+        self.blocked = self.mountains[None, :] & ~castle_squares
+        self.blocked_mounted = (self.mountains | self.rough)[None, :] & \
+            ~castle_squares
+        self.terrain = (3 * np.where(self.blocked, BLOCKED, np.where(
+            self.blocked_mounted, ROUGH, np.where(self.greens, GREEN,
+            np.where(self.interiors, INTERIOR, PLAIN))))).astype(np.int16)
+        for b, board in enumerate(boards):
+            if (len(board.mountains) + 1 != self.blocked[b].sum() or
+                len(board.mountains) + len(board.rough) + 1 !=
+                self.blocked_mounted[b].sum()):
+                raise RuntimeError("BatchBoard: boards must share a terrain")
+
+    # A Board of the position on board b
+    # @param template   The Board the batch was built from for board b, for
+    #                   its terrain and settings
+    def get_board(self, b, template):
+        board = Board(template.moves_max - 1)
+        board.terrain = template.terrain
+        board.set_squares([NO_SQUARE if sq < 0 else int(sq)
+            for sq in self.squares[b]])
+        board.max_dist_blue = template.max_dist_blue
+        board.max_dist_brown = template.max_dist_brown
+        return board
+
+    # Loss conditions: all royalty eliminated OR enemy in castle
+    # @return   bool[N]: on which boards color has lost
+    def lost(self, color):
+        royalty_eliminated = np.all(self.squares[:,
+            color * NUM_SLOTS + ROYALTY_SLOTS] < 0, axis=1)
+        enemy_in_castle = self.owner[np.arange(self.n),
+            self.castles[:, 2 * color + 1]] == 1 - color
+        return royalty_eliminated | enemy_in_castle
+
+    # @return   int8[N]: the winner of each board, 0 (blue), 1 (brown) or -1
+    #           while the game is on; blue losing takes precedence, as in
+    #           Board.compute_winner
+    def get_winners(self):
+        winners = np.full(self.n, -1, dtype=np.int8)
+        winners[self.lost(BROWN)] = BLUE
+        winners[self.lost(BLUE)] = BROWN
+        return winners
+
+    # @return   bool[N]: which games are over
+    def game_over(self):
+        return self.get_winners() >= 0
+
+    # Per board square codes for move generation, flattened to [N * 577]:
+    # terrain (PLAIN, GREEN, INTERIOR, ROUGH or BLOCKED) * 3 + occupant
+    # (0 empty, 1 friendly, 2 opponent)
+    def square_codes(self, c):
+        return (self.terrain + OCCUPANT_CODES[c][self.owner]).ravel()
+
+    # Legal single piece moves of color on every board, walking all rays of
+    # all boards at once and dropping each ray as soon as it is blocked
+    # @param only   Optional bool[N, 13] of the only slots to generate for
+    # @return   (boards, slots, dests) int arrays with one entry per move,
+    #           sorted by board; slots index SLOT_RANKS
+    def move_lists(self, color, only=None):
+        c = COLOR_INDEX[color] if type(color) == str else color
+        pos = self.squares[:, c * NUM_SLOTS:(c + 1) * NUM_SLOTS]
+        b, slot = np.nonzero(pos >= 0 if only is None else (pos >= 0) & only)
+        sq = pos[b, slot].astype(np.int64)
+        # One entry per (board, slot, direction) ray
+        b = np.repeat(b, 8)
+        slot = np.repeat(slot, 8)
+        d = np.tile(np.arange(8), len(sq))
+        sq = np.repeat(sq, 8)
+        # Squires cannot jump over a castle interior
+        keep = ~(SLOT_SQUIRE[slot] & self.interiors[b, OVER[sq, d]])
+        b, slot, d, sq = b[keep], slot[keep], d[keep], sq[keep]
+        ray = ((SLOT_RANKS[slot].astype(np.int64) * (OFF_BOARD + 1) + sq) *
+            8 + d) * MAX_STEPS
+        row = b * (OFF_BOARD + 1)
+        # Per ray flags: bit 0 mounted, 1 archer, 2 starts on a castle green,
+        # 3 (archers) has shot past a castle green
+        flags = (SLOT_MOUNTED[slot] | SLOT_ARCHER[slot] << 1 |
+            self.greens[b, sq] << 2).astype(np.int16)
+        rid = np.arange(len(b))
+
+        codes = self.square_codes(c)
+        found_rid = []
+        found_dest = []
+        for k in range(MAX_STEPS):
+            if not len(rid):
+                break
+            t = RAYS_FLAT[ray + k]
+            step = STEP_ACTIONS[codes[row + t] * 16 + flags]
+            add = step & 1 == 1
+            found_rid.append(rid[add])
+            found_dest.append(t[add])
+            flags = flags | step & 8
+            keep = step & 2 == 2
+            rid, ray, row, flags = rid[keep], ray[keep], row[keep], flags[keep]
+        if not found_rid:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        rids = np.concatenate(found_rid)
+        dests = np.concatenate(found_dest)
+        boards = b[rids]
+        # A stable sort of small integers is a linear time radix sort
+        order = np.argsort(boards.astype(np.uint16) if self.n <= 1 << 16
+            else boards, kind="stable")
+        rids = rids[order]
+        return boards[order], slot[rids], dests[order]
+
+    # Legal destinations of every piece of color on every board
+    # @return   bool[N, 13, 576]: [b, slot, sq] is True if the piece in slot
+    #           (see SLOT_RANKS) can move to sq on board b
+    def move_masks(self, color):
+        boards, slots, dests = self.move_lists(color)
+        masks = np.zeros((self.n, NUM_SLOTS, OFF_BOARD), dtype=bool)
+        masks[boards, slots, dests] = True
+        return masks
+
+    # Number of single piece moves of color on every board
+    def num_moves(self, color):
+        boards, _, _ = self.move_lists(color)
+        return np.bincount(boards, minlength=self.n)
+
+    # Apply one uniformly random single piece move of color on every board
+    # where the game is on and one exists.
+    # @param rng        A numpy.random.Generator
+    # @param exclude    Optional bool[N, 13] of slots that may not move
+    # @return   (slots, origins, dests) int arrays, -1 where nothing moved;
+    #           slots index SLOT_RANKS
+    def apply_random_moves(self, color, rng, exclude=None):
+        c = COLOR_INDEX[color] if type(color) == str else color
+        n = self.n
+        boards, slots_list, dests_list = self.move_lists(c,
+            None if exclude is None else ~exclude)
+        counts = np.bincount(boards, minlength=n)
+        moving = (counts > 0) & ~self.game_over()
+        starts = np.cumsum(counts) - counts
+        rows = np.nonzero(moving)[0]
+        choice = starts[rows] + (rng.random(len(rows)) *
+            counts[rows]).astype(np.int64)
+        slots = np.full(n, -1, dtype=np.int64)
+        dests = np.full(n, -1, dtype=np.int64)
+        origins = np.full(n, -1, dtype=np.int64)
+        slots[rows] = slots_list[choice]
+        dests[rows] = dests_list[choice]
+
+        slot = c * NUM_SLOTS + slots[rows]
+        origin = self.squares[rows, slot].astype(np.int64)
+        dest = dests[rows]
+        origins[rows] = origin
+        # Captures: clear the enemy slot on dest
+        enemy = self.owner[rows, dest] == 1 - c
+        capture_rows = rows[enemy]
+        enemy_slots = self.squares[capture_rows,
+            (1 - c) * NUM_SLOTS:(2 - c) * NUM_SLOTS] == dest[enemy][:, None]
+        self.squares[capture_rows, (1 - c) * NUM_SLOTS +
+            enemy_slots.argmax(axis=1)] = -1
+        self.owner[capture_rows, dest[enemy]] = -1
+        # Archers shoot without moving
+        moves = ~(enemy & SLOT_ARCHER[slots[rows]])
+        rows, slot, origin, dest = rows[moves], slot[moves], origin[moves], \
+            dest[moves]
+        self.owner[rows, origin] = -1
+        self.owner[rows, dest] = c
+        self.squares[rows, slot] = dest
+        return slots, origins, dests
+
+    # Apply a random turn of color on every board, drawn as in
+    # Board.apply_random_turn (so not uniform over turns): 1 to max_pieces
+    # distinct pieces, out of those able to move, are sampled uniformly and
+    # each makes a uniformly random move, in sorted Piece order (rank, then
+    # column, then number). A piece blocked by an earlier move of the turn
+    # is skipped, and a board's turn ends as soon as its game is over.
+    # @return   A list with the (slots, origins, dests) of apply_random_moves
+    #           for each piece moved in turn
+    def apply_random_turns(self, color, rng, max_pieces=1):
+        c = COLOR_INDEX[color] if type(color) == str else color
+        n = self.n
+        rows = np.arange(n)
+        boards, slots_list, _ = self.move_lists(c,
+            ~self.game_over()[:, None])
+        movable = np.zeros((n, NUM_SLOTS), dtype=bool)
+        movable[boards, slots_list] = True
+        num_movable = movable.sum(axis=1)
+        num_pieces = (rng.random(n) * np.minimum(max_pieces,
+            num_movable)).astype(np.int64) + 1
+        num_pieces[num_movable == 0] = 0
+        # A uniform sample of num_pieces movable slots: those with the
+        # smallest random keys
+        keys = np.where(movable, rng.random((n, NUM_SLOTS)), 2.0)
+        ranks = np.argsort(np.argsort(keys, axis=1), axis=1)
+        chosen = ranks < num_pieces[:, None]
+        # Order the chosen slots as Board sorts the pieces
+        pos = self.squares[:, c * NUM_SLOTS:(c + 1) * NUM_SLOTS].astype(
+            np.int64)
+        order = np.argsort(np.where(chosen, (SLOT_RANKS.astype(np.int64) *
+            24 + pos % 24) *
+            NUM_SLOTS + np.arange(NUM_SLOTS), 1 << 20), axis=1)
+        moves = []
+        for i in range(max_pieces):
+            moving = (num_pieces > i) & ~self.game_over()
+            if not moving.any():
+                break
+            exclude = np.ones((n, NUM_SLOTS), dtype=bool)
+            exclude[rows[moving], order[moving, i]] = False
+            moves.append(self.apply_random_moves(c, rng, exclude))
+        return moves
+
+    # Play every game out with random turns, color moving first.
+    # @param turn_limit     The most turns to play (None for no limit); games
+    #                       still on afterwards have no winner (-1)
+    # @param end_time       If given, the time (as time.time()) to stop at;
+    #                       again games still on have no winner
+    # @return   (winners, turns): int8[N] as get_winners, and the number of
+    #           turns each game took
+    def run_playouts(self, color, rng, max_pieces=1, turn_limit=None,
+        end_time=None):
+        c = COLOR_INDEX[color] if type(color) == str else color
+        turns = np.zeros(self.n, dtype=np.int32)
+        over = self.game_over()
+        num_turns = 0
+        while not over.all():
+            if turn_limit is not None and num_turns >= turn_limit:
+                break
+            if end_time is not None and time() > end_time:
+                break
+            self.apply_random_turns(c, rng, max_pieces)
+            turns[~over] += 1
+            over = self.game_over()
+            c = 1 - c
+            num_turns += 1
+        return self.get_winners(), turns
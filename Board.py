@@ -1,9 +1,155 @@
 # Implementation of the Feudal board game with some move restriction
-from itertools import combinations
+from itertools import combinations, islice
 from copy import deepcopy
-import math, random
+import heapq, math, os, pickle, random, struct
 import multiprocessing
-import json
+
+
+# Zobrist keys for incremental position hashing: one random 64-bit number per
+# (color, piece rank, square), where square = row * 24 + col. A board's hash
+# key is the XOR of the keys of all pieces on it. A private generator with a
+# fixed seed keeps keys identical across processes without touching the
+# global random state.
+def _build_zobrist_keys():
+    rng = random.Random(761)
+    return tuple(tuple(tuple(rng.getrandbits(64) for _ in range(576))
+                       for _ in range(9))
+                 for _ in range(2))
+
+ZOBRIST_KEYS = _build_zobrist_keys()
+ZOBRIST_BLUE, ZOBRIST_BROWN = ZOBRIST_KEYS
+
+# Integer piece type codes. A piece's rank (King down to Archer) doubles as
+# its type code and the two castle parts take the codes either side, so piece
+# counts are kept in a list indexed by type code.
+(CASTLE_GREEN, KING, PRINCE, DUKE, KNIGHT, SERGEANT, PIKEMEN, SQUIRE, ARCHER,
+    CASTLE_INTERIOR) = range(10)
+TYPE_NAMES = ("castle_green", "king", "prince", "duke", "knight", "sergeant",
+    "pikemen", "squire", "archer", "castle_interior")
+TYPE_CODES = {name : code for code, name in enumerate(TYPE_NAMES)}
+ROYALTY = (KING, PRINCE, DUKE)
+NON_ROYALTY = (KNIGHT, SERGEANT, PIKEMEN, SQUIRE, ARCHER)
+MOUNTED = (PRINCE, DUKE, KNIGHT)
+
+# Movement specs: MOVEMENT[rank] lists, in move generation order, the
+# (direction, maximum steps) pairs of a piece; terrain is applied on top of
+# these by Board.build_rays.
+ORTHOGONAL = ((-1,0),(0,1),(1,0),(0,-1))
+DIAGONAL = ((-1,1),(1,1),(1,-1),(-1,-1))
+DIRECTIONS = ((-1,0),(-1,1),(0,1),(1,1),(1,0),(1,-1),(0,-1),(-1,-1))
+SQUIRE_DIRECTIONS = ((-1,-2),(-2,-1),(-2,1),(-1,2),(1,2),(2,1),(2,-1),(1,-2))
+
+def _spec(steps, directions=DIRECTIONS, orthogonal=None, diagonal=None):
+    return tuple((d, orthogonal if orthogonal and d in ORTHOGONAL else
+        diagonal if diagonal and d in DIAGONAL else steps) for d in directions)
+
+MOVEMENT = (None,
+    _spec(2),                           # King
+    _spec(54),                          # Prince
+    _spec(54),                          # Duke
+    _spec(54),                          # Knight
+    _spec(12, orthogonal=1),            # Sergeant
+    _spec(12, diagonal=1),              # Pikemen
+    _spec(1, SQUIRE_DIRECTIONS),        # Squire
+    _spec(3))                           # Archer
+
+# Move generation modes for Piece.moves_into
+GEN_MOVES = 0    # Legal destinations
+GEN_AVENGE = 1   # Also the first friendly square on each ray (covered squares)
+GEN_CAPTURES = 2 # Only destinations holding an opponent piece
+
+# Kinds of squares along a ray (see Board.get_rays); only archer rays that
+# cross a castle green and rays ending at a castle interior the piece cannot
+# enter need anything other than RAY_NORMAL
+RAY_NORMAL = 0  # Empty -> move, opponent -> capture and stop
+RAY_PASS = 1    # Castle green an archer shoots over: move, then continue
+RAY_CAPTURE = 2 # Past a castle green: only an opponent can be targeted
+RAY_AVENGE = 3  # Castle interior out of reach: only a friendly piece there
+                # counts, as covered (GEN_AVENGE), then stop
+
+# Packed move encoding. A single piece move is a 20-bit int,
+# origin_sq << 10 | dest_sq with sq = row * 24 + col, and a turn packs its
+# i-th piece move at bit 20 * i. A move code is never 0 (origin != dest), so
+# decoding stops once no bits are left.
+SQUARE_LOCATIONS = tuple((sq // 24, sq % 24) for sq in range(576))
+# Location -> single bit of that square, for square bitmasks (attack maps)
+SQUARE_BITS = {loc : 1 << sq for sq, loc in enumerate(SQUARE_LOCATIONS)}
+
+def encode_move(origin, new_location):
+    return ((origin[0]*24 + origin[1]) << 10) | (new_location[0]*24 +
+        new_location[1])
+
+def decode_move(code):
+    return (SQUARE_LOCATIONS[code >> 10], SQUARE_LOCATIONS[code & 0x3FF])
+
+# @param moves  A turn as a list of (origin, new location) tuples
+def encode_turn(moves):
+    code = 0
+    for i in range(len(moves)):
+        code |= encode_move(moves[i][0], moves[i][1]) << (20 * i)
+    return code
+
+def decode_turn(code):
+    moves = []
+    while code:
+        moves.append(decode_move(code & 0xFFFFF))
+        code >>= 20
+    return moves
+
+# Piece counts (indexed by type code) of a complete setup
+TARGET_COUNTS = [1, 1, 1, 1, 2, 2, 4, 1, 1, 1]
+
+# Turn generation policies for Board.get_turns, for turn counts too large to
+# list in full (3 or 4 pieces per turn); agents take them by name
+TURNS_ALL = "all"           # get_all_moves_ref order
+TURNS_CAPTURES = "captures" # Capture turns first, then the rest
+TURNS_BEST = "best"         # Highest total score_move first (beam search)
+TURNS_SAMPLE = "sample"     # Distinct random turns (apply_random_turn)
+
+# Cheap move scores for TURNS_BEST: the value of a captured piece by type code
+# (royalty above any number of others, as the greedy agents rank them), a
+# win, and a bonus per row/column gained towards the enemy castle green
+CAPTURE_VALUES = (0, 100, 100, 100, 1, 1, 1, 1, 1, 0)
+WIN_SCORE = 10000
+ADVANCE_SCORE = 0.01
+# Random draws per wanted turn before TURNS_SAMPLE gives up on duplicates
+SAMPLE_ATTEMPTS = 4
+
+# Compact Board encoding (see Board.to_bytes): moves_max, the blue and brown
+# castle (green, interior) squares and one square per piece slot for blue
+# then brown, followed by the terrain file name; the max_dist values are
+# recomputed from the castles and terrain (see Board.update_max_dists). Piece
+# slots follow rank order (King first, Archer last), with a rank's units in
+# number order; NO_SQUARE marks a captured piece or unplaced castle.
+BOARD_FORMAT = struct.Struct("<B4H26H")
+NO_SQUARE = 0xFFFF
+SLOT_OFFSETS = tuple(sum(TARGET_COUNTS[KING:rank]) for rank in range(ARCHER
+    + 1))
+NUM_SLOTS = sum(TARGET_COUNTS[KING:ARCHER + 1])
+# Terrains without castles by file name (see load_terrain), and terrains with
+# castles by (file name, castle squares) as rebuilt by Board.from_bytes, so
+# that boards decoded in the same process share one Terrain and its ray
+# tables. The latter is emptied once it holds DECODED_TERRAINS_MAX.
+TERRAINS = dict()
+DECODED_TERRAINS = dict()
+DECODED_TERRAINS_MAX = 64
+
+# TerrainIndex cache: in memory by terrain file name, and on disk next to the
+# terrain file (the file name plus INDEX_SUFFIX). An index file starts with
+# INDEX_HEADER: INDEX_MAGIC, INDEX_VERSION and the terrain file's
+# (modification time, size), followed by the pickled index. A stored index is
+# rebuilt when the terrain file changes or INDEX_VERSION is bumped.
+# Unpickling can run code, so an index file is trusted like the terrain file
+# beside it: keep terrain files in directories only trusted users can write.
+TERRAIN_INDEXES = dict()
+INDEX_SUFFIX = ".index.pkl"
+INDEX_VERSION = 2
+INDEX_MAGIC = b"FEUDALTI"
+INDEX_HEADER = struct.Struct("<8sHqQ")
+# Kinds of squares in TerrainIndex.neighbours
+OPEN, ROUGH, MOUNTAIN = range(3)
+# Number of farthest squares summed for Board.max_dist_*
+MAX_DIST_SQUARES = 13
 
 
 def external_count_moves(pieces_combo, board):
@@ -23,6 +169,287 @@ def external_count_moves(pieces_combo, board):
         return count
 
 
+# The static part of a board: terrain plus castle placement. Instances are
+# never modified once built, so any number of Boards (clones) can share one;
+# placing a castle builds a new Terrain instead (see with_castle).
+class Terrain():
+    __slots__ = ("rough", "mountains", "blue_castle", "brown_castle",
+        "source", "index", "castle_mask", "ray_tables", "ray_squares",
+        "ray_masks")
+
+    # @param rough          frozenset of rough terrain locations
+    # @param mountains      frozenset of mountain locations
+    # @param blue_castle    (green, interior) tuple; None where not yet placed
+    # @param brown_castle   Same as blue_castle
+    # @param source         The terrain file parsed, or None; boards are
+    #                       serialized with a reference to it (see
+    #                       Board.to_bytes)
+    # @param index          The TerrainIndex of rough and mountains before
+    #                       any castle was placed; built here if not given
+    def __init__(self, rough=frozenset(), mountains=frozenset(),
+        blue_castle=(None, None), brown_castle=(None, None), source=None,
+        index=None):
+        self.rough = rough
+        self.mountains = mountains
+        self.blue_castle = blue_castle
+        self.brown_castle = brown_castle
+        self.source = source
+        if index is None:
+            index = EMPTY_INDEX if not rough and not mountains else \
+                TerrainIndex(rough, mountains)
+        self.index = index
+        # Bitmask of the castle squares, where the index no longer applies
+        self.castle_mask = 0
+        for loc in blue_castle + brown_castle:
+            if loc is not None:
+                self.castle_mask |= SQUARE_BITS[loc]
+        # (rank, location) -> terrain-aware rays, built lazily by
+        # Board.get_rays; only valid for this exact terrain
+        self.ray_tables = dict()
+        # (rank, location) -> frozenset of every square on those rays
+        self.ray_squares = dict()
+        # (rank, location) -> the same squares as a bitmask (see SQUARE_BITS)
+        self.ray_masks = dict()
+
+    # Return a new Terrain with one part of a castle placed at location, which
+    # clears any rough terrain or mountain there.
+    # @param part   0 for the castle green, 1 for the castle interior
+    def with_castle(self, color, part, location):
+        castle = list(self.blue_castle if "blue" == color
+            else self.brown_castle)
+        castle[part] = location
+        castle = tuple(castle)
+        return Terrain(self.rough - {location}, self.mountains - {location},
+            castle if "blue" == color else self.blue_castle,
+            castle if "brown" == color else self.brown_castle, self.source,
+            self.index)
+
+    # The kinds (OPEN, ROUGH or MOUNTAIN) of the 8 squares around location,
+    # as (location, kind) pairs in DIRECTIONS order; location is None off the
+    # board. Castle squares count as open.
+    def get_neighbours(self, location):
+        neighbours = self.index.neighbours[location[0]*24 + location[1]]
+        if not self.castle_mask:
+            return neighbours
+        return tuple((loc, OPEN if loc is not None and
+            self.castle_mask & SQUARE_BITS[loc] else kind)
+            for loc, kind in neighbours)
+
+    # Bitmask (see SQUARE_BITS) of the mountains
+    def get_mountain_mask(self):
+        mask = self.index.mountain_mask
+        for loc in self.blue_castle + self.brown_castle:
+            if loc is not None and loc not in self.mountains:
+                mask &= ~SQUARE_BITS[loc]
+        return mask
+
+    # The sum of the MAX_DIST_SQUARES largest distances from open
+    # (non-mountain) squares to location (see Board.place_pieces)
+    def get_max_dist(self, location):
+        index = self.index
+        far = index.get_far_squares(location)
+        # Castles clear mountains the index still has
+        cleared = [(math.dist(loc, location), loc)
+            for loc in self.blue_castle + self.brown_castle
+            if loc is not None and loc in index.mountains and
+            loc not in self.mountains]
+        if cleared:
+            far = sorted(far + tuple(cleared), key=lambda x : x[0],
+                reverse=True)[:MAX_DIST_SQUARES]
+        return sum([ld[0] for ld in far])
+
+
+# Everything about a terrain that does not depend on the pieces or castles,
+# built once per terrain file and kept in memory and on disk (see
+# get_terrain_index). Ray tables and farthest squares are filled in on demand
+# for terrains not read from a file.
+class TerrainIndex():
+    __slots__ = ("version", "source", "stamp", "rough", "mountains",
+        "rough_mask", "mountain_mask", "neighbours", "far_squares", "rays")
+
+    # @param stamp  The (modification time, size) of the source file
+    def __init__(self, rough, mountains, source=None, stamp=None):
+        self.version = INDEX_VERSION
+        self.source = source
+        self.stamp = stamp
+        self.rough = rough
+        self.mountains = mountains
+        self.rough_mask = 0
+        for loc in rough:
+            self.rough_mask |= SQUARE_BITS[loc]
+        self.mountain_mask = 0
+        for loc in mountains:
+            self.mountain_mask |= SQUARE_BITS[loc]
+        neighbours = []
+        for (i,j) in SQUARE_LOCATIONS:
+            squares = []
+            for direction in DIRECTIONS:
+                loc = (i + direction[0], j + direction[1])
+                if loc not in SQUARE_BITS:
+                    squares.append((None, OPEN))
+                else:
+                    loc = SQUARE_LOCATIONS[loc[0]*24 + loc[1]]
+                    squares.append((loc, MOUNTAIN if loc in mountains else
+                        ROUGH if loc in rough else OPEN))
+            neighbours.append(tuple(squares))
+        self.neighbours = tuple(neighbours)
+        # Square -> the MAX_DIST_SQUARES farthest open squares as
+        # (distance, location), farthest first
+        self.far_squares = dict()
+        # (rank, location) -> (rays, touched) for the terrain without
+        # castles, where touched is the bitmask of every square the walk
+        # looked at: the rays hold on any terrain that has no castle there
+        self.rays = dict()
+
+    def get_far_squares(self, location):
+        far = self.far_squares.get(location)
+        if far is None:
+            far = tuple(sorted([(math.dist(l, location), l)
+                for l in SQUARE_LOCATIONS if l not in self.mountains],
+                key=lambda x : x[0], reverse=True)[:MAX_DIST_SQUARES])
+            self.far_squares[location] = far
+        return far
+
+    # The terrain-aware rays of piece on the terrain without castles (see
+    # Board.build_rays)
+    # @return   (rays, touched)
+    def get_rays(self, piece):
+        key = (piece.rank, piece.location)
+        entry = self.rays.get(key)
+        if entry is None:
+            board = Board()
+            board.terrain = Terrain(self.rough, self.mountains, index=self)
+            touched = []
+            rays = board.build_rays(piece, touched)
+            mask = SQUARE_BITS[piece.location]
+            for loc in touched:
+                mask |= SQUARE_BITS[loc]
+            entry = (rays, mask)
+            self.rays[key] = entry
+        return entry
+
+    # Fill in the far squares and rays of every open square
+    def build_all(self):
+        for location in SQUARE_LOCATIONS:
+            if location in self.mountains:
+                continue
+            self.get_far_squares(location)
+            for rank in range(KING, ARCHER + 1):
+                piece = object.__new__(PIECE_CLASSES[rank])
+                piece.number = 0
+                piece.color = "blue"
+                piece.location = location
+                self.get_rays(piece)
+
+# Parse a terrain file into (rough, mountains) frozensets
+def parse_terrain_file(filename):
+    with open(filename) as file:
+        lines = file.readlines()
+
+    rough = set()
+    mountains = set()
+    parsed_board = [line.split("  ") for line in lines]
+    for i in range(len(parsed_board)):
+        for j in range(len(parsed_board[i])):
+            # Simplistic checking if character in split string (thus
+            # ignores newline characters)
+            if "#" in parsed_board[i][j]:
+                rough.update({(i,j)})
+            elif "^" in parsed_board[i][j]:
+                mountains.update({(i,j)})
+    return frozenset(rough), frozenset(mountains)
+
+# The complete TerrainIndex of a terrain file: from memory, else from the
+# index file next to it (if its header matches the terrain file), else built
+# and saved there. An index file that cannot be loaded for any reason (e.g.
+# written by code with Board under another module name, or an older
+# TerrainIndex layout) is rebuilt. A failure to save (e.g. a read-only
+# directory) only costs the rebuild next time.
+def get_terrain_index(filename):
+    index = TERRAIN_INDEXES.get(filename)
+    if index is not None:
+        return index
+    info = os.stat(filename)
+    stamp = (info.st_mtime_ns, info.st_size)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, *stamp)
+    index_file = filename + INDEX_SUFFIX
+    try:
+        with open(index_file, "rb") as file:
+            if file.read(INDEX_HEADER.size) == header:
+                index = pickle.load(file)
+        if (type(index) != TerrainIndex or index.version != INDEX_VERSION or
+            index.stamp != stamp):
+            index = None
+    except Exception:
+        index = None
+    if index is None:
+        rough, mountains = parse_terrain_file(filename)
+        index = TerrainIndex(rough, mountains, filename, stamp)
+        index.build_all()
+        # Write then rename, so concurrent processes never read a partial
+        # file
+        temp_file = index_file + "." + str(os.getpid())
+        try:
+            with open(temp_file, "wb") as file:
+                file.write(header)
+                pickle.dump(index, file)
+            os.replace(temp_file, index_file)
+        except OSError:
+            pass
+    TERRAIN_INDEXES[filename] = index
+    return index
+
+# The Terrain (without castles) of a terrain file, shared by every board
+# parsing that file in this process.
+def load_terrain(filename):
+    terrain = TERRAINS.get(filename)
+    if terrain is not None:
+        return terrain
+    index = get_terrain_index(filename)
+    terrain = Terrain(index.rough, index.mountains, source=filename,
+        index=index)
+    TERRAINS[filename] = terrain
+    return terrain
+
+# The piece slot squares of Board.to_bytes (NO_SQUARE for a captured piece)
+# @param blue_pieces    Blue Pieces (iterable, e.g. Board.blue_pieces)
+# @param brown_pieces   Brown Pieces
+def piece_squares(blue_pieces, brown_pieces):
+    squares = [NO_SQUARE] * (2 * NUM_SLOTS)
+    for offset, pieces in ((0, blue_pieces), (NUM_SLOTS, brown_pieces)):
+        for piece in pieces:
+            number = piece.number - 1 if piece.number else 0
+            if number >= TARGET_COUNTS[piece.rank]:
+                raise RuntimeError("Board.to_bytes: too many pieces of "
+                    "type " + piece.type_name)
+            slot = offset + SLOT_OFFSETS[piece.rank] + number
+            if squares[slot] != NO_SQUARE:
+                raise RuntimeError("Board.to_bytes: duplicate piece " +
+                    piece.type_name + " " + str(piece.number))
+            squares[slot] = piece.location[0]*24 + piece.location[1]
+    return squares
+
+# The Terrain of a terrain file with the given castles placed, shared by all
+# boards decoded in this process with the same castles.
+# @param castles    (blue green, blue interior, brown green, brown interior)
+#                   locations, None where not placed
+def decoded_terrain(source, castles):
+    key = (source, castles)
+    terrain = DECODED_TERRAINS.get(key)
+    if terrain is not None:
+        return terrain
+    terrain = load_terrain(source) if source else Terrain()
+    for color, part, location in (("blue", 0, castles[0]),
+        ("blue", 1, castles[1]), ("brown", 0, castles[2]),
+        ("brown", 1, castles[3])):
+        if location is not None:
+            terrain = terrain.with_castle(color, part, location)
+    if len(DECODED_TERRAINS) >= DECODED_TERRAINS_MAX:
+        DECODED_TERRAINS.clear()
+    DECODED_TERRAINS[key] = terrain
+    return terrain
+
+
 class Board():
     # @param num_moves_permitted    The number of pieces a player can move in
     #                               a single turn. NOTE: This will be
@@ -30,65 +457,189 @@ class Board():
     #                               range() calls.
     def __init__(self, num_moves_permitted=2):
         self.moves_max = num_moves_permitted + 1
-        self.rough = set()
-        self.mountains = set()
+        # Shared, immutable terrain and castles (see Terrain)
+        self.terrain = Terrain()
         self.blue_pieces = dict() # MAY BE REVISED # PIECES -> LOCATIONS
         self.blue_pieces_locations = dict() # LOCATIONS -> PIECES
         self.brown_pieces = dict() # MAY BE REVISED # PIECES -> LOCATIONS
         self.brown_pieces_locations = dict() # LOCATIONS -> PIECES
-        # Tuple of tuples, first is green, second is interior
-        self.blue_castle = [None, None]
-        self.brown_castle = [None, None]
-        self.blue_piece_counts = {"castle_green" : 0, "castle_interior" : 0,
-            "king" : 0, "prince" : 0, "duke" : 0, "knight": 0, "sergeant" : 0,
-            "pikemen" : 0, "squire" : 0, "archer" : 0}
-        self.brown_piece_counts = {"castle_green" : 0, "castle_interior" : 0,
-            "king" : 0, "prince" : 0, "duke" : 0, "knight": 0, "sergeant" : 0,
-            "pikemen" : 0, "squire" : 0, "archer" : 0}
-        self.target_counts = {"castle_green" : 1, "castle_interior" : 1,
-            "king" : 1, "prince" : 1, "duke" : 1, "knight": 2, "sergeant" : 2,
-            "pikemen" : 4, "squire" : 1, "archer" : 1}
+        # Piece counts indexed by type code (see TYPE_NAMES)
+        self.blue_piece_counts = [0] * len(TYPE_NAMES)
+        self.brown_piece_counts = [0] * len(TYPE_NAMES)
+        self.target_counts = TARGET_COUNTS
         # The maximum distance the 13 pieces could take on from the enemy
         # castle green
         self.max_dist_blue = 0
         self.max_dist_brown = 0
-
-    # Return a clone of the Board instance, only copying the piece dictionaries
+        # Zobrist hash of the piece placement, updated incrementally by
+        # add_piece and the apply/reverse functions
+        self.hash_key = 0
+        # "blue", "brown" or None while the game is still on. Kept up to date
+        # by add_piece and the apply/reverse functions so game_over() is a
+        # simple attribute read.
+        self.winner = self.compute_winner()
+        # Attack maps (see get_attack_map): None until first requested, then
+        # kept up to date by the apply/reverse functions. Not copied by
+        # clone; each board builds its own on demand.
+        self.attack_masks = None # Piece -> bitmask of squares it attacks
+        self.attack_maps = None # Color -> OR of its pieces' attack_masks
+        # Move lists (see get_piece_moves), kept across apply/reverse: only
+        # pieces whose rays hold a changed square are dropped. Each
+        # apply_move_retState pushes the entries it dropped onto
+        # move_cache_undo; reverse_apply_move drops the entries added since
+        # (listed in move_cache_log) and puts the old ones back.
+        self.move_cache = dict() # Piece -> (list of destinations, ray mask)
+        self.move_cache_undo = [] # (log length, dropped entries) per move
+        self.move_cache_log = []
+
+    # Terrain is read through these properties; it is changed only by
+    # parse_terrain and castle placement, which swap in a new Terrain
+    @property
+    def rough(self):
+        return self.terrain.rough
+
+    @property
+    def mountains(self):
+        return self.terrain.mountains
+
+    @property
+    def blue_castle(self):
+        return self.terrain.blue_castle
+
+    @property
+    def brown_castle(self):
+        return self.terrain.brown_castle
+
+    @property
+    def ray_tables(self):
+        return self.terrain.ray_tables
+
+    # Return a clone of the Board instance. The terrain is shared, so only the
+    # piece state (pieces, location maps and counts) is copied.
     def clone(self):
-        new_board = Board(self.moves_max - 1)
-        new_board.rough = self.rough.copy()
-        new_board.mountains = self.mountains.copy()
-        # new_board.blue_pieces = deepcopy(self.blue_pieces)
+        new_board = Board.__new__(Board)
+        new_board.moves_max = self.moves_max
+        new_board.terrain = self.terrain
         new_board.blue_pieces = {p.clone() : p.location for p in self.blue_pieces}
         new_board.blue_pieces_locations = {loc : piece for piece, loc in new_board.blue_pieces.items()}
-        #new_board.blue_pieces_locations = deepcopy(self.blue_pieces_locations)
-        # new_board.brown_pieces = deepcopy(self.brown_pieces)
         new_board.brown_pieces = {p.clone() : p.location for p in self.brown_pieces}
         new_board.brown_pieces_locations = {loc : piece for piece, loc in new_board.brown_pieces.items()}
-        # new_board.brown_pieces_locations = deepcopy(self.brown_pieces_locations)
-        new_board.blue_castle = self.blue_castle[:]
-        new_board.brown_castle = self.brown_castle[:]
-        new_board.blue_piece_counts = self.blue_piece_counts.copy()
-        new_board.brown_piece_counts = self.brown_piece_counts.copy()
+        new_board.blue_piece_counts = self.blue_piece_counts[:]
+        new_board.brown_piece_counts = self.brown_piece_counts[:]
+        new_board.target_counts = self.target_counts
         new_board.max_dist_blue = self.max_dist_blue
         new_board.max_dist_brown = self.max_dist_brown
+        new_board.hash_key = self.hash_key
+        new_board.winner = self.winner
+        new_board.attack_masks = None
+        new_board.attack_maps = None
+        new_board.move_cache = dict()
+        new_board.move_cache_undo = []
+        new_board.move_cache_log = []
 
         return new_board
 
-    # Parse terrain file and store it in internal representation.
+    # Parse terrain file and store it in internal representation. The file
+    # is only read once per process (see load_terrain).
     def parse_terrain(self, filename):
-        with open(filename) as file:
-            lines = file.readlines()
-
-        parsed_board = [line.split("  ") for line in lines]
-        for i in range(len(parsed_board)):
-            for j in range(len(parsed_board[i])):
-                # Simplistic checking if character in split string (thus
-                # ignores newline characters)
-                if "#" in parsed_board[i][j]:
-                    self.rough.update({(i,j)})
-                elif "^" in parsed_board[i][j]:
-                    self.mountains.update({(i,j)})
+        terrain = load_terrain(filename)
+        if self.blue_castle == (None, None) and \
+            self.brown_castle == (None, None):
+            self.terrain = terrain
+        else:
+            # Castles placed first do not clear this terrain, so the index
+            # (which assumes they do) cannot be used
+            self.terrain = Terrain(terrain.rough, terrain.mountains,
+                self.blue_castle, self.brown_castle, filename)
+
+    # Compact encoding of the position (see BOARD_FORMAT): 61 bytes plus
+    # the terrain file name, against several kilobytes for a pickled
+    # Board with its Piece objects and terrain sets. Caches are not included.
+    # Requires at most the TARGET_COUNTS of each piece type.
+    # @return   bytes for from_bytes
+    def to_bytes(self):
+        squares = piece_squares(self.blue_pieces, self.brown_pieces)
+        castles = [NO_SQUARE if loc is None else loc[0]*24 + loc[1]
+            for loc in self.blue_castle + self.brown_castle]
+        source = self.terrain.source
+        return BOARD_FORMAT.pack(self.moves_max, *castles, *squares) + \
+            (source.encode() if source else b"")
+
+    # Rebuild a Board from to_bytes, reading the terrain file it references
+    # (once per process) and sharing the Terrain with boards decoded earlier.
+    @staticmethod
+    def from_bytes(data):
+        values = BOARD_FORMAT.unpack_from(data)
+        source = data[BOARD_FORMAT.size:].decode()
+        castles = tuple(None if sq == NO_SQUARE else SQUARE_LOCATIONS[sq]
+            for sq in values[1:5])
+        board = Board(values[0] - 1)
+        board.terrain = decoded_terrain(source, castles)
+        board.set_squares(values[5:])
+        board.update_max_dists()
+        return board
+
+    # Rebuild a Board pickled before the compact encoding from its attribute
+    # dict: terrain sets, castle lists and name-keyed counts, with Pieces
+    # restored by Piece.__setstate__. The terrain has no source file.
+    @staticmethod
+    def from_legacy_state(state):
+        board = Board(state["moves_max"] - 1)
+        board.terrain = Terrain(frozenset(state["rough"]),
+            frozenset(state["mountains"]), tuple(state["blue_castle"]),
+            tuple(state["brown_castle"]))
+        board.set_squares(piece_squares(state["blue_pieces"],
+            state["brown_pieces"]))
+        board.max_dist_blue = state["max_dist_blue"]
+        board.max_dist_brown = state["max_dist_brown"]
+        return board
+
+    # Place the pieces of an encoded board
+    # @param squares    The piece slot squares of to_bytes
+    def set_squares(self, squares):
+        for offset, color, pieces, locations, counts in (
+            (0, "blue", self.blue_pieces, self.blue_pieces_locations,
+                self.blue_piece_counts),
+            (NUM_SLOTS, "brown", self.brown_pieces,
+                self.brown_pieces_locations, self.brown_piece_counts)):
+            zobrist = ZOBRIST_BLUE if "blue" == color else ZOBRIST_BROWN
+            castle = self.blue_castle if "blue" == color else \
+                self.brown_castle
+            counts[CASTLE_GREEN] = int(castle[0] is not None)
+            counts[CASTLE_INTERIOR] = int(castle[1] is not None)
+            for rank in range(KING, ARCHER + 1):
+                for number in range(TARGET_COUNTS[rank]):
+                    sq = squares[offset + SLOT_OFFSETS[rank] + number]
+                    if sq == NO_SQUARE:
+                        continue
+                    piece = object.__new__(PIECE_CLASSES[rank])
+                    piece.number = number + 1 if TARGET_COUNTS[rank] > 1 \
+                        else 0
+                    piece.color = color
+                    piece.location = SQUARE_LOCATIONS[sq]
+                    pieces[piece] = piece.location
+                    locations[piece.location] = piece
+                    counts[rank] += 1
+                    self.hash_key ^= zobrist[rank][sq]
+        self.winner = self.compute_winner()
+
+    # Pickling (e.g. sending boards to worker processes or saving games)
+    # uses the compact encoding; terrain without a source file is sent as is
+    def __getstate__(self):
+        if self.terrain.source is None and (self.rough or self.mountains):
+            return (self.to_bytes(), self.rough, self.mountains)
+        return self.to_bytes()
+
+    def __setstate__(self, state):
+        if isinstance(state, dict): # Pickled before the compact encoding
+            self.__dict__.update(Board.from_legacy_state(state).__dict__)
+            return
+        data = state if isinstance(state, bytes) else state[0]
+        self.__dict__.update(Board.from_bytes(data).__dict__)
+        if not isinstance(state, bytes):
+            self.terrain = Terrain(state[1], state[2], self.blue_castle,
+                self.brown_castle)
+            self.update_max_dists()
 
     # TODO: ADD RENDERING OF ALL PIECES - DAN
     # Print board to terminal
@@ -221,25 +772,258 @@ class Board():
             print("|"+str(i))
         print(board_nums1 + board_nums2)
 
-    # Loss conditions: all royalty eliminated OR enemy in castle
-    def blue_lost(self):
-        royalty_eliminated = ((0 == self.blue_piece_counts["king"]) and
-            (0 == self.blue_piece_counts["prince"]) and
-            (0 == self.blue_piece_counts["duke"]))
+    # Return the rays for piece from its current location, as a tuple of
+    # (locations, kinds) pairs: locations holds, in order, every square the
+    # piece could reach along one direction before terrain blocks it (bounds,
+    # mountains, rough terrain for mounted units, the Sergeant/Pikemen
+    # direction limits, Squire castle jumps and the castle rules), so move
+    # generation only has to check piece occupancy. kinds is None for plain
+    # rays, else a parallel tuple of RAY_* values (archers only).
+    def get_rays(self, piece):
+        key = (piece.rank, piece.location)
+        ray_tables = self.terrain.ray_tables
+        rays = ray_tables.get(key)
+        if rays is None:
+            # The castle-free rays hold unless the walk met a castle square
+            rays, touched = self.terrain.index.get_rays(piece)
+            if touched & self.terrain.castle_mask:
+                rays = self.build_rays(piece)
+            ray_tables[key] = rays
+        return rays
+
+    # Every square on the rays of piece from its current location, i.e. all
+    # squares whose occupancy can affect the piece's moves
+    def get_ray_squares(self, piece):
+        key = (piece.rank, piece.location)
+        ray_squares = self.terrain.ray_squares
+        squares = ray_squares.get(key)
+        if squares is None:
+            squares = frozenset(loc for locs, _ in self.get_rays(piece)
+                for loc in locs)
+            ray_squares[key] = squares
+        return squares
+
+    # get_ray_squares as a bitmask (see SQUARE_BITS)
+    def get_ray_mask(self, piece):
+        key = (piece.rank, piece.location)
+        ray_masks = self.terrain.ray_masks
+        mask = ray_masks.get(key)
+        if mask is None:
+            mask = 0
+            for loc in self.get_ray_squares(piece):
+                mask |= SQUARE_BITS[loc]
+            ray_masks[key] = mask
+        return mask
+
+    # Bitmask (see SQUARE_BITS) of the squares color attacks: every square
+    # one of its pieces could move to, plus the friendly squares it could
+    # avenge (the avenging mode of Piece.moves_into). Built on first use,
+    # then updated incrementally as moves are applied and reversed.
+    def get_attack_map(self, color):
+        if self.attack_maps is None:
+            self.build_attack_maps()
+        return self.attack_maps[color]
+
+    def is_attacked(self, color, location):
+        return bool(self.get_attack_map(color) & SQUARE_BITS[location])
+
+    def build_attack_maps(self):
+        self.attack_masks = dict()
+        self.attack_maps = dict()
+        for color, pieces in (("blue", self.blue_pieces),
+            ("brown", self.brown_pieces)):
+            union = 0
+            for piece in pieces:
+                mask = self.get_attack_mask(piece)
+                self.attack_masks[piece] = mask
+                union |= mask
+            self.attack_maps[color] = union
+
+    def get_attack_mask(self, piece):
+        friendly_locs, opponent_locs = self.get_locations(piece.color)
+        piece.moves_into(self, friendly_locs, opponent_locs, _ATTACK_BUFFER,
+            GEN_AVENGE)
+        mask = 0
+        for loc in _ATTACK_BUFFER:
+            mask |= SQUARE_BITS[loc]
+        del _ATTACK_BUFFER[:]
+        return mask
+
+    # Refresh the attack maps after a move between origin and dest (either
+    # direction). Only pieces with origin or dest on their rays can see a
+    # change, plus the pieces in refresh (those that moved or reappeared).
+    def update_attack_maps(self, origin, dest, refresh):
+        masks = self.attack_masks
+        for color, pieces in (("blue", self.blue_pieces),
+            ("brown", self.brown_pieces)):
+            union = 0
+            for piece in pieces:
+                if piece in refresh:
+                    masks[piece] = self.get_attack_mask(piece)
+                else:
+                    squares = self.get_ray_squares(piece)
+                    if origin in squares or dest in squares:
+                        masks[piece] = self.get_attack_mask(piece)
+                union |= masks[piece]
+            self.attack_maps[color] = union
+
+    # The destinations of piece on this board (as Piece.get_moves_list),
+    # from the move cache when still valid. The list is shared with the
+    # cache: callers must not modify it.
+    def get_piece_moves(self, piece):
+        entry = self.move_cache.get(piece)
+        if entry is None:
+            friendly_locs, opponent_locs = self.get_locations(piece.color)
+            moves = []
+            piece.moves_into(self, friendly_locs, opponent_locs, moves)
+            self.move_cache[piece] = (moves, self.get_ray_mask(piece))
+            if self.move_cache_undo: # Dropped again on reverse
+                self.move_cache_log.append(piece)
+            return moves
+        return entry[0]
+
+    # Drop the cached move lists a move between origin and dest (either
+    # direction) may have changed: those of the moved and captured pieces,
+    # and of every piece with origin or dest on its rays.
+    # @return   The dropped (piece, entry) pairs
+    def invalidate_moves(self, origin, dest, moved, captured):
+        cache = self.move_cache
+        if not cache:
+            return []
+        changed = SQUARE_BITS[origin] | SQUARE_BITS[dest]
+        dropped = [(piece, entry) for piece, entry in cache.items()
+            if entry[1] & changed or piece is moved or piece is captured]
+        for piece, _ in dropped:
+            del cache[piece]
+        return dropped
+
+    # Walk every direction of piece applying all terrain checks; this is the
+    # one place the terrain movement rules are encoded.
+    # @param touched    Optional list to append every square looked at to
+    def build_rays(self, piece, touched=None):
+        (i,j) = piece.location
+        greens = [self.blue_castle[0], self.brown_castle[0]]
+        interiors = [self.blue_castle[1], self.brown_castle[1]]
+        on_green = piece.location in greens
+        rays = []
+        for direction, steps in piece.movement:
+            locs = []
+            kinds = []
+            past_green = False
+            for multiplier in range(1, steps+1):
+                new_loc = (i + direction[0]*multiplier,
+                           j + direction[1]*multiplier)
+                # Check if location is in bounds.
+                if (new_loc[0] < 0  or
+                    new_loc[0] > 23 or
+                    new_loc[1] < 0  or
+                    new_loc[1] > 23):
+                    break
+                if touched is not None:
+                    touched.append(new_loc)
 
-        enemy_in_castle = self.blue_castle[1] in self.brown_pieces_locations
-        return royalty_eliminated or enemy_in_castle
+                # Check if squire is jumping over a castle.
+                if piece.rank == SQUIRE:
+                    if (j-new_loc[1]) in [-1,1]:
+                        if i-new_loc[0] > 0:
+                            (x,y) = (-1,0)
+                        else:
+                            (x,y) = (1,0)
+                    else:
+                        if j-new_loc[1] > 0:
+                            (x,y) = (0,-1)
+                        else:
+                            (x,y) = (0,1)
+                    if touched is not None:
+                        touched.append((x+i,y+j))
+                    if (x+i,y+j) in interiors:
+                        break
 
-    def brown_lost(self):
-        royalty_eliminated = ((0 == self.brown_piece_counts["king"]) and
-            (0 == self.brown_piece_counts["prince"]) and
-            (0 == self.brown_piece_counts["duke"]))
+                # Check if a mounted unit is encountering rough terrain.
+                if piece.rank in MOUNTED and new_loc in self.rough:
+                    break
+
+                # Check if a mountain has been hit
+                if new_loc in self.mountains:
+                    break
+
+                # Entering castle green; archer can shoot past the green
+                if new_loc in greens:
+                    locs.append(new_loc)
+                    kinds.append(RAY_PASS)
+                    if piece.rank == ARCHER:
+                        past_green = True
+                        continue
+                    break
+
+                # Castle interior can only be entered from a green, and never
+                # by an archer; a friendly piece there is still covered
+                if new_loc in interiors:
+                    locs.append(new_loc)
+                    if on_green and piece.rank != ARCHER:
+                        kinds.append(RAY_NORMAL)
+                    else:
+                        kinds.append(RAY_AVENGE)
+                    break
+
+                locs.append(new_loc)
+                kinds.append(RAY_CAPTURE if past_green else RAY_NORMAL)
 
+            if locs:
+                rays.append((tuple(locs), tuple(kinds) if
+                    piece.rank == ARCHER or RAY_AVENGE in kinds else None))
+        return tuple(rays)
+
+    # Loss conditions: all royalty eliminated OR enemy in castle
+    # Work out the winner from scratch (see self.winner for the cached value)
+    # @return   "blue", "brown" or None if neither side has lost
+    def compute_winner(self):
+        counts = self.blue_piece_counts
+        royalty_eliminated = ((0 == counts[KING]) and (0 == counts[PRINCE])
+            and (0 == counts[DUKE]))
+        enemy_in_castle = self.blue_castle[1] in self.brown_pieces_locations
+        if royalty_eliminated or enemy_in_castle:
+            return "brown"
+
+        counts = self.brown_piece_counts
+        royalty_eliminated = ((0 == counts[KING]) and (0 == counts[PRINCE])
+            and (0 == counts[DUKE]))
         enemy_in_castle = self.brown_castle[1] in self.blue_pieces_locations
-        return royalty_eliminated or enemy_in_castle
+        if royalty_eliminated or enemy_in_castle:
+            return "blue"
+        return None
+
+    def blue_lost(self):
+        return self.winner == "brown"
+
+    def brown_lost(self):
+        return self.winner == "blue"
 
     def game_over(self):
-        return self.brown_lost() or self.blue_lost()
+        return self.winner is not None
+
+    # Update the cached winner after color moved from origin to new_location,
+    # capturing enemy_piece (or None). A move can only make the opponent
+    # lose, so unless the game was already over only the opponent's royalty
+    # count and castle interior need checking.
+    def update_winner(self, color, new_location, enemy_piece):
+        if self.winner is not None:
+            self.winner = self.compute_winner()
+            return
+        if "blue" == color:
+            opponent_counts = self.brown_piece_counts
+            opponent_interior = self.brown_castle[1]
+            friendly_locs = self.blue_pieces_locations
+        else:
+            opponent_counts = self.blue_piece_counts
+            opponent_interior = self.blue_castle[1]
+            friendly_locs = self.brown_pieces_locations
+        if new_location == opponent_interior and new_location in friendly_locs:
+            self.winner = color
+        elif (enemy_piece is not None and enemy_piece.rank in ROYALTY and
+            0 == opponent_counts[KING] and 0 == opponent_counts[PRINCE] and
+            0 == opponent_counts[DUKE]):
+            self.winner = color
 
     # Function for adding a single piece to the board
     # Checks for valid placement - i.e. no units placed off the board or on
@@ -264,63 +1048,65 @@ class Board():
             return False
 
         # Otherwise place piece
+        # Castles change the terrain; the current Terrain may be shared with
+        # other boards, so a new one (with its own ray tables) replaces it
         if piece_type == "castle_green":
-            castle = self.blue_castle if "blue" == color else self.brown_castle
-            castle[0] = location
-            counts["castle_green"] += 1
-            if location in self.mountains:
-                self.mountains.remove(location)
-            if location in self.rough:
-                self.rough.remove(location)
+            self.terrain = self.terrain.with_castle(color, 0, location)
+            counts[CASTLE_GREEN] += 1
         elif piece_type == "castle_interior":
-            castle = self.blue_castle if "blue" == color else self.brown_castle
-            castle[1] = location
-            counts["castle_interior"] += 1
-            if location in self.mountains:
-                self.mountains.remove(location)
-            if location in self.rough:
-                self.rough.remove(location)
+            self.terrain = self.terrain.with_castle(color, 1, location)
+            counts[CASTLE_INTERIOR] += 1
         elif piece_type == "king":
             p = King(color, location)
-            counts["king"] += 1
+            counts[KING] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "prince":
             p = Prince(color, location)
-            counts["prince"] += 1
+            counts[PRINCE] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "duke":
             p = Duke(color, location)
-            counts["duke"] += 1
+            counts[DUKE] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "knight":
-            p = Knight(counts["knight"] + 1, color, location)
-            counts["knight"] += 1
+            p = Knight(counts[KNIGHT] + 1, color, location)
+            counts[KNIGHT] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "sergeant":
-            p = Sergeant(counts["sergeant"] + 1, color, location)
-            counts["sergeant"] += 1
+            p = Sergeant(counts[SERGEANT] + 1, color, location)
+            counts[SERGEANT] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "pikemen":
-            p = Pikemen(counts["pikemen"] + 1, color, location)
-            counts["pikemen"] += 1
+            p = Pikemen(counts[PIKEMEN] + 1, color, location)
+            counts[PIKEMEN] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "squire":
             p = Squire(color, location)
-            counts["squire"] += 1
+            counts[SQUIRE] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
         elif piece_type == "archer":
             p = Archer(color, location)
-            counts["archer"] += 1
+            counts[ARCHER] += 1
             dict_pieces[p] = location
             dict_locations[location] = p
 
+        if piece_type != "castle_green" and piece_type != "castle_interior":
+            zobrist = ZOBRIST_BLUE if "blue" == color else ZOBRIST_BROWN
+            self.hash_key ^= zobrist[p.rank][location[0]*24 + location[1]]
+
+        self.winner = self.compute_winner()
+        self.attack_masks = None
+        self.attack_maps = None
+        self.move_cache = dict()
+        self.move_cache_undo = []
+        self.move_cache_log = []
         return True
 
     def remove_piece(self):
@@ -388,28 +1174,23 @@ class Board():
         self.add_piece(dp, dl, c, color, counts,
                         "archer", configuration["archer"])
 
-        # Update max_dist members
-        open_locs = []
-        for i in range(24):
-            for j in range(24):
-                if (i,j) in self.mountains:
-                    continue
-                open_locs.append((i,j))
-        locs_with_dist = [(l, math.dist(l, c[0])) for l in open_locs]
-        locs_with_dist = sorted(locs_with_dist, key=lambda x : x[1],
-            reverse=True)[:13]
-        final_dist = sum([ld[1] for ld in locs_with_dist])
-
         # blue has placed its castle, so now we know max dist for brown and
         # vice versa
-        if "blue" == color:
-            self.max_dist_brown += final_dist
-        else: # brown
-            self.max_dist_blue += final_dist
+        self.update_max_dists()
 
         return counts == self.target_counts
 
 
+    # Set max_dist_blue (from the brown castle green) and max_dist_brown
+    # (from the blue one) for the castles placed so far; 0 while unplaced
+    def update_max_dists(self):
+        green = self.brown_castle[0]
+        self.max_dist_blue = self.terrain.get_max_dist(green) \
+            if green is not None else 0
+        green = self.blue_castle[0]
+        self.max_dist_brown = self.terrain.get_max_dist(green) \
+            if green is not None else 0
+
     def place_some_pieces(self, color, configuration):
         # dp = dict_pieces
         # dl = dict_locations
@@ -487,8 +1268,106 @@ class Board():
         else:
             return self.brown_piece_counts
 
+    # Return a random turn as ([(first_piece_start, first_piece_new)...],
+    # board), where board is a clone with the turn applied.
+    # @param uniform    See apply_random_turn
+    def get_random_move(self, color, uniform=False):
+        new_board = self.clone()
+        moves, _ = new_board.apply_random_turn(color, uniform)
+        return (moves, new_board)
+
+    # As get_random_move but only returns the moves (this board is left as
+    # it was, and no clone is made).
+    def get_random_turn(self, color, uniform=False):
+        moves, saves = self.apply_random_turn(color, uniform)
+        self.reverse_apply_moves(saves, color)
+        return moves
+
+    # Draw a random turn and apply it to this board, in a single pass without
+    # clones or retries.
+    # @param uniform    If False (default), pick how many pieces to move, then
+    #                   that many pieces among those able to move, and move
+    #                   each (in sorted order) to a random destination; a
+    #                   piece blocked by an earlier one is skipped. NOTE: not
+    #                   uniform over all turns; like the original sampler it
+    #                   favours turns moving fewer pieces.
+    #                   If True, every legal turn is equally likely (via the
+    #                   per-combination counts of count_moves_ref).
+    # @return   (moves, saves) for the applied turn
+    def apply_random_turn(self, color, uniform=False):
+        if uniform:
+            return self.apply_uniform_random_turn(color)
+        movable = [p for p in self.get_pieces(color)
+            if self.get_piece_moves(p)]
+        moves = []
+        saves = []
+        if not movable:
+            return moves, saves
+        num_pieces = random.randrange(1, min(self.moves_max,
+            len(movable) + 1))
+        for piece in sorted(random.sample(movable, k=num_pieces)):
+            piece_moves = self.get_piece_moves(piece)
+            if not piece_moves: # Blocked by an earlier piece's move
+                continue
+            piece_move = piece_moves[random.randrange(len(piece_moves))]
+            moves.append((piece.location, piece_move))
+            saves.append(self.apply_move_retState(piece.location, piece_move,
+                color))
+        return moves, saves
+
+    # Uniform mode of apply_random_turn: index into the turns of
+    # get_all_moves_ref using the count of every piece combination.
+    def apply_uniform_random_turn(self, color):
+        pieces = self.get_pieces(color)
+        combos = []
+        total = 0
+        for i in range(1, self.moves_max):
+            for pieces_combo in combinations(pieces.keys(), i):
+                pieces_combo = sorted(pieces_combo)
+                count = self.count_moves_ref(pieces_combo, self)
+                combos.append((pieces_combo, count))
+                total += count
+        moves = []
+        saves = []
+        if total == 0:
+            return moves, saves
+        index = random.randrange(total)
+        for pieces_combo, count in combos:
+            if index < count:
+                self.apply_nth_turn(pieces_combo, index, moves, saves)
+                break
+            index -= count
+        return moves, saves
+
+    # Apply the index-th turn (in get_moves_ref order) of pieces_combo,
+    # appending to moves and saves.
+    def apply_nth_turn(self, pieces_combo, index, moves, saves):
+        piece = pieces_combo[0]
+        color = piece.color
+        origin = piece.location
+        piece_moves = self.get_piece_moves(piece)
+        # Base case:
+        if len(pieces_combo) == 1:
+            moves.append((origin, piece_moves[index]))
+            saves.append(self.apply_move_retState(origin, piece_moves[index],
+                color))
+            return
+        for move in piece_moves:
+            save = self.apply_move_retState(origin, move, color)
+            count = self.count_moves_ref(pieces_combo[1:], self)
+            if index < count:
+                moves.append((origin, move))
+                saves.append(save)
+                self.apply_nth_turn(pieces_combo[1:], index, moves, saves)
+                return
+            index -= count
+            self.reverse_apply_move(save, color)
+
+    # The original sampler, kept for comparison with apply_random_turn: picks
+    # the pieces and retries from scratch (cloning for every sub-move) until
+    # all of them can move.
     # NOTE: DOES NOT REPLICATE A UNIFORM DISTRIBUTION OVER ALL POSSIBLE MOVES
-    def get_random_move(self, color):
+    def get_random_move_rejection(self, color):
         # Reference the correct set of pieces
         pieces = self.get_pieces(color)
 
@@ -504,7 +1383,7 @@ class Board():
         incomplete = True
         while incomplete:
             # 2. Choose pieces
-            chosen_pieces = random.sample(pieces.keys(), k=num_pieces)
+            chosen_pieces = random.sample(list(pieces.keys()), k=num_pieces)
 
             # 3. Try returning a play where all of these pieces have moved
             final_board = self.clone()
@@ -550,18 +1429,39 @@ class Board():
 
     # Count moves but pass the board by reference,
     # undo every move after recursive calls.
+    # Every piece of the combo moves from its original square, so the count
+    # for the remaining pieces only depends on the occupancy of the squares on
+    # their rays (get_ray_squares). A first-piece move that touches none of
+    # those squares (neither its origin nor its destination) leaves that
+    # count unchanged, so it is computed once and reused; only the other
+    # moves are applied, recounted and undone. The result is exact.
     def count_moves_ref(self, pieces_combo, board):
         piece = pieces_combo[0]
-        friendly_locs, opponent_locs = board.get_locations(piece.color)
         # Base case:
         if len(pieces_combo) == 1:
-            return piece.get_num_moves(board, friendly_locs, opponent_locs)
+            return len(board.get_piece_moves(piece))
         else: # Recursion
+            rest = pieces_combo[1:]
+            if len(rest) == 1:
+                touched = board.get_ray_squares(rest[0])
+            else:
+                touched = set()
+                for other in rest:
+                    touched.update(board.get_ray_squares(other))
+            origin = piece.location
+            origin_touched = origin in touched
+            base = None # Count for rest with piece not interfering
             count = 0
-            for move in piece.get_moves(board, friendly_locs, opponent_locs):
-                save = board.apply_move(piece.location,move, piece.color)
-                count += self.count_moves(pieces_combo[1:], board)
-                board.reverse_apply_move(save,piece.color)
+            for move in board.get_piece_moves(piece):
+                if not origin_touched and move not in touched:
+                    if base is None:
+                        base = self.count_moves_ref(rest, board)
+                    count += base
+                else:
+                    save = board.apply_move_retState(origin, move,
+                        piece.color)
+                    count += self.count_moves_ref(rest, board)
+                    board.reverse_apply_move(save, piece.color)
             return count
 
     # Recursive get_num_all_moves to calculate number of possible moves given 
@@ -571,14 +1471,15 @@ class Board():
         # friendly_locs, opponent_locs = self.get_locations(color)
         count = 0
 
+        # Pass board by reference approach.
         for i in range(1, self.moves_max):
             for pieces_combo in combinations(pieces.keys(), i):
-                count += self.count_moves(sorted(pieces_combo), self.clone())
+                count += self.count_moves_ref(sorted(pieces_combo), self)
 
-        # Pass board by reference approach.
-        #for i in range(1,4):
+        # Cloning approach (the original, kept for reference).
+        #for i in range(1, self.moves_max):
         #    for pieces_combo in combinations(pieces.keys(), i):
-        #        count += self.count_moves_ref(sorted(pieces_combo), self)
+        #        count += self.count_moves(sorted(pieces_combo), self.clone())
 
         # Parallel approach
         # with multiprocessing.Pool(processes=8) as pool:
@@ -632,24 +1533,92 @@ class Board():
     # This function is called by get_all_moves_ref()
     def get_moves_ref(self, pieces_combo, board, moves_list, all_moves):
         piece = pieces_combo[0]
-        friendly_locs, opponent_locs = board.get_locations(piece.color)
         # Base case:
         if len(pieces_combo) == 1:
-            for move in piece.get_moves_list(board, friendly_locs, opponent_locs):
+            for move in board.get_piece_moves(piece):
                 moves_list.append((piece.location, move))
                 all_moves.append(moves_list[:])
                 moves_list.pop()
         else: # Recursion
-            for move in piece.get_moves_list(board, friendly_locs, opponent_locs):
+            for move in board.get_piece_moves(piece):
                 moves_list.append((piece.location, move))
                 save = board.apply_move_retState(piece.location, move, piece.color)
                 board.get_moves_ref(pieces_combo[1:], board, moves_list, all_moves)
                 board.reverse_apply_move(save, piece.color)
                 moves_list.pop()
 
+    # As get_moves_ref, but collects encoded turns (see encode_turn): code
+    # holds the moves made so far and shift the bit offset of the next one.
+    def get_codes_ref(self, pieces_combo, board, code, shift, all_codes):
+        piece = pieces_combo[0]
+        origin = piece.location
+        origin_bits = (origin[0]*24 + origin[1]) << 10
+        # Base case:
+        if len(pieces_combo) == 1:
+            for move in board.get_piece_moves(piece):
+                all_codes.append(code |
+                    (origin_bits | (move[0]*24 + move[1])) << shift)
+        else: # Recursion
+            for move in board.get_piece_moves(piece):
+                save = board.apply_move_retState(origin, move, piece.color)
+                board.get_codes_ref(pieces_combo[1:], board, code |
+                    (origin_bits | (move[0]*24 + move[1])) << shift,
+                    shift + 20, all_codes)
+                board.reverse_apply_move(save, piece.color)
+
+    # Walk every turn for color in place, in get_all_moves_ref order, calling
+    # visitor(moves) while the board is in the post-turn state. moves is a
+    # list of (origin, new location) tuples that is reused, so visitors must
+    # copy it to keep it. A truthy return from the visitor stops the walk.
+    # @param captures   As in iter_turns
+    # @return   The board is always restored; returns the visitor's truthy
+    #           result, or None if every turn was visited
+    def for_each_turn(self, color, visitor, captures=None):
+        pieces = self.get_pieces(color)
+        moves_list = []
+        for i in range(1, self.moves_max):
+            for pieces_combo in combinations(pieces.keys(), i):
+                result = self.visit_turns(sorted(pieces_combo), moves_list,
+                    visitor, captures, False)
+                if result:
+                    return result
+        return None
+
+    # Recursive helper to for_each_turn
+    # @param captured   Whether an earlier move of the turn captured
+    def visit_turns(self, pieces_combo, moves_list, visitor, captures,
+        captured):
+        piece = pieces_combo[0]
+        color = piece.color
+        opponent_locs = self.get_locations(color)[1]
+        rest = pieces_combo[1:]
+        origin = piece.location
+        for move in self.get_turn_piece_moves(piece, rest, captures,
+            captured):
+            hit = captured or move in opponent_locs
+            if not rest and captures is not None and captures != hit:
+                continue
+            save = self.apply_move_retState(origin, move, color)
+            moves_list.append((origin, move))
+            if rest:
+                result = self.visit_turns(rest, moves_list, visitor,
+                    captures, hit)
+            else:
+                result = visitor(moves_list)
+            moves_list.pop()
+            self.reverse_apply_move(save, color)
+            if result:
+                return result
+        return None
+
     # get_all_moves_ref - generate all moves but pass around the same 
     # board copy. 
-    def get_all_moves_ref(self, color):
+    # @param encoded    If True, return the turns as ints (see encode_turn)
+    # @param unique     If True, only return the first turn (in the usual
+    #                   order) reaching each distinct position, by Zobrist
+    #                   hash: e.g. two units of the same type trading squares
+    #                   or capturing the same enemy by different routes
+    def get_all_moves_ref(self, color, encoded=False, unique=False):
         if "blue" == color:
             pieces = self.blue_pieces
             friendly_locs = self.blue_pieces_locations
@@ -660,12 +1629,367 @@ class Board():
             opponent_locs = self.blue_pieces_locations
 
         all_moves = []
+        if unique:
+            seen = set()
+            for i in range(1, self.moves_max):
+                for pieces_combo in combinations(pieces.keys(), i):
+                    self.get_unique_moves_ref(sorted(pieces_combo), [],
+                        all_moves, seen, encoded)
+            return all_moves
 
         for i in range(1, self.moves_max):
             for pieces_combo in combinations(pieces.keys(), i):
-                self.get_moves_ref(sorted(pieces_combo), self, [], all_moves)
+                if encoded:
+                    self.get_codes_ref(sorted(pieces_combo), self, 0, 0,
+                        all_moves)
+                else:
+                    self.get_moves_ref(sorted(pieces_combo), self, [],
+                        all_moves)
         return all_moves
 
+    # Recursive helper to get_all_moves_ref in unique mode: as
+    # get_moves_ref, but a turn is only kept if its resulting hash is not in
+    # seen. The last move is hashed without being applied.
+    def get_unique_moves_ref(self, pieces_combo, moves_list, all_moves, seen,
+        encoded):
+        piece = pieces_combo[0]
+        origin = piece.location
+        if len(pieces_combo) > 1: # Recursion
+            for move in self.get_piece_moves(piece):
+                moves_list.append((origin, move))
+                save = self.apply_move_retState(origin, move, piece.color)
+                self.get_unique_moves_ref(pieces_combo[1:], moves_list,
+                    all_moves, seen, encoded)
+                self.reverse_apply_move(save, piece.color)
+                moves_list.pop()
+            return
+        # Base case:
+        for move in self.get_piece_moves(piece):
+            key = self.move_hash(origin, move, piece.color)
+            if key in seen:
+                continue
+            seen.add(key)
+            moves_list.append((origin, move))
+            all_moves.append(encode_turn(moves_list) if encoded else
+                moves_list[:])
+            moves_list.pop()
+
+    # The hash key (see get_hash_key) the board would have after the move,
+    # without applying it
+    def move_hash(self, origin, new_location, color):
+        if "blue" == color:
+            friendly_locs = self.blue_pieces_locations
+            opponent_locs = self.brown_pieces_locations
+            friendly_zobrist = ZOBRIST_BLUE
+            opponent_zobrist = ZOBRIST_BROWN
+        else:
+            friendly_locs = self.brown_pieces_locations
+            opponent_locs = self.blue_pieces_locations
+            friendly_zobrist = ZOBRIST_BROWN
+            opponent_zobrist = ZOBRIST_BLUE
+        rank = friendly_locs[origin].rank
+        new_sq = new_location[0]*24 + new_location[1]
+        key = self.hash_key
+        enemy_piece = opponent_locs.get(new_location)
+        if enemy_piece is not None:
+            key ^= opponent_zobrist[enemy_piece.rank][new_sq]
+            if ARCHER == rank: # Archers shoot without moving
+                return key
+        zobrist = friendly_zobrist[rank]
+        return key ^ zobrist[origin[0]*24 + origin[1]] ^ zobrist[new_sq]
+
+    # The turns of get_all_moves_ref (in the same order) in which at least
+    # one enemy piece is captured. Pieces whose rays hold no enemy cannot
+    # capture (enemies do not move during the turn), so while no capture has
+    # been made and none of the remaining pieces can capture, the current
+    # piece is restricted to its capture moves.
+    # @param limit  If given, only the first limit of them (generated lazily,
+    #               see iter_turns)
+    def get_capture_turns(self, color, limit=None):
+        if limit is not None:
+            return self.take_turns(self.iter_turns(color, captures=True),
+                limit)
+        pieces = self.get_pieces(color)
+        all_moves = []
+        for i in range(1, self.moves_max):
+            for pieces_combo in combinations(pieces.keys(), i):
+                self.get_capture_moves_ref(sorted(pieces_combo), self, [],
+                    all_moves, False)
+        return all_moves
+
+    # Recursive helper to get_capture_turns
+    # @param captured   Whether an earlier move of the turn captured
+    def get_capture_moves_ref(self, pieces_combo, board, moves_list,
+        all_moves, captured):
+        piece = pieces_combo[0]
+        friendly_locs, opponent_locs = board.get_locations(piece.color)
+        rest = pieces_combo[1:]
+        origin = piece.location
+        if captured or any(not board.get_ray_squares(other).isdisjoint(
+            opponent_locs) for other in rest):
+            piece_moves = board.get_piece_moves(piece)
+        else:
+            piece_moves = piece.get_capture_moves(board, friendly_locs,
+                opponent_locs)
+        # Base case:
+        if not rest:
+            for move in piece_moves:
+                moves_list.append((origin, move))
+                all_moves.append(moves_list[:])
+                moves_list.pop()
+        else: # Recursion
+            for move in piece_moves:
+                hit = captured or move in opponent_locs
+                moves_list.append((origin, move))
+                save = board.apply_move_retState(origin, move, piece.color)
+                board.get_capture_moves_ref(rest, board, moves_list,
+                    all_moves, hit)
+                board.reverse_apply_move(save, piece.color)
+                moves_list.pop()
+
+    # The turns of get_all_moves_ref (in the same order) after which color
+    # has won. Only pieces with the enemy castle interior or enemy royalty on
+    # their rays can contribute, which prunes most piece combinations and
+    # restricts the last piece able to win to those target squares.
+    def get_winning_turns(self, color):
+        pieces = self.get_pieces(color)
+        all_moves = []
+        if self.winner is not None:
+            return all_moves
+        for i in range(1, self.moves_max):
+            for pieces_combo in combinations(pieces.keys(), i):
+                self.get_winning_moves_ref(sorted(pieces_combo), self, [],
+                    all_moves)
+        return all_moves
+
+    # The squares a winning turn must land on: the enemy castle interior and
+    # the enemy royalty
+    def get_win_targets(self, color):
+        if "blue" == color:
+            interior = self.brown_castle[1]
+            opponent_locs = self.brown_pieces_locations
+        else:
+            interior = self.blue_castle[1]
+            opponent_locs = self.blue_pieces_locations
+        royalty_locs = {loc for loc, p in opponent_locs.items()
+            if p.rank in ROYALTY}
+        return interior, royalty_locs
+
+    # Whether the pieces could possibly win this turn: one of them can reach
+    # the enemy castle interior, or enough of them can reach enemy royalty to
+    # capture all of it.
+    def can_win(self, pieces_combo, interior, royalty_locs):
+        hits = 0
+        for piece in pieces_combo:
+            squares = self.get_ray_squares(piece)
+            if interior in squares:
+                return True
+            if not squares.isdisjoint(royalty_locs):
+                hits += 1
+        return hits >= len(royalty_locs)
+
+    # Recursive helper to get_winning_turns
+    def get_winning_moves_ref(self, pieces_combo, board, moves_list,
+        all_moves):
+        piece = pieces_combo[0]
+        color = piece.color
+        # Already won earlier in the turn: every continuation is winning
+        if board.winner == color:
+            board.get_moves_ref(pieces_combo, board, moves_list, all_moves)
+            return
+        interior, royalty_locs = board.get_win_targets(color)
+        if not board.can_win(pieces_combo, interior, royalty_locs):
+            return
+        friendly_locs, opponent_locs = board.get_locations(color)
+        rest = pieces_combo[1:]
+        origin = piece.location
+        piece_moves = board.get_piece_moves(piece)
+        if not rest or not board.can_win(rest, interior, royalty_locs):
+            piece_moves = [move for move in piece_moves
+                if move == interior or move in royalty_locs]
+        for move in piece_moves:
+            moves_list.append((origin, move))
+            save = board.apply_move_retState(origin, move, color)
+            if rest:
+                board.get_winning_moves_ref(rest, board, moves_list,
+                    all_moves)
+            elif board.winner == color:
+                all_moves.append(moves_list[:])
+            board.reverse_apply_move(save, color)
+            moves_list.pop()
+
+    # Lazily generate the turns of get_all_moves_ref, in the same order.
+    # While suspended the generator leaves the board part way through the
+    # turn being generated: consumers may apply and reverse moves between
+    # turns but must leave the board as they found it. Closing the generator
+    # restores the board (see take_turns).
+    # @param unique     As in get_all_moves_ref
+    # @param captures   None for every turn, True for only the turns that
+    #                   capture (pruned as in get_capture_turns), False for
+    #                   only those that do not
+    # @param seen       In unique mode, hash keys of positions already
+    #                   produced (shared between generators)
+    def iter_turns(self, color, unique=False, captures=None, seen=None):
+        if unique and seen is None:
+            seen = set()
+        pieces = self.get_pieces(color)
+        for i in range(1, self.moves_max):
+            for pieces_combo in combinations(pieces.keys(), i):
+                yield from self.iter_turns_ref(sorted(pieces_combo), [],
+                    seen if unique else None, captures, False)
+
+    # The moves of piece worth trying in a turn filtered by captures (as in
+    # iter_turns) when rest are the pieces still to move: with no capture yet
+    # and none of rest able to capture, only its capture moves
+    def get_turn_piece_moves(self, piece, rest, captures, captured):
+        friendly_locs, opponent_locs = self.get_locations(piece.color)
+        if captures and not captured and not any(
+            not self.get_ray_squares(other).isdisjoint(opponent_locs)
+            for other in rest):
+            return piece.get_capture_moves(self, friendly_locs,
+                opponent_locs)
+        if captures is False:
+            return [move for move in self.get_piece_moves(piece)
+                if move not in opponent_locs]
+        return self.get_piece_moves(piece)
+
+    # Recursive helper to iter_turns
+    # @param captured   Whether an earlier move of the turn captured
+    def iter_turns_ref(self, pieces_combo, moves_list, seen, captures,
+        captured):
+        piece = pieces_combo[0]
+        color = piece.color
+        opponent_locs = self.get_locations(color)[1]
+        rest = pieces_combo[1:]
+        origin = piece.location
+        for move in self.get_turn_piece_moves(piece, rest, captures,
+            captured):
+            hit = captured or move in opponent_locs
+            moves_list.append((origin, move))
+            if rest:
+                save = self.apply_move_retState(origin, move, color)
+                try:
+                    yield from self.iter_turns_ref(rest, moves_list, seen,
+                        captures, hit)
+                finally:
+                    self.reverse_apply_move(save, color)
+            elif captures is None or captures == hit:
+                if seen is None:
+                    yield moves_list[:]
+                else:
+                    key = self.move_hash(origin, move, color)
+                    if key not in seen:
+                        seen.add(key)
+                        yield moves_list[:]
+            moves_list.pop()
+
+    # The first limit turns of a turn generator (all of them if limit is
+    # None); the generator is then closed, restoring the board
+    def take_turns(self, turns, limit):
+        try:
+            return list(islice(turns, limit))
+        finally:
+            turns.close()
+
+    # Turns for color under a generation policy (see TURNS_ALL etc.)
+    # @param limit      The most turns to return; None for no limit, except
+    #                   with TURNS_BEST and TURNS_SAMPLE which need one
+    # @param unique     As in get_all_moves_ref
+    def get_turns(self, color, policy=TURNS_ALL, limit=None, unique=False):
+        if policy == TURNS_ALL:
+            if limit is None:
+                return self.get_all_moves_ref(color, unique=unique)
+            return self.take_turns(self.iter_turns(color, unique), limit)
+        elif policy == TURNS_CAPTURES:
+            seen = set()
+            turns = self.take_turns(self.iter_turns(color, unique, True,
+                seen), limit)
+            if limit is None or len(turns) < limit:
+                turns.extend(self.take_turns(self.iter_turns(color, unique,
+                    False, seen), None if limit is None else
+                    limit - len(turns)))
+            return turns
+        elif policy == TURNS_BEST or policy == TURNS_SAMPLE:
+            if limit is None:
+                raise RuntimeError("get_turns: " + policy + " needs a limit")
+            if policy == TURNS_BEST:
+                return self.get_best_turns(color, limit, unique)
+            return self.sample_turns(color, limit, unique)
+        raise RuntimeError("get_turns: unknown policy " + str(policy))
+
+    # Cheap score of a single move for TURNS_BEST (see CAPTURE_VALUES)
+    def score_move(self, origin, new_location, color):
+        if "blue" == color:
+            friendly_locs = self.blue_pieces_locations
+            opponent_locs = self.brown_pieces_locations
+            opponent_counts = self.brown_piece_counts
+            (green, interior) = self.brown_castle
+        else:
+            friendly_locs = self.brown_pieces_locations
+            opponent_locs = self.blue_pieces_locations
+            opponent_counts = self.blue_piece_counts
+            (green, interior) = self.blue_castle
+        if new_location == interior:
+            return WIN_SCORE
+        score = 0
+        enemy_piece = opponent_locs.get(new_location)
+        if enemy_piece is not None:
+            score += CAPTURE_VALUES[enemy_piece.rank]
+            if enemy_piece.rank in ROYALTY and (opponent_counts[KING] +
+                opponent_counts[PRINCE] + opponent_counts[DUKE]) == 1:
+                score += WIN_SCORE
+            if ARCHER == friendly_locs[origin].rank: # Does not move
+                return score
+        return score + ADVANCE_SCORE * (
+            max(abs(origin[0] - green[0]), abs(origin[1] - green[1])) -
+            max(abs(new_location[0] - green[0]),
+                abs(new_location[1] - green[1])))
+
+    # The limit turns with the highest total score_move, best first (ties
+    # keep the order found). A beam search over the pieces in move order:
+    # each round extends only the limit best partial turns by one more
+    # piece, so the cost grows linearly rather than combinatorially with
+    # the number of pieces moved per turn.
+    def get_best_turns(self, color, limit, unique=False):
+        pieces = sorted(self.get_pieces(color))
+        beam = [(0, (), -1)] # (score, moves, index of the last piece moved)
+        best = []
+        seen = set()
+        for _ in range(1, self.moves_max):
+            extended = []
+            for score, moves, last in beam:
+                saves = self.apply_moves(moves, color)
+                for i in range(last + 1, len(pieces)):
+                    origin = pieces[i].location
+                    for move in self.get_piece_moves(pieces[i]):
+                        if unique:
+                            key = self.move_hash(origin, move, color)
+                            if key in seen:
+                                continue
+                            seen.add(key)
+                        extended.append((score + self.score_move(origin,
+                            move, color), moves + ((origin, move),), i))
+                self.reverse_apply_moves(saves, color)
+            beam = heapq.nlargest(limit, extended, key=lambda x : x[0])
+            best = heapq.nlargest(limit, best + beam, key=lambda x : x[0])
+        return [list(moves) for _, moves, _ in best]
+
+    # Up to limit distinct random turns from apply_random_turn (so biased
+    # the same way), giving up after SAMPLE_ATTEMPTS draws per turn
+    def sample_turns(self, color, limit, unique=False):
+        turns = []
+        seen = set()
+        for _ in range(limit * SAMPLE_ATTEMPTS):
+            if len(turns) == limit:
+                break
+            moves, saves = self.apply_random_turn(color)
+            key = self.hash_key if unique else encode_turn(moves)
+            self.reverse_apply_moves(saves, color)
+            if moves and key not in seen:
+                seen.add(key)
+                turns.append(moves)
+        return turns
+
     # Must stitch together all possible moves of all pieces, in proper order...
     # Returning copies of itself where the game has been updated to reflect the
     # consequences of a move
@@ -729,17 +2053,24 @@ class Board():
             friendly_locs = self.blue_pieces_locations
             opponent_locs = self.brown_pieces_locations
             opponent_counts = self.brown_piece_counts
+            friendly_zobrist = ZOBRIST_BLUE
+            opponent_zobrist = ZOBRIST_BROWN
         else: # Brown
             friendly_pieces = self.brown_pieces
             opponent_pieces = self.blue_pieces
             friendly_locs = self.brown_pieces_locations
             opponent_locs = self.blue_pieces_locations
             opponent_counts = self.blue_piece_counts
+            friendly_zobrist = ZOBRIST_BROWN
+            opponent_zobrist = ZOBRIST_BLUE
+        origin_sq = origin[0]*24 + origin[1]
+        new_sq = new_location[0]*24 + new_location[1]
 
         #print(friendly_locs)
         #print(self.blue_pieces)
         #print(self.blue_pieces_locations)
         current_piece = friendly_locs[origin]
+        enemy_piece = None
         # If new_location is where an enemy is delete the opponent piece and
         # move current piece
         # Special case: archer
@@ -749,12 +2080,13 @@ class Board():
 
             # Delete opponent
             enemy_piece = opponent_locs[new_location]
-            opponent_counts[str(enemy_piece)] -= 1 # Decrement count
+            opponent_counts[enemy_piece.rank] -= 1 # Decrement count
             del opponent_locs[new_location] # Remove from locations -> pieces
             del opponent_pieces[enemy_piece] # Remove from pieces -> locations
+            self.hash_key ^= opponent_zobrist[enemy_piece.rank][new_sq]
 
             # Move current piece (if not an archer)
-            if "archer" != str(current_piece):
+            if ARCHER != current_piece.rank:
                 del friendly_locs[origin] # Remove from locations -> pieces
                 # Reinsert with correct location
                 friendly_locs[new_location] = current_piece
@@ -762,6 +2094,8 @@ class Board():
                 friendly_pieces[current_piece] = new_location
                 # Update the piece itself
                 current_piece.location = new_location
+                zobrist = friendly_zobrist[current_piece.rank]
+                self.hash_key ^= zobrist[origin_sq] ^ zobrist[new_sq]
 
             # self.display()
             # print("ATTACKED ABOVE")
@@ -775,43 +2109,48 @@ class Board():
             friendly_pieces[current_piece] = new_location
             # Update the piece itself
             current_piece.location = new_location
-
+            zobrist = friendly_zobrist[current_piece.rank]
+            self.hash_key ^= zobrist[origin_sq] ^ zobrist[new_sq]
+
+        self.update_winner(color, new_location, enemy_piece)
+        if self.attack_maps is not None:
+            if enemy_piece is not None:
+                del self.attack_masks[enemy_piece]
+            self.update_attack_maps(origin, new_location, (current_piece,))
+        # Not reversible, so older undo entries no longer describe this board
+        self.invalidate_moves(origin, new_location, current_piece, enemy_piece)
+        del self.move_cache_undo[:]
+        del self.move_cache_log[:]
         return True
 
+    # The Zobrist hash of the current piece placement (maintained
+    # incrementally, see ZOBRIST_KEYS)
     def get_hash_key(self):
-        blue_locs = {}
-        for piece in self.blue_pieces:
-            blue_locs[str(piece)] = str(piece.location)
-        brown_locs = {}
-        for piece in self.brown_pieces:
-            brown_locs[str(piece)] = str(piece.location)
-        
-        for key in self.blue_piece_counts:
-            if key == "castle_green" or key == "castle_interior":
-                continue
-            if key not in blue_locs:
-                blue_locs[key] = str((-1,-1))
-            if key not in brown_locs:
-                brown_locs[key] = str((-1,-1))
-        
-        return json.dumps(blue_locs, sort_keys=True) + json.dumps(brown_locs, sort_keys=True)
+        return self.hash_key
 
     # Apply move and return pre-move state.
     def apply_move_retState(self, origin, new_location, color):
         archer_attack = False
         enemy_piece = None
+        winner = self.winner
         if "blue" == color:
             friendly_pieces = self.blue_pieces
             opponent_pieces = self.brown_pieces
             friendly_locs = self.blue_pieces_locations
             opponent_locs = self.brown_pieces_locations
             opponent_counts = self.brown_piece_counts
+            friendly_zobrist = ZOBRIST_BLUE
+            opponent_zobrist = ZOBRIST_BROWN
         else: # Brown
             friendly_pieces = self.brown_pieces
             opponent_pieces = self.blue_pieces
             friendly_locs = self.brown_pieces_locations
             opponent_locs = self.blue_pieces_locations
             opponent_counts = self.blue_piece_counts
+            friendly_zobrist = ZOBRIST_BROWN
+            opponent_zobrist = ZOBRIST_BLUE
+        origin_sq = origin[0]*24 + origin[1]
+        new_sq = new_location[0]*24 + new_location[1]
 
         current_piece = friendly_locs[origin]
         # If new_location is where an enemy is delete the opponent piece and
@@ -820,14 +2159,15 @@ class Board():
         if new_location in opponent_locs:
             # Delete opponent
             enemy_piece = opponent_locs[new_location]
-            opponent_counts[str(enemy_piece)] -= 1 # Decrement count
+            opponent_counts[enemy_piece.rank] -= 1 # Decrement count
             del opponent_locs[new_location] # Remove from locations -> pieces
             del opponent_pieces[enemy_piece] # Remove from pieces -> locations
+            self.hash_key ^= opponent_zobrist[enemy_piece.rank][new_sq]
 
             archer_attack = True
 
             # Move current piece (if not an archer)
-            if "archer" != str(current_piece):
+            if ARCHER != current_piece.rank:
                 del friendly_locs[origin] # Remove from locations -> pieces
                 # Reinsert with correct location
                 friendly_locs[new_location] = current_piece
@@ -835,6 +2175,8 @@ class Board():
                 friendly_pieces[current_piece] = new_location
                 # Update the piece itself
                 current_piece.location = new_location
+                zobrist = friendly_zobrist[current_piece.rank]
+                self.hash_key ^= zobrist[origin_sq] ^ zobrist[new_sq]
                 archer_attack = False
         # Otherwise just moving to a new spot
         else:
@@ -845,25 +2187,46 @@ class Board():
             friendly_pieces[current_piece] = new_location
             # Update the piece itself
             current_piece.location = new_location
-        # Return move coordinates and attacked piece, if any.
-        return (origin,new_location,enemy_piece,archer_attack)
+            zobrist = friendly_zobrist[current_piece.rank]
+            self.hash_key ^= zobrist[origin_sq] ^ zobrist[new_sq]
+        self.update_winner(color, new_location, enemy_piece)
+        if self.attack_maps is not None:
+            if enemy_piece is not None:
+                del self.attack_masks[enemy_piece]
+            self.update_attack_maps(origin, new_location, (current_piece,))
+        undo = self.move_cache_undo
+        if len(undo) == MOVE_CACHE_DEPTH:
+            # Moves this old are rarely reversed; reversing them without
+            # their undo entry is still correct (see reverse_apply_move)
+            del undo[:]
+            del self.move_cache_log[:]
+        undo.append((len(self.move_cache_log), self.invalidate_moves(origin,
+            new_location, current_piece, enemy_piece)))
+        # Return move coordinates, attacked piece (if any) and prior winner.
+        return (origin,new_location,enemy_piece,archer_attack,winner)
 
     # Given predecessor save state, reverse apply the move for the 
     # board.
     def reverse_apply_move(self, save, color):
-        (origin, dest, piece, archer_attack) = save
+        (origin, dest, piece, archer_attack, self.winner) = save
         if "blue" == color:
             friendly_pieces = self.blue_pieces
             opponent_pieces = self.brown_pieces
             friendly_locs = self.blue_pieces_locations
             opponent_locs = self.brown_pieces_locations
             opponent_counts = self.brown_piece_counts
+            friendly_zobrist = ZOBRIST_BLUE
+            opponent_zobrist = ZOBRIST_BROWN
         else: # Brown
             friendly_pieces = self.brown_pieces
             opponent_pieces = self.blue_pieces
             friendly_locs = self.brown_pieces_locations
             opponent_locs = self.blue_pieces_locations
             opponent_counts = self.blue_piece_counts
+            friendly_zobrist = ZOBRIST_BROWN
+            opponent_zobrist = ZOBRIST_BLUE
+        origin_sq = origin[0]*24 + origin[1]
+        dest_sq = dest[0]*24 + dest[1]
 
         # If we deleted an enemy.
         if piece is not None:
@@ -881,8 +2244,11 @@ class Board():
                 move_back.location = origin
                 opponent_locs[dest] = piece
                 opponent_pieces[piece] = dest
+                zobrist = friendly_zobrist[move_back.rank]
+                self.hash_key ^= zobrist[origin_sq] ^ zobrist[dest_sq]
             # Increase piece count
-            opponent_counts[str(piece)] += 1
+            opponent_counts[piece.rank] += 1
+            self.hash_key ^= opponent_zobrist[piece.rank][dest_sq]
 
         # If we just moved a piece
         else:
@@ -891,10 +2257,31 @@ class Board():
             friendly_pieces[move_back] = origin
             move_back.location = origin
             del friendly_locs[dest]
+            zobrist = friendly_zobrist[move_back.rank]
+            self.hash_key ^= zobrist[origin_sq] ^ zobrist[dest_sq]
+
+        if self.attack_maps is not None:
+            self.update_attack_maps(origin, dest,
+                (friendly_locs[origin], piece))
+        # Drop the entries computed after the move, then restore those it
+        # dropped
+        if self.move_cache_undo:
+            (log_length, dropped) = self.move_cache_undo.pop()
+            cache = self.move_cache
+            log = self.move_cache_log
+            for i in range(log_length, len(log)):
+                cache.pop(log[i], None)
+            del log[log_length:]
+            cache.update(dropped)
+        else:
+            self.invalidate_moves(origin, dest, friendly_locs[origin], piece)
 
     # Apply sequence of moves to board (using apply_move_retState) 
     # and return the save sequence. 
+    # @param moves  A list of (origin, new location) tuples or an encoded turn
     def apply_moves(self, moves, color):
+        if type(moves) == int:
+            moves = decode_turn(moves)
         saves = []
         # Apply moves to board.
         for move in moves:
@@ -906,23 +2293,56 @@ class Board():
         for i in range(len(saves)-1, -1, -1):
             self.reverse_apply_move(saves[i], color)
 
+# Most move cache undo entries kept (see Board.move_cache_undo), which bounds
+# its memory over long sequences of moves that are never reversed
+MOVE_CACHE_DEPTH = 64
+
+# Scratch lists for Piece.get_num_moves and Board.get_attack_mask, so
+# counting and attack masks allocate nothing
+_COUNT_BUFFER = []
+_ATTACK_BUFFER = []
+
+# Pieces are kept small as boards are cloned and played out thousands of times
+# per decision: only the color, location and unit number live on each
+# instance, while the display name, rank (which is also the integer type
+# code) and movement spec are class-level attributes.
 class Piece():
-    def __init__(self, name, number, color, location, rank, directions):
-        if color == "blue":
-            self.rep = "\x1b[94m" + name + str(number)
-        else:
-            self.rep = "\x1b[33m" + name + str(number)
-        self.name = name
+    __slots__ = ("color", "location", "number")
+    name = None
+    type_name = None
+    rank = None
+    movement = None # (direction, max steps) pairs, see MOVEMENT
+
+    # @param number     The unit number among pieces of the same type, or 0
+    #                   for unique pieces
+    def __init__(self, number, color, location):
         self.number = number
         self.color = color
         self.location = location
-        self.rank = rank
-        # Default directions (only Squire overrides these).
-        if directions == None:
-            self.directions = [(-1,0),(-1,1),(0,1),(1,1),
-                               (1,0),(1,-1),(0,-1),(-1,-1)]
-        else:
-            self.directions = directions
+
+    # ANSI colored two-character indicator used for display
+    @property
+    def rep(self):
+        prefix = "\x1b[94m" if self.color == "blue" else "\x1b[33m"
+        return prefix + self.name + (str(self.number) if self.number else "")
+
+    def clone(self):
+        new_piece = object.__new__(self.__class__)
+        new_piece.number = self.number
+        new_piece.color = self.color
+        new_piece.location = self.location
+        return new_piece
+
+    # Unpickling: state is (None, slot values), or for pieces pickled before
+    # __slots__ (inside old Boards) their attribute dict, where unique pieces
+    # have the unit number ""
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            state = state[1]
+        self.number = state["number"] or 0
+        self.color = state["color"]
+        self.location = state["location"]
+
     # Define less than or equal functionality so that Piece instances can be
     # sorted using Python's sorted() function; this enables us to adhere to the
     # rank (King down to Archer), left-to-right (primary method of
@@ -942,521 +2362,175 @@ class Piece():
             return False
 
     def __str__(self):
-        return self.rep
+        return self.type_name
 
+    # A uniformly random move for the piece (None if it cannot move), from a
+    # single pass of move generation
     def get_random_piece_move(self, board, friendly_locs, opponent_locs):
-            num_available_moves = self.get_num_moves(
-                board, friendly_locs, opponent_locs)
-            if 0 == num_available_moves:
-                return None
-            chosen_move_num = random.randrange(1, num_available_moves + 1)
-
-            # Retrieve the move generator and iterate until the move
-            # corresponding to that move has been retrieved
-            # NOTE: I (Dan) tried making a seek_to_move function which
-            # basically just returns the chosen move, but it didn't appear to
-            # be any faster than just reusing the generator approach
-            generator = self.get_moves(board,
-                friendly_locs, opponent_locs)
-            for _ in range(chosen_move_num):
-                piece_move = next(generator)
-
-            return piece_move
-
-    # Basically a copy of get_moves, but instead of yielding moves, just count
-    # the number of options - should be faster than using yield logic
-    # @return   The actual number of moves (i.e. not 0 indexed)
-    def get_num_moves(self, board, friendly_locs, opponent_locs):
-        count = 0
-        on_green = (self.location == board.blue_castle[0]   or
-                    self.location == board.brown_castle[0])
-
-        for direction in self.directions:
-            past_green = False
-            for multiplier in range(1,self.multipliers+1):
-                # IF SERGEANT AND MULTIPLIER > 1, stop searching
-                # horizontally and vertically.
-                if self.rank == 5:
-                    if (direction in [(-1,0),(0,1),(1,0),(0,-1)] and
-                        multiplier > 1):
+        piece_moves = self.get_moves_list(board, friendly_locs, opponent_locs)
+        if not piece_moves:
+            return None
+        return piece_moves[random.randrange(len(piece_moves))]
+
+    # The single move generation kernel: walks the terrain-aware rays
+    # precomputed by Board.get_rays (so only piece occupancy is checked here)
+    # and appends the destinations to out, in the usual move order.
+    # @param out    A list to append to; callers may reuse one buffer
+    # @param mode   GEN_MOVES, GEN_AVENGE (also return the first friendly
+    #               square of each ray, i.e. squares this piece could avenge)
+    #               or GEN_CAPTURES (only squares holding an opponent)
+    # @return   The number of destinations appended
+    def moves_into(self, board, friendly_locs, opponent_locs, out,
+        mode=GEN_MOVES):
+        append = out.append
+        start = len(out)
+        for locs, kinds in board.get_rays(self):
+            if kinds is None:
+                if mode == GEN_MOVES:
+                    for new_loc in locs:
+                        if new_loc in friendly_locs:
+                            break
+                        append(new_loc)
+                        if new_loc in opponent_locs:
+                            break
+                elif mode == GEN_AVENGE:
+                    for new_loc in locs:
+                        append(new_loc)
+                        if (new_loc in friendly_locs or
+                            new_loc in opponent_locs):
+                            break
+                else: # GEN_CAPTURES
+                    for new_loc in locs:
+                        if new_loc in friendly_locs:
+                            break
+                        if new_loc in opponent_locs:
+                            append(new_loc)
+                            break
+            else: # Archer shooting over a castle green, or castle interior
+                for new_loc, kind in zip(locs, kinds):
+                    if kind == RAY_AVENGE:
+                        if mode == GEN_AVENGE and new_loc in friendly_locs:
+                            append(new_loc)
                         break
-                # IF PIKEMAN AND MULTIPLIER > 1, stop searching diagonally.
-                if self.rank == 6:
-                    if (direction in [(-1,-1),(1,-1),(1,1),(-1,1)] and
-                        multiplier > 1):
+                    if new_loc in friendly_locs:
+                        if mode == GEN_AVENGE:
+                            append(new_loc)
                         break
-                new_loc = ( self.location[0] + direction[0]*multiplier,
-                            self.location[1] + direction[1]*multiplier)
-                # Check if location is in bounds.
-                if (new_loc[0] < 0  or
-                    new_loc[0] > 23 or
-                    new_loc[1] < 0  or
-                    new_loc[1] > 23):
-                    break
-
-                # Check if squire is jumping over a castle.
-                if self.rank == 7:
-                    (i,j) = self.location
-                    if (j-new_loc[1]) in [-1,1]:
-                        if i-new_loc[0] > 0:
-                            (x,y) = (-1,0)
-                        else:
-                            (x,y) = (1,0)
-                    else:
-                        if j-new_loc[1] > 0:
-                            (x,y) = (0,-1)
-                        else:
-                            (x,y) = (0,1)
-                    if ((x+i,y+j) in [board.blue_castle[1],
-                                      board.brown_castle[1]]):
+                    if new_loc in opponent_locs:
+                        append(new_loc)
+                        if kind == RAY_PASS:
+                            continue
                         break
-
-                # Check if a mounted unit is encountering rough terrain.
-                if self.rank in [2,3,4] and new_loc in board.rough:
-                    break
-
-
-                # Check if a mountain has been hit or a friendly piece
-                if (new_loc in board.mountains or
-                    new_loc in friendly_locs.keys()):
-                    break
-
-                # Entering castle green
-                if (new_loc in [board.blue_castle[0], board.brown_castle[0]]):
-                    count += 1 # yield new_loc
-                    # Archer can shoot past the green, so continue on if
-                    # archer:
-                    if self.rank == 8:
-                        past_green = True
+                    if mode == GEN_CAPTURES:
                         continue
-                    break
-
-                # Archers can not enter castle interior.
-                if (self.rank == 8  and
-                    on_green        and
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    break
-
-                # Attempting to enter castle interior
-                if  (on_green and
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    count += 1 # yield new_loc
-                    break
-
-                # Attempting to enter castle illegaly.
-                elif (not on_green and
-                      new_loc in [board.blue_castle[1],board.brown_castle[1]]):
-                    break
-
-                # Check if an opponent has been hit
-                if new_loc in opponent_locs.keys():
-                    count += 1 # yield new_loc
-                    break
-
-                # Archer is past green, traversing empty cell.
-                if past_green:
-                    continue
-
-                count += 1 # yield new_loc
+                    if kind != RAY_CAPTURE:
+                        append(new_loc)
+        return len(out) - start
 
+    # Count the number of moves available to the piece
+    # @return   The actual number of moves (i.e. not 0 indexed)
+    def get_num_moves(self, board, friendly_locs, opponent_locs):
+        count = self.moves_into(board, friendly_locs, opponent_locs,
+            _COUNT_BUFFER)
+        del _COUNT_BUFFER[:]
         return count
 
     def get_moves(self, board, friendly_locs, opponent_locs):
-        return self.get_moves_sub(board, friendly_locs, opponent_locs)
-
-    # TODO: Fix Mounted Piece to not go over mountains/rough terrain
-    # TODO: ANY CHANGE APPLIED HERE SHOULD BE EQUALLY APPLIED TO GET_NUM_MOVES
-    #       TO ENSURE CORRECT NUMBER OF MOVES RETURNED
-    def get_moves_sub(self, board, friendly_locs, opponent_locs):
-        on_green = (self.location == board.blue_castle[0]   or 
-                    self.location == board.brown_castle[0])
-        
-        for direction in self.directions:
-            past_green = False
-            for multiplier in range(1,self.multipliers+1):
-                # IF SERGEANT AND MULTIPLIER > 1, stop searching 
-                # horizontally and vertically.
-                if self.rank == 5:
-                    if (direction in [(-1,0),(0,1),(1,0),(0,-1)] and 
-                        multiplier > 1):
-                        break
-                # IF PIKEMAN AND MULTIPLIER > 1, stop searching diagonally.
-                if self.rank == 6:
-                    if (direction in [(-1,-1),(1,-1),(1,1),(-1,1)] and 
-                        multiplier > 1):
-                        break
-                new_loc = ( self.location[0] + direction[0]*multiplier,
-                            self.location[1] + direction[1]*multiplier)
-                # Check if location is in bounds.
-                if (new_loc[0] < 0  or
-                    new_loc[0] > 23 or 
-                    new_loc[1] < 0  or
-                    new_loc[1] > 23):
-                    break
-
-                # Check if squire is jumping over a castle.
-                if self.rank == 7:
-                    (i,j) = self.location
-                    if (j-new_loc[1]) in [-1,1]: 
-                        if i-new_loc[0] > 0:
-                            (x,y) = (-1,0)
-                        else:
-                            (x,y) = (1,0)
-                    else:
-                        if j-new_loc[1] > 0:
-                            (x,y) = (0,-1)
-                        else:
-                            (x,y) = (0,1)
-                    if ((x+i,y+j) in [board.blue_castle[1],
-                                      board.brown_castle[1]]):
-                        break
-
-                # Check if a mounted unit is encountering rough terrain.
-                if self.rank in [2,3,4] and new_loc in board.rough:
-                    break
-
-
-                # Check if a mountain has been hit or a friendly piece
-                if (new_loc in board.mountains or 
-                    new_loc in friendly_locs.keys()):
-                    break
-                
-                # Entering castle green
-                if (new_loc in [board.blue_castle[0], board.brown_castle[0]]):
-                    yield new_loc
-                    # Archer can shoot past the green, so continue on if 
-                    # archer:
-                    if self.rank == 8:
-                        past_green = True
-                        continue
-                    break
+        yield from self.get_moves_list(board, friendly_locs, opponent_locs)
 
-                # Archers can not enter castle interior.
-                if (self.rank == 8  and
-                    on_green        and
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    break
-
-                # Attempting to enter castle interior
-                if  (on_green and 
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    yield new_loc
-                    break
-
-                # Attempting to enter castle illegaly.
-                elif (not on_green and 
-                      new_loc in [board.blue_castle[1],board.brown_castle[1]]):
-                    break
-
-                # Check if an opponent has been hit
-                if new_loc in opponent_locs.keys():
-                    yield new_loc
-                    break
-                
-                # Archer is past green, traversing empty cell.
-                if past_green:
-                    continue
-
-                yield new_loc
-
-    # A copy of get_moves except that it calls get_moves_sub_w_avg
+    # As get_moves, but also yields "avenging" moves - i.e. locations of
+    # friendly pieces - instead of just stopping upon finding a friendly.
     def get_moves_w_avg(self, board, friendly_locs, opponent_locs):
-        return self.get_moves_sub_w_avg(board, friendly_locs, opponent_locs)
-
-    # TODO: Fix Mounted Piece to not go over mountains/rough terrain
-    # A copy of get_moves_sub except that this also returns "avenging" moves
-    # - i.e. locations of friendly pieces - instead of just breaking upon
-    # finding a friendly.
-    def get_moves_sub_w_avg(self, board, friendly_locs, opponent_locs):
-        on_green = (self.location == board.blue_castle[0]   or
-                    self.location == board.brown_castle[0])
-
-        for direction in self.directions:
-            past_green = False
-            for multiplier in range(1,self.multipliers+1):
-                # IF SERGEANT AND MULTIPLIER > 1, stop searching
-                # horizontally and vertically.
-                if self.rank == 5:
-                    if (direction in [(-1,0),(0,1),(1,0),(0,-1)] and
-                        multiplier > 1):
-                        break
-                # IF PIKEMAN AND MULTIPLIER > 1, stop searching diagonally.
-                if self.rank == 6:
-                    if (direction in [(-1,-1),(1,-1),(1,1),(-1,1)] and
-                        multiplier > 1):
-                        break
-                new_loc = ( self.location[0] + direction[0]*multiplier,
-                            self.location[1] + direction[1]*multiplier)
-                # Check if location is in bounds.
-                if (new_loc[0] < 0  or
-                    new_loc[0] > 23 or
-                    new_loc[1] < 0  or
-                    new_loc[1] > 23):
-                    break
-
-                # Check if squire is jumping over a castle.
-                if self.rank == 7:
-                    (i,j) = self.location
-                    if (j-new_loc[1]) in [-1,1]:
-                        if i-new_loc[0] > 0:
-                            (x,y) = (-1,0)
-                        else:
-                            (x,y) = (1,0)
-                    else:
-                        if j-new_loc[1] > 0:
-                            (x,y) = (0,-1)
-                        else:
-                            (x,y) = (0,1)
-                    if ((x+i,y+j) in [board.blue_castle[1],
-                                      board.brown_castle[1]]):
-                        break
-
-                # Check if a mounted unit is encountering rough terrain.
-                if self.rank in [2,3,4] and new_loc in board.rough:
-                    break
-
-
-                # Check if a mountain has been hit or a friendly piece
-                if new_loc in board.mountains:
-                    break
-
-                # RETURN THE AVENGING MOVE, THEN BREAK
-                if new_loc in friendly_locs.keys():
-                    yield new_loc
-                    break
-
-                # Entering castle green
-                if (new_loc in [board.blue_castle[0], board.brown_castle[0]]):
-                    yield new_loc
-                    # Archer can shoot past the green, so continue on if
-                    # archer:
-                    if self.rank == 8:
-                        past_green = True
-                        continue
-                    break
-
-                # Archers can not enter castle interior.
-                if (self.rank == 8  and
-                    on_green        and
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    break
+        out = []
+        self.moves_into(board, friendly_locs, opponent_locs, out, GEN_AVENGE)
+        yield from out
 
-                # Attempting to enter castle interior
-                if  (on_green and
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    yield new_loc
-                    break
-
-                # Attempting to enter castle illegaly.
-                elif (not on_green and
-                      new_loc in [board.blue_castle[1],board.brown_castle[1]]):
-                    break
-
-                # Check if an opponent has been hit
-                if new_loc in opponent_locs.keys():
-                    yield new_loc
-                    break
-
-                # Archer is past green, traversing empty cell.
-                if past_green:
-                    continue
-
-                yield new_loc
-
-    # TODO: Fix Mounted Piece to not go over mountains/rough terrain
-    # TODO: ANY CHANGE APPLIED HERE SHOULD BE EQUALLY APPLIED TO GET_NUM_MOVES
-    #       TO ENSURE CORRECT NUMBER OF MOVES RETURNED
-    #   get moves but return a list instead of generating.
+    # get moves but return a list instead of generating.
     def get_moves_list(self, board, friendly_locs, opponent_locs):
-        
-        res = []
-        
-        on_green = (self.location == board.blue_castle[0]   or 
-                    self.location == board.brown_castle[0])
-        
-        for direction in self.directions:
-            past_green = False
-            for multiplier in range(1,self.multipliers+1):
-                # IF SERGEANT AND MULTIPLIER > 1, stop searching 
-                # horizontally and vertically.
-                if self.rank == 5:
-                    if (direction in [(-1,0),(0,1),(1,0),(0,-1)] and 
-                        multiplier > 1):
-                        break
-                # IF PIKEMAN AND MULTIPLIER > 1, stop searching diagonally.
-                if self.rank == 6:
-                    if (direction in [(-1,-1),(1,-1),(1,1),(-1,1)] and 
-                        multiplier > 1):
-                        break
-                new_loc = ( self.location[0] + direction[0]*multiplier,
-                            self.location[1] + direction[1]*multiplier)
-                # Check if location is in bounds.
-                if (new_loc[0] < 0  or
-                    new_loc[0] > 23 or 
-                    new_loc[1] < 0  or
-                    new_loc[1] > 23):
-                    break
-
-                # Check if squire is jumping over a castle.
-                if self.rank == 7:
-                    (i,j) = self.location
-                    if (j-new_loc[1]) in [-1,1]: 
-                        if i-new_loc[0] > 0:
-                            (x,y) = (-1,0)
-                        else:
-                            (x,y) = (1,0)
-                    else:
-                        if j-new_loc[1] > 0:
-                            (x,y) = (0,-1)
-                        else:
-                            (x,y) = (0,1)
-                    if ((x+i,y+j) in [board.blue_castle[1],
-                                      board.brown_castle[1]]):
-                        break
-
-                # Check if a mounted unit is encountering rough terrain.
-                if self.rank in [2,3,4] and new_loc in board.rough:
-                    break
-
-
-                # Check if a mountain has been hit or a friendly piece
-                if (new_loc in board.mountains or 
-                    new_loc in friendly_locs.keys()):
-                    break
-                
-                # Entering castle green
-                if (new_loc in [board.blue_castle[0], board.brown_castle[0]]):
-                    res.append(new_loc)
-                    # Archer can shoot past the green, so continue on if 
-                    # archer:
-                    if self.rank == 8:
-                        past_green = True
-                        continue
-                    break
-
-                # Archers can not enter castle interior.
-                if (self.rank == 8  and
-                    on_green        and
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    break
-
-                # Attempting to enter castle interior
-                if  (on_green and 
-                    new_loc in [board.blue_castle[1], board.brown_castle[1]]):
-                    res.append(new_loc)
-                    break
-
-                # Attempting to enter castle illegaly.
-                elif (not on_green and 
-                      new_loc in [board.blue_castle[1],board.brown_castle[1]]):
-                    break
-
-                # Check if an opponent has been hit
-                if new_loc in opponent_locs.keys():
-                    res.append(new_loc)
-                    break
-                
-                # Archer is past green, traversing empty cell.
-                if past_green:
-                    continue
+        out = []
+        self.moves_into(board, friendly_locs, opponent_locs, out)
+        return out
 
-                res.append(new_loc)
-        return res
+    # Only the moves that capture an opponent piece, as a list
+    def get_capture_moves(self, board, friendly_locs, opponent_locs):
+        out = []
+        self.moves_into(board, friendly_locs, opponent_locs, out,
+            GEN_CAPTURES)
+        return out
 
 class King(Piece):
-    def __init__(self, color, location):
-        self.multipliers = 2
-        super().__init__("KG", "", color, location, 1, None)
-
-    def __str__(self):
-        return "king"
-
-    def clone(self):
-        return King(self.color, self.location)
+    __slots__ = ()
+    name = "KG"
+    type_name = "king"
+    rank = KING
+    movement = MOVEMENT[KING]
 
-class Prince(Piece):
     def __init__(self, color, location):
-        self.multipliers = 54
-        super().__init__("PR", "", color, location, 2, None)
-
-    def __str__(self):
-        return "prince"
+        super().__init__(0, color, location)
 
-    def clone(self):
-        return Prince(self.color, self.location)
+class Prince(Piece):
+    __slots__ = ()
+    name = "PR"
+    type_name = "prince"
+    rank = PRINCE
+    movement = MOVEMENT[PRINCE]
 
-class Duke(Piece):
     def __init__(self, color, location):
-        self.multipliers = 54
-        super().__init__("DK", "", color, location, 3, None)
+        super().__init__(0, color, location)
 
-    def __str__(self):
-        return "duke"
+class Duke(Piece):
+    __slots__ = ()
+    name = "DK"
+    type_name = "duke"
+    rank = DUKE
+    movement = MOVEMENT[DUKE]
 
-    def clone(self):
-        return Duke(self.color, self.location)
+    def __init__(self, color, location):
+        super().__init__(0, color, location)
 
 class Knight(Piece):
-    def __init__(self, number, color, location):
-        self.multipliers = 54
-        super().__init__("K", number, color, location, 4, None)
-
-    def __str__(self):
-        return "knight"
-
-    def clone(self):
-        return Knight(self.number, self.color, self.location)
+    __slots__ = ()
+    name = "K"
+    type_name = "knight"
+    rank = KNIGHT
+    movement = MOVEMENT[KNIGHT]
 
 class Sergeant(Piece):
-    def __init__(self, number, color, location):
-        self.number = number
-        self.multipliers = 12
-        super().__init__("S", number, color, location, 5, None)
-
-    def __str__(self):
-        return "sergeant"
-
-    def clone(self):
-        return Sergeant(self.number, self.color, self.location)
+    __slots__ = ()
+    name = "S"
+    type_name = "sergeant"
+    rank = SERGEANT
+    movement = MOVEMENT[SERGEANT]
 
 class Pikemen(Piece):
-    def __init__(self, number, color, location):
-        self.number = number
-        self.multipliers = 12
-        super().__init__("P", number, color, location, 6, None)
-
-    def __str__(self):
-        return "pikemen"
-
-    def clone(self):
-        return Pikemen(self.number, self.color, self.location)
+    __slots__ = ()
+    name = "P"
+    type_name = "pikemen"
+    rank = PIKEMEN
+    movement = MOVEMENT[PIKEMEN]
 
 class Squire(Piece):
-    def __init__(self, color, location):
-        self.multipliers = 1
-        self.directions = [(-1,-2),(-2,-1), (-2,1), (-1,2),
-                            (1,2), (2,1), (2,-1), (1,-2)]
-        super().__init__("SQ", "", color, location, 7, self.directions)
-
-    def __str__(self):
-        return "squire"
-
-    def clone(self):
-        return Squire(self.color, self.location)
+    __slots__ = ()
+    name = "SQ"
+    type_name = "squire"
+    rank = SQUIRE
+    movement = MOVEMENT[SQUIRE]
 
-class Archer(Piece):
     def __init__(self, color, location):
-        self.multipliers = 3
-        super().__init__("AR", "", color, location, 8, None)
-
-    def __str__(self):
-        return "archer"
-
-    def clone(self):
-        return Archer(self.color, self.location)
-
-
+        super().__init__(0, color, location)
 
+class Archer(Piece):
+    __slots__ = ()
+    name = "AR"
+    type_name = "archer"
+    rank = ARCHER
+    movement = MOVEMENT[ARCHER]
 
+    def __init__(self, color, location):
+        super().__init__(0, color, location)
 
+# Piece class of each rank (see Board.set_squares)
+PIECE_CLASSES = (None, King, Prince, Duke, Knight, Sergeant, Pikemen, Squire,
+    Archer)
 
+EMPTY_INDEX = TerrainIndex(frozenset(), frozenset())
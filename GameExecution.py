@@ -1,15 +1,17 @@
 # Functions for running the game
 
 from time import time
+from Board import KING, PRINCE, DUKE, KNIGHT, SERGEANT, PIKEMEN, SQUIRE, \
+    ARCHER
 
-# @param    d   a dictionary in the counts format from Board
+# @param    d   a list in the counts format from Board (indexed by type code)
 def print_piece_counts(d):
     royalty_line = "ROYALTY King    %d Prince    %d Duke    %d"
     other_line =   "OTHER   Knights %d Sergeants %d Pikemen %d " + \
         "Squire %d Archer %d"
-    print(royalty_line % (d["king"], d["prince"], d["duke"]))
-    print(other_line % (d["knight"], d["sergeant"], d["pikemen"], d["squire"],
-        d["archer"]))
+    print(royalty_line % (d[KING], d[PRINCE], d[DUKE]))
+    print(other_line % (d[KNIGHT], d[SERGEANT], d[PIKEMEN], d[SQUIRE],
+        d[ARCHER]))
 
 # Basic execution of the game in verbose fashion - showing whose turn it is and
 # displaying the board
@@ -1,6 +1,8 @@
 # Heuristics to be used by Minimax or MCTS
 
 import math
+from Board import KING, PRINCE, DUKE, KNIGHT, SERGEANT, PIKEMEN, SQUIRE, \
+    ARCHER
 
 # Returns a normalized count of the royalty remaining for the player designated
 # by color
@@ -11,8 +13,8 @@ def royalty_remaining(board, color, king_weight=1, prince_weight=2,
     else:
         counts = board.brown_piece_counts
 
-    return ((king_weight * counts["king"] + prince_weight * counts["prince"] \
-        + duke_weight * counts["duke"]) / \
+    return ((king_weight * counts[KING] + prince_weight * counts[PRINCE] \
+        + duke_weight * counts[DUKE]) / \
         (3.0 * (king_weight + prince_weight + duke_weight)))
 
 # Returns a normalized count of the other pieces remaining for the player
@@ -24,11 +26,11 @@ def other_remaining(board, color, knight_weight=2, sergeant_weight=1,
     else:
         counts = board.brown_piece_counts
 
-    return (knight_weight * counts["knight"] + \
-        sergeant_weight * counts["sergeant"] + \
-        pikemen_weight * counts["pikemen"] + \
-        squire_weight * counts["squire"] + \
-        archer_weight * counts["archer"]) / \
+    return (knight_weight * counts[KNIGHT] + \
+        sergeant_weight * counts[SERGEANT] + \
+        pikemen_weight * counts[PIKEMEN] + \
+        squire_weight * counts[SQUIRE] + \
+        archer_weight * counts[ARCHER]) / \
         (10.0 * (knight_weight + sergeant_weight + pikemen_weight + \
             squire_weight + archer_weight))
 
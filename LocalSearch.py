@@ -270,22 +270,20 @@ class LocalSearch():
     def ways_onto_castle_green(self, config):
         green_loc = config["castle_green"]
         count = 7 # Max possible is 7
-        adjacents = [(-1,0),(-1,1),(0,1),(1,1), (1,0),(1,-1),(0,-1),(-1,-1)]
-
-        # For every square around the green...
-        for adj in adjacents:
-            adj_loc = (green_loc[0] + adj[0], green_loc[1] + adj[1])
 
+        # For every square around the green (see TerrainIndex)...
+        for adj_loc, kind in self.board.terrain.get_neighbours(green_loc):
             # Ignore castle interior
             if (adj_loc == config["castle_interior"]):
                 continue
 
             # If out of bounds or adjacent is a mountain, subtract 1
-            if not self.in_bounds(*adj_loc) or adj_loc in self.board.mountains:
+            if adj_loc is None or not self.in_bounds(*adj_loc) or \
+                kind == MOUNTAIN:
                 count -= 1
 
             # If rough terrain is adjacent, count it as "half" blocked
-            if adj_loc in self.board.rough:
+            if kind == ROUGH:
                 count -= 0.5
 
         # Normalizes the count to a value between 0 and 1, and returns 1 minus
@@ -308,16 +306,14 @@ class LocalSearch():
             f = {1:k, 0:1, -1:1}
         else:
             f = {-1:k, 0:1, 1:1}
-        ds = [(-1,-1),(-1,0),(-1,1),(0,1),
-              (1,1),(1,0),(1,-1),(0,-1)]
 
         maximum = 3.0*k + 4.0
         res = 0.0
-        for (i,j) in ds:
-            (x,y) = (i+king_loc[0],j+king_loc[1])
-            if (x,y) in self.board.mountains:
+        for (i,j), (_, kind) in zip(DIRECTIONS,
+            self.board.terrain.get_neighbours(king_loc)):
+            if kind == MOUNTAIN:
                 res += f[i]
-            elif (x,y) in self.board.rough:
+            elif kind == ROUGH:
                 res += f[i]/2.0
 
         return res/maximum
@@ -352,24 +348,13 @@ class LocalSearch():
         # "avenging" moves
         temp_board = self.board.clone()
         temp_board.place_pieces(self.color, config)
-        if "blue" == self.color:
-            pieces = temp_board.blue_pieces
-            friendly_locs = temp_board.blue_pieces_locations
-        else:
-            pieces = temp_board.brown_pieces
-            friendly_locs = temp_board.brown_pieces_locations
+        attacked = temp_board.get_attack_map(self.color)
 
         royalty_locs = {v for k,v in config.items() if k in {"king", "prince",
             "duke"}}
-        royalty_locs_covered = set()
-
-        # Iterate over all piece moves and if a royalty position is covered,
-        # add it to the covered set
-        for piece in pieces:
-            for (x,y) in piece.get_moves_w_avg(temp_board, friendly_locs,
-                dict()):
-                if (x,y) in royalty_locs:
-                    royalty_locs_covered.add((x,y))
+        # A royalty position is covered if any piece attacks (could avenge) it
+        royalty_locs_covered = {loc for loc in royalty_locs
+            if attacked & SQUARE_BITS[loc]}
 
         return (len(royalty_locs_covered) / 3)
 
@@ -414,33 +399,25 @@ class LocalSearch():
         else:
             opponent_bounds = (0,11)
 
+        territory = (((1 << ((opponent_bounds[1] - opponent_bounds[0] + 1)
+            * 24)) - 1) << (opponent_bounds[0] * 24))
+
         # Subtract mountains from maximum heuristic score.
-        for (x,y) in self.board.mountains:
-            if x >= opponent_bounds[0] and x <= opponent_bounds[1]:
-                maximum -= 1
+        maximum -= bin(self.board.terrain.get_mountain_mask() &
+            territory).count("1")
 
         temp_board = self.board.clone()
         temp_board.place_pieces(self.color, config)
+        friendly_locs = temp_board.get_locations(self.color)[0]
 
-        if "blue" == self.color:
-            pieces = temp_board.blue_pieces
-            friendly_locs = temp_board.blue_pieces_locations
-            opponent_locs = temp_board.brown_pieces_locations
-        else:
-            pieces = temp_board.brown_pieces
-            friendly_locs = temp_board.brown_pieces_locations
-            opponent_locs = temp_board.blue_pieces_locations
-
-        coverage = set() 
-
-        # Iterate over all piece moves and count moves that go into
-        # opponent territory.
-        for piece in pieces:
-            for (x,y) in piece.get_moves(temp_board,
-                                         friendly_locs,opponent_locs):
-                if x >= opponent_bounds[0] and x <= opponent_bounds[1]:
-                    coverage.add((x,y))
-        return len(coverage)/maximum
+        # Count the squares in opponent territory that some piece can move
+        # to: attacked squares, less those holding a friendly piece.
+        friendly_mask = 0
+        for loc in friendly_locs:
+            friendly_mask |= SQUARE_BITS[loc]
+        coverage = (temp_board.get_attack_map(self.color) & territory &
+            ~friendly_mask)
+        return bin(coverage).count("1")/maximum
 
     # DAN
     # 7. Some measure of remainder pieces "avengeable"
@@ -450,12 +427,7 @@ class LocalSearch():
         # "avenging" moves
         temp_board = self.board.clone()
         temp_board.place_pieces(self.color, config)
-        if "blue" == self.color:
-            pieces = temp_board.blue_pieces
-            friendly_locs = temp_board.blue_pieces_locations
-        else:
-            pieces = temp_board.brown_pieces
-            friendly_locs = temp_board.brown_pieces_locations
+        attacked = temp_board.get_attack_map(self.color)
 
         non_royalty_locs = set()
         for k,v in config.items():
@@ -465,15 +437,9 @@ class LocalSearch():
                         non_royalty_locs.add(v_sub)
                 else:
                     non_royalty_locs.add(v)
-        non_royalty_locs_covered = set()
-
-        # Iterate over all piece moves and if a royalty position is covered,
-        # add it to the covered set
-        for piece in pieces:
-            for (x,y) in piece.get_moves_w_avg(temp_board, friendly_locs,
-                dict()):
-                if (x,y) in non_royalty_locs:
-                    non_royalty_locs_covered.add((x,y))
+        # A position is covered if any piece attacks (could avenge) it
+        non_royalty_locs_covered = {loc for loc in non_royalty_locs
+            if attacked & SQUARE_BITS[loc]}
 
         return (len(non_royalty_locs_covered) / 10)
 
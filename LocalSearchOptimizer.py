@@ -111,10 +111,11 @@ class LocalSearchOptimizer():
 
         # For the number of simulations requested, run games from each start
         # Flip a coin for which player goes first
+        # (each worker gets its own copy of the board, see Board.to_bytes)
         results = []
         for curr_start in game_starts:
             curr_results = self.sim_pool.starmap(run_game_simulation_truncated,
-                [(self.turn_limit, self.eval_func, curr_start.clone(),
+                [(self.turn_limit, self.eval_func, curr_start,
                 self.playout_blue, self.playout_brown,
                 bool(random.getrandbits(1)), time.time(), math.inf) \
                     for _ in range(self.num_simulations)])
@@ -20,10 +20,34 @@ from GameExecution import *
 from Heuristics import *
 from FeudalUtilities import parallel_seed
 
+# Default number of node states an MCTS agent keeps (see StateCache)
+STATE_CACHE_SIZE = 4096
+
+# The materialized states of a search tree's nodes, least recently used first
+# (a dict keeps insertion order). Nodes only keep the action leading to them,
+# so states dropped from here are rebuilt from an ancestor (see Node.state).
+class StateCache():
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.states = dict() # Node -> Board
+
+    # The cached state of node (now the most recently used), or None
+    def get(self, node):
+        state = self.states.pop(node, None)
+        if state is not None:
+            self.states[node] = state
+        return state
+
+    def put(self, node, state):
+        self.states[node] = state
+        if len(self.states) > self.capacity:
+            del self.states[next(iter(self.states))]
+
 # Node class to be used in the constructed search tree
 class Node():
     # @param state          A representation of the state. For now the
-    #                       assumption is that state is an instance of Board
+    #                       assumption is that state is an instance of Board.
+    #                       Kept by the root; other nodes keep it in cache
     # @param parent         Another instance of Node that is the parent of this
     #                       Node in the search tree
     # @param action         The action that led from the parent state to this
@@ -38,9 +62,24 @@ class Node():
     # @param num_playouts   The number of playouts that have gone through this
     #                       Node; default 0, made an argument for the same
     #                       reason as utility
+    # @param unique         If True, children are distinct resulting
+    #                       positions rather than distinct turns (see
+    #                       Board.get_all_moves_ref)
+    # @param turns          If given, the actions to expand, in order,
+    #                       instead of the preferred and then random actions
+    #                       (see the turn_policy of MCTS_UCT_Agent)
+    # @param cache          A StateCache shared by the tree, or None for
+    #                       every node to keep its state. With a cache, state
+    #                       is only read here (see MCTS_UCT_Agent.expand) and
+    #                       then rebuilt when needed
     def __init__(self, state, parent, action, depth, color, utility=0,
-        num_playouts=0):
-        self.state = state
+        num_playouts=0, unique=False, turns=None, cache=None):
+        self.cache = cache
+        if cache is None or parent is None:
+            self.stored_state = state
+        else:
+            self.stored_state = None
+        self.winner = state.winner
         self.parent = parent
         self.children = []
         self.action = action
@@ -49,31 +88,84 @@ class Node():
         self.utility = utility
         self.num_playouts = num_playouts
         self.num_children = 0
-        self.num_possible_children = state.get_num_all_moves(color)
-        self.actions_tried = set()
+        self.unique = unique
+        self.untried_turns = turns
+        if turns is not None:
+            self.num_possible_children = len(turns)
+        elif unique:
+            self.num_possible_children = len(state.get_all_moves_ref(color,
+                True, True))
+        else:
+            self.num_possible_children = state.get_num_all_moves(color)
+        self.actions_tried = set() # See action_key
         self.preferred_actions = None
 
+    # The key under which a tried action is recorded: the encoded turn (see
+    # Board.encode_turn), or in unique mode the hash of the resulting state
+    def action_key(self, action, new_state):
+        if self.unique:
+            return new_state.get_hash_key()
+        return encode_turn(action)
+
     def is_fully_expanded(self):
         return self.num_children == self.num_possible_children
 
     def is_terminal(self):
-        return self.state.game_over()
+        return self.winner is not None
+
+    # The state of this node: kept, cached, or else rebuilt from the nearest
+    # ancestor with a state by replaying the actions on the way down (and
+    # cached again)
+    @property
+    def state(self):
+        if self.stored_state is not None:
+            return self.stored_state
+        state = self.cache.get(self)
+        if state is None:
+            path = []
+            node = self
+            while state is None:
+                path.append(node)
+                node = node.parent
+                state = node.stored_state
+                if state is None:
+                    state = node.cache.get(node)
+            state = state.clone()
+            for node in reversed(path):
+                state.apply_moves(node.action, node.parent.color)
+            self.cache.put(self, state)
+        return state
+
+    # A new Board of this node's state for a playout to play on. A state not
+    # kept or cached is built from the parent's state and not cached, as
+    # only nodes that get expanded need theirs again.
+    def new_state(self):
+        state = self.stored_state
+        if state is None:
+            state = self.cache.get(self)
+        if state is not None:
+            return state.clone()
+        state = self.parent.state.clone()
+        state.apply_moves(self.action, self.parent.color)
+        return state
 
 # A lightweight version of regular Agents
 class PlayoutAgent():
-    def __init__(self, color):
+    # @param max_turns  As for Agent
+    def __init__(self, color, max_turns=None):
         self.color = color
+        self.max_turns = max_turns
         self.opponent_color = "blue" if self.color == "brown" else "brown"
 
 # A lightweight version of the RandomAgent
-# NOTE: Given the usage of Board's get_random_move function, this is not a
+# NOTE: Given the usage of Board's get_random_turn function, this is not a
 #       uniform random action agent - if it were, it would be extremely biased
 #       towards multiple piece moves; using the method it does, it is actually
 #       biased towards better gameplay, where every move need not involve all
 #       pieces
 class RandomPlayoutAgent(PlayoutAgent):
     def get_choice(self, board):
-        return board.get_random_move(self.color)[0]
+        return board.get_random_turn(self.color)
 
     # Returns the empty list as this agent has no "preferences" before
     # resorting to random gameplay.
@@ -82,36 +174,19 @@ class RandomPlayoutAgent(PlayoutAgent):
 
 class PureGreedyRandomPlayoutAgent(PlayoutAgent):
     def get_choice(self, board):
-        chosen_move = None
-        # Make copy of current counts.
-        current_counts = dict(board.get_counts(self.opponent_color))
-        for moves in board.get_all_moves_ref(self.color):
-            # Apply moves.
-            saves = board.apply_moves(moves, self.color)
-            if any_value_change(current_counts,
-                board.get_counts(self.opponent_color)):
-                return moves
-            board.reverse_apply_moves(saves, self.color)
+        # Take the first turn that eliminates any enemy piece
+        capture_turn = board.for_each_turn(self.color, list, captures=True)
+        if capture_turn:
+            return capture_turn
         # If no pure "greedy" move has been found, take a random action
-        if chosen_move is None:
-            return board.get_random_move(self.color)[0]
+        return board.get_random_turn(self.color)
 
     # Retrieves the moves that this agent would consider
     # before restoring to random gameplay - here an unsorted (without regard
     # to enemy piece types or quanity) list of moves that eliminate enemy
     # pieces.
     def get_preferences(self, board):
-        preferences = []
-        # Make copy of current counts.
-        current_counts = dict(board.get_counts(self.opponent_color))
-        for moves in board.get_all_moves_ref(self.color):
-            # Apply moves.
-            saves = board.apply_moves(moves, self.color)
-            if any_value_change(current_counts,
-                board.get_counts(self.opponent_color)):
-                preferences.append(moves)
-            board.reverse_apply_moves(saves, self.color)
-        return preferences
+        return board.get_capture_turns(self.color, self.max_turns)
 
 # Greedy w.r.t. "best" difference among enemy counts from start to result
 # Simple preferences in order:
@@ -120,26 +195,8 @@ class PureGreedyRandomPlayoutAgent(PlayoutAgent):
 #   3. Random move
 class PieceGreedyRandomPlayoutAgent(PlayoutAgent):
     def get_choice(self, board):
-        current_counts = dict(board.get_counts(self.opponent_color))
-        some_royalty_eliminated = [] # Keep tuples of difference, move
-        some_enemy_eliminated = [] # Keep tuples of difference, move
-        for moves in board.get_all_moves_ref(self.color):
-            # Apply sequence of moves to the board.
-            saves = board.apply_moves(moves, self.color)
-
-            royalty_difference = any_value_change(current_counts,
-                board.get_counts(self.opponent_color), ["king", "prince",
-                "duke"])
-            other_difference = any_value_change(current_counts,
-                board.get_counts(self.opponent_color), ["knight",
-                    "sergeant", "pikemen", "squire", "archer"])
-            if royalty_difference:
-                some_royalty_eliminated.append((moves, royalty_difference))
-            if other_difference:
-                some_enemy_eliminated.append((moves, other_difference))
-
-            # Undo moves.
-            board.reverse_apply_moves(saves, self.color)
+        some_royalty_eliminated, some_enemy_eliminated = rank_greedy_turns(
+            board, self.color, self.max_turns)
 
         # For either royalty or enemy eliminated moves (in that priority order)
         # sort the lists by the difference associated with each move, then
@@ -149,7 +206,7 @@ class PieceGreedyRandomPlayoutAgent(PlayoutAgent):
         elif len(some_enemy_eliminated) > 0:
             return sorted(some_enemy_eliminated, key=lambda x : x[1])[-1][0]
         else: # If no good move has been found, take a random action
-            return board.get_random_move(self.color)[0]
+            return board.get_random_turn(self.color)
 
     # Retrieves the sorted ordering of moves that this agent would consider
     # before restoring to random gameplay - thus it returns moves that
@@ -157,26 +214,8 @@ class PieceGreedyRandomPlayoutAgent(PlayoutAgent):
     # followed by moves that eliminate any enemy piece (again, in descending
     # order).
     def get_preferences(self, board):
-        current_counts = dict(board.get_counts(self.opponent_color))
-        some_royalty_eliminated = [] # Keep tuples of difference, move
-        some_enemy_eliminated = [] # Keep tuples of difference, move
-        for moves in board.get_all_moves_ref(self.color):
-            # Apply sequence of moves to the board.
-            saves = board.apply_moves(moves, self.color)
-
-            royalty_difference = any_value_change(current_counts,
-                board.get_counts(self.opponent_color), ["king", "prince",
-                "duke"])
-            other_difference = any_value_change(current_counts,
-                board.get_counts(self.opponent_color), ["knight",
-                    "sergeant", "pikemen", "squire", "archer"])
-            if royalty_difference:
-                some_royalty_eliminated.append((moves, royalty_difference))
-            if other_difference:
-                some_enemy_eliminated.append((moves, other_difference))
-
-            # Undo moves.
-            board.reverse_apply_moves(saves, self.color)
+        some_royalty_eliminated, some_enemy_eliminated = rank_greedy_turns(
+            board, self.color, self.max_turns)
 
         combined = (sorted(some_royalty_eliminated, key=lambda x : x[1],
             reverse=True) + sorted(some_enemy_eliminated, key=lambda x : x[1],
@@ -207,15 +246,29 @@ class MCTS_UCT_Agent(Agent):
     #                               use, such as "random"
     # @param playout_class_args     A dictionary of arguments, if any, to pass
     #                               to the playout agent
+    # @param unique_turns           If True, expand one child per distinct
+    #                               resulting position instead of per turn
+    # @param turn_policy            If given, each node expands the turns of
+    #                               Board.get_turns under this policy (by
+    #                               name), capped at max_turns, in order;
+    #                               otherwise random expansion is used
+    # @param max_turns              As for Agent; also passed on to the
+    #                               playout agents
+    # @param state_cache_size       How many node states to keep in memory
+    #                               (see StateCache); None keeps all of them
     def __init__(self, color, time_limit, local_search_method,
         local_search_init_args, local_search_run_args, c, playout_class,
         playout_class_args=dict(), verbose=False, turn_limit=None,
-        truncate_function=None):
+        truncate_function=None, unique_turns=False, turn_policy=None,
+        max_turns=None, state_cache_size=STATE_CACHE_SIZE):
         if turn_limit is not None and truncate_function is None:
             raise RuntimeError("Cannot truncate without an eval function")
         super().__init__(color, time_limit, local_search_method,
-            local_search_init_args, local_search_run_args)
+            local_search_init_args, local_search_run_args, max_turns)
         self.c = c
+        self.unique_turns = unique_turns
+        self.turn_policy = turn_policy
+        self.state_cache_size = state_cache_size
         self.safe_limit = .9 * self.time_limit
         self.verbose = verbose
         self.sim = partial(run_game_simulation_truncated, turn_limit,
@@ -223,6 +276,7 @@ class MCTS_UCT_Agent(Agent):
                     run_game_simulation
 
         # Setup playout agents
+        playout_class_args["max_turns"] = max_turns
         playout_class_args["color"] = "blue"
         self.playout_blue = playout_dict[playout_class](**playout_class_args)
         playout_class_args["color"] = "brown"
@@ -247,6 +301,24 @@ class MCTS_UCT_Agent(Agent):
         else:
             return self.playout_brown
 
+    # The turns a new node expands (see Node), or None for random expansion
+    def get_turns(self, board, color):
+        if self.turn_policy is None:
+            return None
+        return board.get_turns(color, self.turn_policy, self.max_turns,
+            self.unique_turns)
+
+    # A new root node for the search from board
+    def new_tree(self, board):
+        cache = StateCache(self.state_cache_size) if \
+            self.state_cache_size is not None else None
+        tree = Node(board.clone(), None, None, 0, self.color, 0, 0,
+            self.unique_turns, self.get_turns(board, self.color), cache)
+        if tree.untried_turns is None:
+            tree.preferred_actions = \
+                self.get_playout_agent(self.color).get_preferences(tree.state)
+        return tree
+
     # The function for running MCTS
     def get_choice(self, board):
         # Start a clock to ensure an answer is given within the time limit
@@ -256,9 +328,7 @@ class MCTS_UCT_Agent(Agent):
         max_depth = 0
 
         # Initialize the tree
-        tree = Node(board.clone(), None, None, 0, self.color, 0, 0)
-        tree.preferred_actions = \
-            self.get_playout_agent(self.color).get_preferences(tree.state)
+        tree = self.new_tree(board)
 
         # While there is remaining time, run the following four steps:
         # 1. select, 2. expand, 3. simulate, and 4. backpropagate
@@ -299,7 +369,7 @@ class MCTS_UCT_Agent(Agent):
         # Return best move
         best_child = self.best_child(tree, 0)
         if best_child is None: # I.e. no simulations were run in time
-            return board.get_random_move(self.color)[0]
+            return board.get_random_turn(self.color)
         return best_child.action
 
     # Finds the "best child" either in the select phase of the algorithm or for
@@ -360,37 +430,56 @@ class MCTS_UCT_Agent(Agent):
         if (time() - start_time > self.safe_limit):
             return None
 
-        # If there are preferred actions to try first, pop them
-        if node.preferred_actions:
-            chosen_action = node.preferred_actions.pop(0)
-            new_board = node.state.clone()
-            new_board.apply_moves(chosen_action, node.color)
-        # Else choose a random action and get a new state
-        else:
-            chosen_action, new_board = node.state.get_random_move(node.color)
+        # The new node is set up with its action applied to this node's
+        # state in place, which is reversed afterwards: the new node keeps
+        # only the action (see Node.state)
+        state = node.state
+        # Under a turn policy, expand its turns in order
+        chosen_action = None
+        if node.untried_turns is not None:
+            chosen_action = node.untried_turns.pop(0)
+            saves = state.apply_moves(chosen_action, node.color)
+        # If there are preferred actions to try first, pop them (skipping any
+        # that reach an already tried position in unique mode)
+        while chosen_action is None and node.preferred_actions:
+            action = node.preferred_actions.pop(0)
+            saves = state.apply_moves(action, node.color)
+            if node.action_key(action, state) not in node.actions_tried:
+                chosen_action = action
+                break
+            state.reverse_apply_moves(saves, node.color)
+        # Else choose a random action
+        if chosen_action is None:
+            chosen_action, saves = state.apply_random_turn(node.color)
             # If action has already been tried, get a new one
-            while (tuple(chosen_action) in node.actions_tried):
-                chosen_action, new_board = node.state.get_random_move(
-                    node.color)
+            while (node.action_key(chosen_action, state) in
+                node.actions_tried):
+                state.reverse_apply_moves(saves, node.color)
+                chosen_action, saves = state.apply_random_turn(node.color)
 
         # Prepare node for that state
         # First the color (i.e. whose turn it is) should be the opposite of the
         # parent
         new_color = "blue" if node.color == "brown" else "brown"
-        new_node = Node(state=new_board, parent=node, action=chosen_action,
-            depth=(node.depth + 1), color=new_color, utility=0, num_playouts=0)
+        new_node = Node(state=state if node.cache is not None else
+            state.clone(), parent=node, action=chosen_action,
+            depth=(node.depth + 1), color=new_color, utility=0, num_playouts=0,
+            unique=node.unique, turns=self.get_turns(state, new_color),
+            cache=node.cache)
         # NOTE: The preferences being obtained here are actually those of the
         # opponent - hopefully this makes sense, as we would be first examining
         # those states that would rest from the enemy playing under the
         # simulation policy (again, hopefully then considering "strong" enemy
         # moves, allowing us to avoid traps).
-        new_node.preferred_actions = \
-            self.get_playout_agent(new_color).get_preferences(new_board)
+        if new_node.untried_turns is None:
+            new_node.preferred_actions = \
+                self.get_playout_agent(new_color).get_preferences(state)
 
         # Handle the bookkeeping for the parent
         node.children.append(new_node)
         node.num_children += 1
-        node.actions_tried.add(tuple(chosen_action))
+        node.actions_tried.add(node.action_key(chosen_action, state))
+        state.reverse_apply_moves(saves, node.color)
 
         return new_node
 
@@ -400,7 +489,7 @@ class MCTS_UCT_Agent(Agent):
             return None
 
         blue_turn = True if "blue" == child.color else False
-        temp_res = self.sim(child.state.clone(),
+        temp_res = self.sim(child.new_state(),
             self.playout_blue, self.playout_brown, blue_turn,
             start_time, self.safe_limit)
 
@@ -445,22 +534,44 @@ class MCTS_UCT_Agent(Agent):
 # Implements a simple leaf parallelization where several simulations are run
 # in the simulate phase instead of just one
 class MCTS_UCT_LP_Agent(MCTS_UCT_Agent):
+    # @param num_processes          The number of simulations per leaf
+    # @param batch_playouts         If True, run a leaf's simulations together
+    #                               on a BatchBoard (needs NumPy) instead of
+    #                               in a pool of processes; only for "random"
+    #                               playouts. Pays off with a turn_limit and
+    #                               many (e.g. 128) simulations per leaf, as
+    #                               a batch runs until its longest game ends
     def __init__(self, color, time_limit, local_search_method,
         local_search_init_args, local_search_run_args, c, playout_class,
         playout_class_args=dict(), verbose=False, turn_limit=None,
-        truncate_function=None, num_processes=8):
+        truncate_function=None, num_processes=8, unique_turns=False,
+        turn_policy=None, max_turns=None, state_cache_size=STATE_CACHE_SIZE,
+        batch_playouts=False):
         super().__init__(color, time_limit, local_search_method,
             local_search_init_args, local_search_run_args, c, playout_class,
-            playout_class_args, verbose, turn_limit, truncate_function)
+            playout_class_args, verbose, turn_limit, truncate_function,
+            unique_turns, turn_policy, max_turns, state_cache_size)
         self.num_processes = num_processes
-        self.sim_pool = multiprocessing.Pool(processes=num_processes,
-            initializer=parallel_seed)
+        self.batch_playouts = batch_playouts
+        if batch_playouts:
+            if playout_class != "random":
+                raise RuntimeError("Batch playouts are only random")
+            import numpy as np
+            self.rng = np.random.default_rng(random.getrandbits(64))
+            self.turn_limit = turn_limit
+            self.truncate = truncate_dict[truncate_function] if turn_limit \
+                else None
+            self.sim_pool = None
+        else:
+            self.sim_pool = multiprocessing.Pool(processes=num_processes,
+                initializer=parallel_seed)
 
     # NOTE: ANY USAGE OF THIS AGENT MUST CALL THIS FUNCTION AT CONCLUSION
     # Properly closes the pool of processes used for simulation
     def cleanup(self):
-        self.sim_pool.close()
-        self.sim_pool.join()
+        if self.sim_pool is not None:
+            self.sim_pool.close()
+            self.sim_pool.join()
 
     # The function for running MCTS
     def get_choice(self, board):
@@ -471,9 +582,7 @@ class MCTS_UCT_LP_Agent(MCTS_UCT_Agent):
         max_depth = 0
 
         # Initialize the tree
-        tree = Node(board.clone(), None, None, 0, self.color, 0, 0)
-        tree.preferred_actions = \
-            self.get_playout_agent(self.color).get_preferences(tree.state)
+        tree = self.new_tree(board)
 
         # While there is remaining time, run the following four steps:
         # 1. select, 2. expand, 3. simulate, and 4. backpropagate
@@ -521,17 +630,21 @@ class MCTS_UCT_LP_Agent(MCTS_UCT_Agent):
         # print("best:", best_child.utility / best_child.num_playouts)
         #self.print_tree(tree, 0)
         if best_child is None: # I.e. no simulations were run in time
-            return board.get_random_move(self.color)[0]
+            return board.get_random_turn(self.color)
         return best_child.action
 
     # Simulate run(s) of the game from the newly added child node
     def simulate(self, child, start_time):
         if (time() - start_time > self.safe_limit):
             return None
+        if self.batch_playouts:
+            return self.simulate_batch(child, start_time)
 
         blue_turn = True if "blue" == child.color else False
+        # Each worker gets its own copy of the board, pickled compactly (see
+        # Board.to_bytes), so no clone is needed here
         results = self.sim_pool.starmap(self.sim,
-            [(child.state.clone(), self.playout_blue, self.playout_brown,
+            [(child.new_state(), self.playout_blue, self.playout_brown,
             blue_turn, start_time, self.safe_limit) \
                 for _ in range(self.num_processes)])
         winners = [x[0] if x is not None else None for x in results]
@@ -548,6 +661,25 @@ class MCTS_UCT_LP_Agent(MCTS_UCT_Agent):
 
         return sum([1 if w == self.color else 0 for w in winners])
 
+    # The simulations of simulate played together on a BatchBoard holding
+    # num_processes copies of the child's state; games reaching the turn
+    # limit are decided by the truncation function, as in
+    # run_game_simulation_truncated
+    def simulate_batch(self, child, start_time):
+        from BatchBoard import BatchBoard, COLOR_INDEX
+        state = child.new_state()
+        batch = BatchBoard([state] * self.num_processes)
+        winners, turns = batch.run_playouts(child.color, self.rng,
+            state.moves_max - 1, self.turn_limit,
+            start_time + self.safe_limit)
+        if (time() - start_time > self.safe_limit):
+            return None
+        self.running_turn_count += int(turns.sum())
+        won = int((winners == COLOR_INDEX[self.color]).sum())
+        for b in (winners < 0).nonzero()[0]:
+            won += self.truncate(batch.get_board(b, state)) == self.color
+        return won
+
     # As this function operates on the tree in place, it returns False if it
     # had to abort because of no more time, else True for success
     def back_propagate(self, result, child, start_time):
@@ -1,9 +1,11 @@
 # Module for minimax implementations.
-# As of now, the choice of minimax agent to run is 
-# hard coded in the get_choice function (This should be modified so that
-# it can be placed in a config). 
+# A single negamax search with alpha beta pruning and iterative deepening,
+# whose optional features (transposition table, move ordering, MTD(f),
+# aspiration windows) are chosen through Minimax_Agent's arguments, and so
+# from the JSON config (see SEARCH_PRESETS).
 
 import random
+from array import array
 from Board import *
 from Agent import *
 import time
@@ -11,16 +13,181 @@ from Heuristics import *
 
 LT, EQ, GT = -1,0,1
 
+# The value of a won position for the winner (evaluate_node is within 0..1)
+WIN_VALUE = 10.0
+
+# The width of MTD(f)'s null windows; values are not integers
+MTDF_WINDOW = 0.001
+
+# Search features, by name of the search presets that replace the separate
+# implementations there used to be:
+#   negamax         Plain alpha beta
+#   memory          With a transposition table (negamax_with_mem, default)
+#   mtdf            MTD(f) null window passes over the transposition table
+#   pv              The last iteration's principal variation searched first
+#   move_ordering   Children searched in order of evaluate_node
+# and one more:
+#   history         With a transposition table, children searched killer
+#                   turns first and then by history score (no evaluations)
+SEARCH_FEATURES = {
+    "transposition_table"   : False,
+    "pv_ordering"           : False,
+    "eval_ordering"         : False,
+    "killer_moves"          : False,
+    "history_ordering"      : False,
+    "mtdf"                  : False,
+    "aspiration_window"     : None
+}
+SEARCH_PRESETS = {
+    "negamax"       : {},
+    "memory"        : {"transposition_table" : True},
+    "mtdf"          : {"transposition_table" : True, "mtdf" : True},
+    "pv"            : {"pv_ordering" : True},
+    "move_ordering" : {"eval_ordering" : True},
+    "history"       : {"transposition_table" : True, "killer_moves" : True,
+                       "history_ordering" : True}
+}
+
+# Killer turns kept per ply: the latest turns there to cause a beta cutoff
+NUM_KILLERS = 2
+
+# Raised from within the search when the time limit runs out
+class SearchTimeout(Exception):
+    pass
+
+# Transposition table memory budget (MB) by default, and the bytes of an
+# entry: its key, value, info and turn words
+TT_SIZE_MB = 32
+TT_ENTRY_BYTES = 32
+
+# Fields of an entry's info word (0 marks an empty entry): the flag plus 1
+# (bits 0-1), the depth searched (bits 2-9), the bits of the best turn's
+# code (see encode_turn) above the 64 in the turn word (bits 10-25), and the
+# generation (search) that stored it (bits 26-33)
+TT_DEPTH_SHIFT = 2
+TT_MAX_DEPTH = 0xFF
+TT_TURN_SHIFT = 10
+TT_TURN_HIGH_MASK = 0xFFFF
+TT_GENERATION_SHIFT = 26
+TT_MAX_GENERATION = 0xFF
+TURN_WORD_MASK = (1 << 64) - 1
+
+# Hash key term of brown to move, as the board's hash key leaves it out
+SIDE_KEY = random.Random(740).getrandbits(64)
+
+# A fixed size transposition table in preallocated arrays. A position's hash
+# key picks a bucket of two entries: the first keeps the deepest search
+# seen, the second takes whatever the first turns away, so deep results
+# survive floods of shallow ones while recent shallow ones are still kept.
+# The table lasts the whole game: each search is a new generation, and the
+# first entry also gives way to any entry of the current search once its
+# own search is over, however deep it was.
+class TranspositionTable():
+    # @param size_mb    The memory budget in MB
+    def __init__(self, size_mb=TT_SIZE_MB):
+        self.num_buckets = max(1, int(size_mb * 2**20) // (2 * TT_ENTRY_BYTES))
+        size = 2 * self.num_buckets
+        self.keys = array("Q", bytes(8 * size))
+        self.values = array("d", bytes(8 * size))
+        self.infos = array("Q", bytes(8 * size))
+        self.turns = array("Q", bytes(8 * size))
+        self.generation = 0
+
+    def clear(self):
+        self.infos = array("Q", bytes(8 * len(self.infos)))
+
+    # Start the next generation, so entries so far age
+    def new_search(self):
+        self.generation = (self.generation + 1) & TT_MAX_GENERATION
+
+    # The (value, depth, flag, turn code) stored for key, or None
+    def get(self, key):
+        i = 2 * (key % self.num_buckets)
+        if self.keys[i] != key or self.infos[i] == 0:
+            i += 1
+            if self.keys[i] != key or self.infos[i] == 0:
+                return None
+        info = self.infos[i]
+        return (self.values[i], (info >> TT_DEPTH_SHIFT) & TT_MAX_DEPTH,
+            (info & 3) - 1, ((info >> TT_TURN_SHIFT) & TT_TURN_HIGH_MASK) << 64 |
+            self.turns[i])
+
+    # A key is held in at most one entry of its bucket: a store into the
+    # first entry drops any copy in the second, and one turned away from the
+    # first overwrites the second.
+    # @param turn   The best turn's code (see encode_turn), 0 for none
+    def put(self, key, value, depth, flag, turn=0):
+        i = 2 * (key % self.num_buckets)
+        info = self.infos[i]
+        if info != 0 and self.keys[i] != key and \
+            depth < (info >> TT_DEPTH_SHIFT) & TT_MAX_DEPTH and \
+            (info >> TT_GENERATION_SHIFT) == self.generation:
+            i += 1
+        elif self.keys[i + 1] == key:
+            self.infos[i + 1] = 0
+        self.keys[i] = key
+        self.values[i] = value
+        self.infos[i] = (flag + 1) | min(depth, TT_MAX_DEPTH) << \
+            TT_DEPTH_SHIFT | (turn >> 64) << TT_TURN_SHIFT | \
+            self.generation << TT_GENERATION_SHIFT
+        self.turns[i] = turn & TURN_WORD_MASK
+
 class Minimax_Agent(Agent):
+    # @param unique_turns   If True, only search one turn per distinct
+    #                       resulting position (see Board.get_all_moves_ref)
+    # @param turn_policy    Which turns to search and in what order, by name
+    #                       (see Board.get_turns); with max_turns this keeps
+    #                       3 and 4 piece turns tractable
+    # @param max_turns      The most turns searched per node (None for all)
+    # @param search         The preset of search features, by name (see
+    #                       SEARCH_PRESETS)
+    # @param transposition_table, pv_ordering, eval_ordering, killer_moves,
+    #        history_ordering, mtdf
+    #                       If given, turn the feature on or off whatever
+    #                       the preset (mtdf always uses the table)
+    # @param aspiration_window  If given, search each iteration after the
+    #                       first within this distance of the last value
+    # @param tt_size_mb     The transposition table's memory budget in MB;
+    #                       the table is kept from one turn to the next
     def __init__(self, color, time_limit, local_search_method,
                 local_search_init_args, local_search_run_args, 
-                verbose=False):
+                verbose=False, unique_turns=False, turn_policy=TURNS_ALL,
+                max_turns=None, search="memory", transposition_table=None,
+                pv_ordering=None, eval_ordering=None, killer_moves=None,
+                history_ordering=None, mtdf=None, aspiration_window=None,
+                tt_size_mb=TT_SIZE_MB):
         super().__init__(color, time_limit, local_search_method,
                         local_search_init_args, local_search_run_args)
         self.verbose = verbose
+        self.unique_turns = unique_turns
+        self.turn_policy = turn_policy
+        self.max_turns = max_turns
+        if search not in SEARCH_PRESETS:
+            raise RuntimeError("Minimax_Agent: unknown search " + str(search))
+        features = dict(SEARCH_FEATURES)
+        features.update(SEARCH_PRESETS[search])
+        for (name, value) in (("transposition_table", transposition_table),
+                              ("pv_ordering", pv_ordering),
+                              ("eval_ordering", eval_ordering),
+                              ("killer_moves", killer_moves),
+                              ("history_ordering", history_ordering),
+                              ("mtdf", mtdf),
+                              ("aspiration_window", aspiration_window)):
+            if value is not None:
+                features[name] = value
+        self.use_tt = features["transposition_table"] or features["mtdf"]
+        self.pv_ordering = features["pv_ordering"]
+        self.eval_ordering = features["eval_ordering"]
+        self.killer_moves = features["killer_moves"]
+        self.history_ordering = features["history_ordering"]
+        self.mtdf = features["mtdf"]
+        self.aspiration_window = features["aspiration_window"]
         self.neg_color = "brown" if color == "blue" else "blue"
         self.color_weight = {self.color: 1, self.neg_color: -1}
-        self.tt = {}
+        self.tt = TranspositionTable(tt_size_mb) if self.use_tt else None
+        # History scores of moves that caused beta cutoffs, by piece type
+        # code << 20 | encode_move(origin, new location)
+        self.history = {}
         self.time_limit = .9 * time_limit
 
         # Statistics
@@ -39,1196 +206,356 @@ class Minimax_Agent(Agent):
             "TT hits"           : self.transposition_hits[:]
         }
 
-    # Returns choice using certain negamax algorithm.
+    # The child turns of a node, under the agent's turn policy
+    def get_turns(self, board, color):
+        return board.get_turns(color, self.turn_policy, self.max_turns,
+            self.unique_turns)
+
+    # Returns choice using the configured negamax search.
     def get_choice(self, board):
         self.start_time = time.process_time()
-        self.tt = {}
-        return self.negamax_with_mem(board)
-        #return self.iter_deepening(board)
-
-
-    # Implements Negamax (Minimax) algorithm.
-    # This is the basic negamax with alpha beta pruning stack framework 
-    # which all the other enhancements derive from. 
-    # Although this is "code bloat", in a sense, it was easier to keep them separate
-    # For efficiency purposes, and for allowing to work and modify each implementation as 
-    # necessary, given the details of a certain algorithm.
-    def negamax(self, board):
-        maximum = float('-inf')
+        if self.tt is not None:
+            self.tt.new_search()
+        return self.search(board)
+
+    # The transposition table key of board with color to move
+    def tt_key(self, board, color):
+        if "blue" == color:
+            return board.hash_key
+        return board.hash_key ^ SIDE_KEY
+
+    # Iterative deepening over the negamax core, until the time limit, a
+    # won or lost root, or an iteration that searched the whole game tree.
+    # Returns the best turn of the last full iteration (or of the first
+    # iteration so far, if even that one ran out of time).
+    def search(self, board):
+        self.depth_reached = 0
+        self.reached = 0
+        self.expanded = 0
+        self.pruned = 0
+        self.hits = 0
+        self.pv = []
+        self.pv_lines = {}
+        self.killers = {} # ply -> killer turns, latest first
+        # Older history counts for less
+        for move_key in self.history:
+            self.history[move_key] >>= 1
         choice = []
-        over = False
+        guess = 0.0
         depth_limit = 1
-        nodes_pruned = 0
-        max_depth = 0
-
-        # Call stack tuple arg_name -> position dictionary.
-        id = {
-                "cur_depth" : 0,
-                "move"      : 1,
-                "color"     : 2,
-                "alpha"     : 3,
-                "beta"      : 4,
-                "value"     : 5,
-                "parent_ptr": 6,
-                "visited"   : 7,
-                "saves"     : 8
-            }
-
-        while not over:
-            # Negamax unrolled function call stack. (In order within tuple).
-            #
-            # @current depth, 
-            # @move to apply (None for root).
-            # @color of node 
-            # @alpha - alpha bound
-            # @beta - beta bound
-            # @value - calculated value of node
-            # @parent_ptr - reference to parent on the stack
-            # @visited - marks if node is being visited for the first time. 
-            # @saves - info needed to reverse apply a move.
-            # 
-            # Notes: 
-            # - color is the color of the current node; but the current 
-            # node performs the task of previous move application; this is a 
-            # bit tricky but allows the board to be passed by reference (it's 
-            # not even on the stack). 
-            #
-            # - parent reference is determined by the invariant that once 
-            # a parent node is pushed onto the stack, it will remain at the 
-            # same index while its children are being explored. 
-            call_stack = [[0, [], self.color, float('-inf'), float('inf'), float('-inf'), 0, False, []]]
-            while len(call_stack) > 0:
-                if time.process_time() - self.start_time > self.time_limit:
-                    over = True
-                    break
-
-                # Get reference to location of current node. 
-                cur_ptr = len(call_stack)-1
-                # Pop node from the stack.
-                [   cur_depth, 
-                    move, 
-                    color, 
-                    alpha,
-                    beta,
-                    value, 
-                    parent_ptr, 
-                    visited, 
-                    saves]        = call_stack.pop()
-                if cur_depth > max_depth:
-                    max_depth = cur_depth
-                neg_color = "brown" if color == "blue" else "blue"
-                # If at root node.
-                if cur_depth == 0:
-                    # Check visited as flag to determine if moves need to be 
-                    # generated (Since root move is initially None). 
-                    if False == visited:
-                        # First push the root back onto the stack. 
-                        call_stack.append([0, [], color, alpha, beta, value, cur_ptr, True, []])
-                        # Generate children of root node and push onto stack. 
-                        
-                        
-                        #cluster = {}
-
-                        for next_move in board.get_all_moves_ref(color):
-                            # Check if next move is a win. 
-                            saves = board.apply_moves(next_move, self.color)
-                            if board.game_over():
-                                if self.color == "blue":
-                                    if board.brown_lost():
-                                        return next_move
-                                else:
-                                    if board.blue_lost():
-                                        return next_move
-
-                            # v = self.color_weight[color] * self.evaluate_node(board)
-
-                            # if v not in cluster:
-                            #     cluster[v] = [next_move]
-                            # else:
-                            #     cluster[v].append(next_move)
-
-                            board.reverse_apply_moves(saves, color)
-
-                        # for k,v in sorted(cluster.items()):
-                            call_stack.append([ 1, 
-                                                #random.choice(cluster[k]),
-                                                next_move,
-                                                neg_color, 
-                                                -beta,
-                                                -alpha, 
-                                                float('-inf'),
-                                                cur_ptr,
-                                                False,
-                                                []])
-                    # Otherwise we are done with current depth-limit 
-                    # iteration. Update max. 
-                    else:
-                        if value > maximum:        
-                            maximum = value
-                            choice = move
-                # Not at root node.
+        # Start from the value an earlier search found for board, if any.
+        if self.use_tt:
+            tt_entry = self.tt.get(self.tt_key(board, self.color))
+            if tt_entry is not None and abs(tt_entry[0]) < WIN_VALUE:
+                guess = tt_entry[0]
+        while True:
+            self.root_turn = None
+            # Set when some node is cut off at the depth limit
+            self.depth_cut = False
+            try:
+                if self.mtdf and depth_limit > 1:
+                    (value, turn) = self.mtdf_search(board, guess, depth_limit)
+                elif self.aspiration_window is not None and depth_limit > 1:
+                    (value, turn) = self.aspiration_search(board, guess,
+                        depth_limit)
                 else:
-                    # If node hasn't been visited, apply move.
-                    if not visited:
-                        for piece_move in move:
-                            save = board.apply_move_retState(piece_move[0], 
-                                                             piece_move[1], 
-                                                             neg_color)
-                            saves.append(save)
-                        # Check if at depth-limit or terminal node.
-                        if board.game_over() or cur_depth == depth_limit:
-                            if board.game_over():
-                                if self.color == "brown" and board.brown_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "brown" and board.blue_lost():
-                                    value = self.color_weight[color] * 10.0
-                                if self.color == "blue" and board.blue_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "blue" and board.brown_lost():
-                                    value = self.color_weight[color] * 10.0
-                            else:
-                                value = self.color_weight[color] * self.evaluate_node(board)
-                            
-                            # Push terminal node back onto stack (with visited flag set).
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta,
-                                                value, 
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                        # Otherwise generate children.
-                        else:
-                            # Push node back onto stack with visited flag set. 
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta, 
-                                                value,
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                            # Generate children.
-                            #cluster = {}
-                            for next_move in board.get_all_moves_ref(color):
-                                saves = board.apply_moves(next_move, color)
-                                # v = self.color_weight[color] * self.evaluate_node(board)
-
-                                # if v not in cluster:
-                                #     cluster[v] = [next_move]
-                                # else:
-                                #     cluster[v].append(next_move)
-
-                                board.reverse_apply_moves(saves, color)
-
-
-
-                            # for k,v in sorted(cluster.items()):
-                                call_stack.append([ cur_depth+1, 
-                                                    #random.choice(cluster[k]),
-                                                    next_move[:],
-                                                    neg_color, 
-                                                    -beta, 
-                                                    -alpha,
-                                                    float('-inf'),
-                                                    cur_ptr,
-                                                    False,
-                                                    []])
-                    # Otherwise node has been visited, undo moves and propagate values up. 
-                    else:
-
-                        for i in range(len(saves)-1, -1, -1):
-                            board.reverse_apply_move(saves[i], neg_color)
-                        if -value > call_stack[parent_ptr][id["value"]]:
-                            call_stack[parent_ptr][id["value"]] = -value
-                            if cur_depth == 1:
-                                call_stack[parent_ptr][id["move"]] = move
-                        if -value > call_stack[parent_ptr][id["alpha"]]:
-                            call_stack[parent_ptr][id["alpha"]] = -value
-                            for i in range(parent_ptr, cur_ptr):
-                                call_stack[i][id["alpha"]] = -value
-                        if call_stack[parent_ptr][id["alpha"]] >= call_stack[parent_ptr][id["beta"]]:
-                            nodes_pruned += (len(call_stack) - parent_ptr)
-                            call_stack = call_stack[:parent_ptr+1]
-            # Increment depth limit (iterative deepening).
-            depth_limit += 1 
-        print("NODES PRUNED:", nodes_pruned)
-        print("MAX DEPTH REACHED:", max_depth)
-        return choice
-
-
-
-    # This is basic negamax with alpha beta pruning and transposition table implementation. 
-    # The framework is the same as the negamax implementation, but transposition table logic 
-    # is derived from Dennis Breuker's PhD thesis, "Memory versus search in games" (1998), p. 16-18
-    def negamax_with_mem(self, board):
-        
-        maximum = float('-inf')
-        choice = []
-        over = False
-        nodes_reached = 0
-        nodes_expanded = 0
-        nodes_pruned = 0
-        transposition_hits = 0
-        depth_limit = 1
-        max_depth = 0
-        
-        # Transposition Table
-        tt = {}
-        
-        # Call stack tuple arg_name -> position dictionary.
-        id = {
-                "cur_depth" : 0,
-                "move"      : 1,
-                "color"     : 2,
-                "alpha"     : 3,
-                "beta"      : 4,
-                "value"     : 5,
-                "alpha_orig": 6,
-                "parent_ptr": 7,
-                "visited"   : 8,
-                "saves"     : 9
-            }
-
-        while not over:
-            call_stack = [[0, [], self.color, float('-inf'), float('+inf'), float('-inf'), float('-inf'), 0, False, []]]
-            while len(call_stack) > 0:
-                if time.process_time() - self.start_time > self.time_limit:
-                    over = True
-                    break
-
-                # Get reference to location of current node. 
-                cur_ptr = len(call_stack)-1
-                # Pop node from the stack.
-                [   cur_depth, 
-                    move, 
-                    color, 
-                    alpha,
-                    beta,
-                    value,
-                    alpha_orig, 
-                    parent_ptr, 
-                    visited, 
-                    saves]        = call_stack.pop()
-                max_depth = max(cur_depth, max_depth)
-                # Negated color.
-                neg_color = "brown" if color == "blue" else "blue"
-                max_depth = max(cur_depth, max_depth)
-                # If at root node.
-                if cur_depth == 0:
-                    # Check visited as flag to determine if moves need to be 
-                    # generated (Since root move is initially None). 
-                    if False == visited:
-                        # First push the root back onto the stack. 
-                        call_stack.append([ 0, 
-                                            [], 
-                                            color, 
-                                            alpha, 
-                                            beta, 
-                                            value, 
-                                            alpha_orig, 
-                                            cur_ptr, 
-                                            True, 
-                                            []])
-                        nodes_expanded += 1
-                        # Generate children of root node and push onto stack. 
-                        for next_move in board.get_all_moves_ref(color):
-                            nodes_reached += 1
-                            call_stack.append([ 1, 
-                                                next_move[:], 
-                                                neg_color, 
-                                                -beta,
-                                                -alpha, 
-                                                float('-inf'),
-                                                -beta,
-                                                cur_ptr,
-                                                False,
-                                                []])
-                    # Otherwise we are done with current depth-limit 
-                    # iteration. Update max. 
-                    else:           
-                        if value > maximum:        
-                            maximum = value
-                            choice = move
-                # Not at root node.
-                else:
-                    # If node hasn't been visited, apply move.
-                    if not visited:
-                        
-                        for piece_move in move:
-                            save = board.apply_move_retState(piece_move[0], 
-                                                             piece_move[1], 
-                                                             neg_color)
-                            saves.append(save)
-
-                        # Check transposition table for depth >= 2. 
-                        if cur_depth >= 1:
-                            key = board.get_hash_key()
-                            if key in tt and tt[key]['depth'] >= depth_limit - cur_depth:
-                                tt_entry = tt[key]
-                                v = tt_entry['value']
-                                transposition_hits += 1
-                                if tt_entry['flag'] == EQ:
-                                    # return tt_entry value
-                                    for i in range(len(saves)-1, -1, -1):
-                                        board.reverse_apply_move(saves[i], neg_color)
-                                    if -v > call_stack[parent_ptr][id["value"]]:
-                                        call_stack[parent_ptr][id["value"]] = -v
-                                        if cur_depth == 1:
-                                            call_stack[parent_ptr][id["move"]] = move
-                                    if -v > call_stack[parent_ptr][id["alpha"]]:
-                                        call_stack[parent_ptr][id["alpha"]] = -v
-                                    for i in range(parent_ptr, cur_ptr):
-                                        call_stack[i][id["alpha"]] = -v
-                                    continue
-                                elif tt_entry['flag'] == LT:
-                                    alpha = max(alpha, v)
-                                elif tt_entry['flag'] == GT:
-                                    beta = min(beta, v)
-
-                                if alpha >= beta:
-                                    v = tt_entry['value']
-                                    # return tt_entry value
-                                    for i in range(len(saves)-1, -1, -1):
-                                        board.reverse_apply_move(saves[i], neg_color)
-                                    if -v > call_stack[parent_ptr][id["value"]]:
-                                        call_stack[parent_ptr][id["value"]] = -v
-                                        if cur_depth == 1:
-                                            call_stack[parent_ptr][id["move"]] = move
-                                    if -v > call_stack[parent_ptr][id["alpha"]]:
-                                        call_stack[parent_ptr][id["alpha"]] = -v
-                                    for i in range(parent_ptr, cur_ptr):
-                                        call_stack[i][id["alpha"]] = -v
-                                    continue
-
-                        # Check if at depth-limit or terminal node.
-                        if board.game_over() or cur_depth == depth_limit:
-                            if board.game_over():
-                                if self.color == "brown" and board.brown_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "brown" and board.blue_lost():
-                                    value = self.color_weight[color] * 10.0
-                                if self.color == "blue" and board.blue_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "blue" and board.brown_lost():
-                                    value = self.color_weight[color] * 10.0
-                            else:
-                                value = self.color_weight[color] * self.evaluate_node(board)
-
-                            
-                            # Push terminal node back onto stack (with visited flag set).
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta,
-                                                value, 
-                                                alpha_orig,
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                        # Otherwise generate children.
-                        else:
-                            # Push node back onto stack with visited flag set. 
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta, 
-                                                value,
-                                                alpha_orig,
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                            # Generate children.
-                            nodes_expanded += 1
-                            for next_move in board.get_all_moves_ref(color):
-                                nodes_reached += 1
-                                call_stack.append([ cur_depth+1, 
-                                                    next_move[:], 
-                                                    neg_color, 
-                                                    -beta, 
-                                                    -alpha,
-                                                    float('-inf'),
-                                                    -beta,
-                                                    cur_ptr,
-                                                    False,
-                                                    []])
-                    # Otherwise node has been visited, undo moves and propagate values up. 
-                    else:
-
-                        # Get hash key for current board.
-                        hash_key = board.get_hash_key()
-
-                        for i in range(len(saves)-1, -1, -1):
-                            board.reverse_apply_move(saves[i], neg_color)
-                        if -value > call_stack[parent_ptr][id["value"]]:
-                            call_stack[parent_ptr][id["value"]] = -value
-                            if cur_depth == 1:
-                                call_stack[parent_ptr][id["move"]] = move
-                        if -value > call_stack[parent_ptr][id["alpha"]]:
-                            call_stack[parent_ptr][id["alpha"]] = -value
-                            for i in range(parent_ptr, cur_ptr):
-                                call_stack[i][id["alpha"]] = -value
-                        if call_stack[parent_ptr][id["alpha"]] >= call_stack[parent_ptr][id["beta"]]:
-                            nodes_pruned += (len(call_stack) - parent_ptr)
-                            call_stack = call_stack[:parent_ptr+1]
-                            continue
-                            
-
-                        # Transposition table caching happens here. 
-                        mem = {}
-                        mem['value'] = value
-                        if value <= alpha_orig:
-                            mem['flag'] = GT
-                        elif value >= beta:
-                            mem['flag'] = LT
-                        else:
-                            mem['flag'] = EQ
-                        mem['depth'] = depth_limit - cur_depth
-                        tt[hash_key] = mem
+                    (value, turn) = self.root_search(board, depth_limit,
+                        float('-inf'), float('inf'))
+            except SearchTimeout:
+                if not choice and self.root_turn is not None:
+                    choice = self.root_turn
+                break
+            if turn is not None:
+                choice = turn
+            guess = value
+            if self.pv_ordering:
+                self.pv = self.pv_lines[0]
+            if abs(value) >= WIN_VALUE or not self.depth_cut:
+                break
             depth_limit += 1
-        
-        if self.verbose:
-            print("MAX DEPTH", max_depth)
-            print("NODES REACHED", nodes_reached)
-            print("NODES EXPANDED", nodes_expanded)
-            print("NODES PRUNED:", nodes_pruned)
-            print("TRANSPOSITION HITS", transposition_hits)
-            print("MAX DEPTH", max_depth)
 
-        self.max_depth.append(max_depth)
-        self.nodes_reached.append(nodes_reached)
-        self.nodes_expanded.append(nodes_expanded)
-        self.nodes_pruned.append(nodes_pruned)
-        self.transposition_hits.append(transposition_hits)
+        if self.verbose:
+            print("MAX DEPTH", self.depth_reached)
+            print("NODES REACHED", self.reached)
+            print("NODES EXPANDED", self.expanded)
+            print("NODES PRUNED:", self.pruned)
+            print("TRANSPOSITION HITS", self.hits)
+
+        self.max_depth.append(self.depth_reached)
+        self.nodes_reached.append(self.reached)
+        self.nodes_expanded.append(self.expanded)
+        self.nodes_pruned.append(self.pruned)
+        self.transposition_hits.append(self.hits)
 
         return choice
 
-
-    # Iterative deepening for MTD(f). 
-    def iter_deepening(self, board):
-        value_guess = 0
-        for depth in range(1,4):
-            (choice, value_guess) = self.MTD_F(board, value_guess, depth)
-            print(depth)
-            if time.process_time() - self.start_time > self.time_limit:
-                break
-        return choice
+    # One negamax search of the root to depth_limit within (alpha, beta)
+    # @return   (value, best turn)
+    def root_search(self, board, depth_limit, alpha, beta):
+        value = self.negamax(board, self.color, depth_limit, 0, alpha, beta,
+            self.pv)
+        return (value, self.root_turn)
 
     # MTD-F Algorithm from the paper, 
     # Plaat, Aske, Jonathan Schaeffer, Wim Pijls and Arie de Bruin. “A New Paradigm for Minimax Search.” ArXivLabs/1404.1515 (2014)
     # One of the authors, Aske Plaat, has a web-page with some simple psuedocode and notes regarding the algorithm: 
     # https://askeplaat.wordpress.com/534-2/mtdf-algorithm/
-    def MTD_F(self, board, value_guess, max_depth):
+    # Null windows are MTDF_WINDOW wide, as values are not integers. The
+    # turn returned is that of the last pass to fail high, which proved it.
+    def mtdf_search(self, board, value_guess, depth_limit):
         upper_bound = float('inf')
         lower_bound = float('-inf')
+        choice = None
 
         while lower_bound < upper_bound:
             if value_guess == lower_bound:
-                beta = value_guess + 1
+                beta = value_guess + MTDF_WINDOW
             else:
                 beta = value_guess
-            (choice, value_guess) = self.negamax_with_mem_MTD_F(board, beta-1, beta, max_depth)
+            (value_guess, turn) = self.root_search(board, depth_limit,
+                beta - MTDF_WINDOW, beta)
             if value_guess < beta:
                 upper_bound = value_guess
             else:
                 lower_bound = value_guess
-        
-        return (choice, value_guess)
-
-    # This is the same as the base negamax implementation but modified to work with MTD-F (i.e., it only goes to 
-    # a certain depth limit on one iteration.)
-    def negamax_with_mem_MTD_F(self, board, alpha, beta, depth_limit):
-        
-        maximum = float('-inf')
-        choice = []
-        over = False
-        nodes_reached = 0
-        nodes_expanded = 0
-        nodes_pruned = 0
-        transposition_hits = 0
-        tt = self.tt
-
-        # Call stack tuple arg_name -> position dictionary.
-        id = {
-                "cur_depth" : 0,
-                "move"      : 1,
-                "color"     : 2,
-                "alpha"     : 3,
-                "beta"      : 4,
-                "value"     : 5,
-                "alpha_orig": 6,
-                "parent_ptr": 7,
-                "visited"   : 8,
-                "saves"     : 9
-            }
-
-        while not over:
-            call_stack = [[0, [], self.color, alpha, beta, float('-inf'), alpha, 0, False, []]]
-            while len(call_stack) > 0:
-                # Get reference to location of current node. 
-                cur_ptr = len(call_stack)-1
-                # Pop node from the stack.
-                [   cur_depth, 
-                    move, 
-                    color, 
-                    alpha,
-                    beta,
-                    value,
-                    alpha_orig, 
-                    parent_ptr, 
-                    visited, 
-                    saves]        = call_stack.pop()
-                max_depth = max(cur_depth, max_depth)
-                # Negated color.
-                neg_color = "brown" if color == "blue" else "blue"
-                # If at root node.
-                if cur_depth == 0:
-                    # Check visited as flag to determine if moves need to be 
-                    # generated (Since root move is initially None). 
-                    if False == visited:
-                        # First push the root back onto the stack. 
-                        call_stack.append([ 0, 
-                                            [], 
-                                            color, 
-                                            alpha, 
-                                            beta, 
-                                            value, 
-                                            alpha_orig, 
-                                            cur_ptr, 
-                                            True, 
-                                            []])
-                        # Generate children of root node and push onto stack. 
-                        for next_move in board.get_all_moves_ref(color):
-                            nodes_reached += 1
-                            call_stack.append([ 1, 
-                                                next_move[:], 
-                                                neg_color, 
-                                                -beta,
-                                                -alpha, 
-                                                float('-inf'),
-                                                -beta,
-                                                cur_ptr,
-                                                False,
-                                                []])
-                    # Otherwise we are done with current depth-limit 
-                    # iteration. Update max. 
-                    else:           
-                        if value > maximum:        
-                            maximum = value
-                            choice = move
-                        over = True
-                        break
-                # Not at root node.
-                else:
-                    # If node hasn't been visited, apply move.
-                    if not visited:
-                        
-                        for piece_move in move:
-                            save = board.apply_move_retState(piece_move[0], 
-                                                             piece_move[1], 
-                                                             neg_color)
-                            saves.append(save)
-
-                        # Check transposition table for depth >= 2. 
-                        if cur_depth >= 1:
-                            key = board.get_hash_key()
-                            if key in tt and tt[key]['depth'] >= max_depth - cur_depth:
-                                tt_entry = tt[key]
-                                v = tt_entry['value']
-                                transposition_hits += 1
-                                if tt_entry['flag'] == EQ:
-                                    # return tt_entry value
-                                    for i in range(len(saves)-1, -1, -1):
-                                        board.reverse_apply_move(saves[i], neg_color)
-                                    if -v > call_stack[parent_ptr][id["value"]]:
-                                        call_stack[parent_ptr][id["value"]] = -v
-                                        if cur_depth == 1:
-                                            call_stack[parent_ptr][id["move"]] = move
-                                    if -v > call_stack[parent_ptr][id["alpha"]]:
-                                        call_stack[parent_ptr][id["alpha"]] = -v
-                                    for i in range(parent_ptr, cur_ptr):
-                                        call_stack[i][id["alpha"]] = -v
-                                    continue
-                                elif tt_entry['flag'] == LT:
-                                    alpha = max(alpha, v)
-                                elif tt_entry['flag'] == GT:
-                                    beta = min(beta, v)
-
-                                if alpha >= beta:
-                                    v = tt_entry['value']
-                                    # return tt_entry value
-                                    for i in range(len(saves)-1, -1, -1):
-                                        board.reverse_apply_move(saves[i], neg_color)
-                                    if -v > call_stack[parent_ptr][id["value"]]:
-                                        call_stack[parent_ptr][id["value"]] = -v
-                                        if cur_depth == 1:
-                                            call_stack[parent_ptr][id["move"]] = move
-                                    if -v > call_stack[parent_ptr][id["alpha"]]:
-                                        call_stack[parent_ptr][id["alpha"]] = -v
-                                    for i in range(parent_ptr, cur_ptr):
-                                        call_stack[i][id["alpha"]] = -v
-                                    continue
-
-                        # Check if at depth-limit or terminal node.
-                        if board.game_over() or cur_depth == depth_limit:
-                            if board.game_over():
-                                if self.color == "brown" and board.brown_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "brown" and board.blue_lost():
-                                    value = self.color_weight[color] * 10.0
-                                if self.color == "blue" and board.blue_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "blue" and board.brown_lost():
-                                    value = self.color_weight[color] * 10.0
-                            else:
-                                value = self.color_weight[color] * self.evaluate_node(board)
-                            # Push terminal node back onto stack (with visited flag set).
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta,
-                                                value, 
-                                                alpha_orig,
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                        # Otherwise generate children.
-                        else:
-                            # Push node back onto stack with visited flag set. 
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta, 
-                                                value,
-                                                alpha_orig,
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                            # Generate children.
-                            for next_move in board.get_all_moves_ref(color):
-                                call_stack.append([ cur_depth+1, 
-                                                    next_move[:], 
-                                                    neg_color, 
-                                                    -beta, 
-                                                    -alpha,
-                                                    float('-inf'),
-                                                    -beta,
-                                                    cur_ptr,
-                                                    False,
-                                                    []])
-                    # Otherwise node has been visited, undo moves and propagate values up. 
-                    else:
-
-                        # Get hash key for current board.
-                        hash_key = board.get_hash_key()
-
-                        for i in range(len(saves)-1, -1, -1):
-                            board.reverse_apply_move(saves[i], neg_color)
-                        if -value > call_stack[parent_ptr][id["value"]]:
-                            call_stack[parent_ptr][id["value"]] = -value
-                            if cur_depth == 1:
-                                call_stack[parent_ptr][id["move"]] = move
-                        if -value > call_stack[parent_ptr][id["alpha"]]:
-                            call_stack[parent_ptr][id["alpha"]] = -value
-                            for i in range(parent_ptr, cur_ptr):
-                                call_stack[i][id["alpha"]] = -value
-                        if call_stack[parent_ptr][id["alpha"]] >= call_stack[parent_ptr][id["beta"]]:
-                            nodes_pruned += (len(call_stack) - parent_ptr)
-                            call_stack = call_stack[:parent_ptr+1]
-                            continue
-                            
-
-                        # Transposition table caching happens here. 
-                        mem = {}
-                        mem['value'] = value
-                        if value <= alpha_orig:
-                            mem['flag'] = GT
-                        elif value >= beta:
-                            mem['flag'] = LT
-                        else:
-                            mem['flag'] = EQ
-                        mem['depth'] = max_depth - cur_depth
-                        tt[hash_key] = mem
-        if self.verbose:
-            print("MAX DEPTH", max_depth)
-            print("NODES REACHED", nodes_reached)
-            print("NODES EXPANDED", nodes_expanded)
-            print("NODES PRUNED:", nodes_pruned)
-            print("TRANSPOSITION HITS", transposition_hits)
-        return (choice, maximum)
-
-
-    # (IN PROGRESS)
-    # negamax_pv - principal variation implementation.
-    # Does not implement full negascout/principal variation search, 
-    # but simply attempts to create the principal variation data structure - 
-    # This is a nested dictionary structure built on each IDF iteration to save moves 
-    # That cause an alpha update in the parent, which are supposedly good moves to consider 
-    # first as a form of move ordering. 
-    # Still very much in progress.
-    def negamax_pv(self, board):
-        maximum = float('-inf')
-        choice = []
-        over = False
-        depth_limit = 1
-        nodes_pruned = 0
-        max_depth = 0
-
-        cur_pv = {"best_moves": [] }
-        prev_pv = {"best_moves": [] }
-
-        # Call stack tuple arg_name -> position dictionary.
-        id = {
-                "cur_depth" : 0,
-                "move"      : 1,
-                "color"     : 2,
-                "alpha"     : 3,
-                "beta"      : 4,
-                "value"     : 5,
-                "parent_ptr": 6,
-                "visited"   : 7,
-                "saves"     : 8,
-                "prev_pv"   : 9,
-                "cur_pv"    : 10
-            }
-        while not over:
-            call_stack = [  [0, 
-                            [], 
-                            self.color, 
-                            float('-inf'), 
-                            float('inf'), 
-                            float('-inf'), 
-                            0, 
-                            False, 
-                            [],
-                            prev_pv,
-                            cur_pv
-                            ]
-                        ]
-            while len(call_stack) > 0:
-                if time.process_time() - self.start_time > self.time_limit:
-                    over = True
+                choice = turn
+
+        return (value_guess, turn if choice is None else choice)
+
+    # A search in a window of aspiration_window either side of the last
+    # iteration's value, searched again with that side open if it fails
+    def aspiration_search(self, board, value_guess, depth_limit):
+        alpha = value_guess - self.aspiration_window
+        beta = value_guess + self.aspiration_window
+        (value, turn) = self.root_search(board, depth_limit, alpha, beta)
+        if value <= alpha:
+            (value, turn) = self.root_search(board, depth_limit,
+                float('-inf'), beta)
+        elif value >= beta:
+            (value, turn) = self.root_search(board, depth_limit, alpha,
+                float('inf'))
+        return (value, turn)
+
+    # Implements Negamax (Minimax) algorithm with alpha beta pruning (fail
+    # soft), the core of every search preset. Transposition table logic is
+    # derived from Dennis Breuker's PhD thesis, "Memory versus search in
+    # games" (1998), p. 16-18.
+    # @param color  The color to move at board
+    # @param depth  The plies left to search
+    # @param ply    The plies from the root; at the root the best turn is
+    #               kept in self.root_turn
+    # @param pv     The rest of the last iteration's principal variation,
+    #               if this node is on it (searched first with pv_ordering)
+    # @return       The value of board for color
+    def negamax(self, board, color, depth, ply, alpha, beta, pv):
+        if time.process_time() - self.start_time > self.time_limit:
+            raise SearchTimeout()
+        if ply > self.depth_reached:
+            self.depth_reached = ply
+        if self.pv_ordering:
+            self.pv_lines[ply] = []
+
+        # Check if at terminal node.
+        if board.winner is not None:
+            return WIN_VALUE if board.winner == color else -WIN_VALUE
+
+        # Check transposition table (for bounds below the root, and the
+        # best turn found before).
+        alpha_orig = alpha
+        hash_code = 0
+        if self.use_tt:
+            key = self.tt_key(board, color)
+            tt_entry = self.tt.get(key)
+            if tt_entry is not None:
+                hash_code = tt_entry[3]
+            if ply > 0 and tt_entry is not None and tt_entry[1] >= depth:
+                (v, _, flag, _) = tt_entry
+                self.hits += 1
+                # The stored search may have been cut off as well
+                self.depth_cut = True
+                if flag == EQ:
+                    return v
+                elif flag == LT:
+                    alpha = max(alpha, v)
+                elif flag == GT:
+                    beta = min(beta, v)
+                if alpha >= beta:
+                    return v
+
+        # Check if at depth-limit.
+        if depth == 0:
+            self.depth_cut = True
+            value = self.color_weight[color] * self.evaluate_node(board)
+            if self.use_tt:
+                self.tt.put(key, value, 0, EQ)
+            return value
+
+        # The principal variation's turn, or else the table's best turn, is
+        # searched before the others are even generated.
+        first = None
+        follow = None
+        if pv:
+            first = pv[0]
+            follow = pv[1:]
+        elif hash_code:
+            first = self.hash_turn(board, color, hash_code)
+        if first is None:
+            turns = self.ordered_turns(board, color, ply)
+            if not turns:
+                return self.color_weight[color] * self.evaluate_node(board)
+            self.reached += len(turns)
+        else:
+            turns = [first]
+            self.reached += 1
+        generated = first is None
+        self.expanded += 1
+
+        neg_color = "brown" if color == "blue" else "blue"
+        value = float('-inf')
+        best_turn = None
+        i = 0
+        while True:
+            if i == len(turns):
+                if generated:
                     break
-
-
-                # Get reference to location of current node. 
-                cur_ptr = len(call_stack)-1
-                # Pop node from the stack.
-                [   cur_depth, 
-                    move, 
-                    color, 
-                    alpha,
-                    beta,
-                    value, 
-                    parent_ptr, 
-                    visited, 
-                    saves,
-                    prev_pv,
-                    cur_pv]        = call_stack.pop()
-                if cur_depth > max_depth:
-                    max_depth = cur_depth
-                neg_color = "brown" if color == "blue" else "blue"
-                # If at root node.
-                if cur_depth == 0:
-                    # Check visited as flag to determine if moves need to be 
-                    # generated (Since root move is initially None). 
-                    if False == visited:
-                        # First push the root back onto the stack. 
-                        call_stack.append([0, [], color, alpha, beta, value, cur_ptr, True, [], prev_pv, cur_pv])
-                        
-                        # Generate children of root node and push onto stack.    
-                        for next_move in board.get_all_moves_ref(color):
-                            
-                            # Skip over PV moves. 
-                            if tuple(next_move) in prev_pv['best_moves']:
-                                continue
-
-                            # Check if next move is a win. 
-                            saves = board.apply_moves(next_move, self.color)
-                            if board.game_over():
-                                if self.color == "blue":
-                                    if board.brown_lost():
-                                        return next_move
-                                else:
-                                    if board.blue_lost():
-                                        return next_move
-                            board.reverse_apply_moves(saves, self.color)
-
-                            next_prev_pv = {"best_moves": [] }
-                            if tuple(next_move) in prev_pv:
-                                next_prev_pv = prev_pv[tuple(next_move)]
-
-                            call_stack.append([ 1, 
-                                                next_move[:],
-                                                neg_color, 
-                                                -beta,
-                                                -alpha, 
-                                                float('-inf'),
-                                                cur_ptr,
-                                                False,
-                                                [],
-                                                next_prev_pv,
-                                                { "best_moves"    : []}
-                                            ])
-                        # Next consider PV nodes.
-                        if len(prev_pv['best_moves']) > 0:
-                            for next_move in prev_pv['best_moves']:
-
-                                # Check if next move is a win. 
-                                saves = board.apply_moves(next_move, self.color)
-                                if board.game_over():
-                                    if self.color == "blue":
-                                        if board.brown_lost():
-                                            return next_move
-                                    else:
-                                        if board.blue_lost():
-                                            return next_move
-                                board.reverse_apply_moves(saves, self.color)
-
-                                next_prev_pv = {"best_moves": [] }
-                                if tuple(next_move) in prev_pv:
-                                    next_prev_pv = prev_pv[tuple(next_move)]
-
-                                call_stack.append([ 1, 
-                                                next_move,
-                                                neg_color, 
-                                                -beta,
-                                                -alpha, 
-                                                float('-inf'),
-                                                cur_ptr,
-                                                False,
-                                                [],
-                                                next_prev_pv,
-                                                { "best_moves"    : []}
-                                                ])
-                    # Otherwise we are done with current depth-limit 
-                    # iteration. Update max. 
-                    else:
-                        if value > maximum:        
-                            maximum = value
-                            choice = move
-                        prev_pv = cur_pv
-                        cur_pv = { "best_moves"    : [] }
-                # Not at root node.
-                else:
-                    # If node hasn't been visited, apply move.
-                    if not visited:
-                        for piece_move in move:
-                            save = board.apply_move_retState(piece_move[0], 
-                                                             piece_move[1], 
-                                                             neg_color)
-                            saves.append(save)
-                        # Check if at depth-limit or terminal node.
-                        if board.game_over() or cur_depth == depth_limit:
-                            if board.game_over():
-                                if self.color == "brown" and board.brown_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "brown" and board.blue_lost():
-                                    value = self.color_weight[color] * 10.0
-                                if self.color == "blue" and board.blue_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "blue" and board.brown_lost():
-                                    value = self.color_weight[color] * 10.0
-                            else:
-                                value = self.color_weight[color] * self.evaluate_node(board)
-
-                            # Push terminal node back onto stack (with visited flag set).
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta,
-                                                value, 
-                                                parent_ptr,
-                                                True,
-                                                saves,
-                                                prev_pv,
-                                                cur_pv
-                                              ])
-                        # Otherwise generate children.
-                        else:
-                            # Push node back onto stack with visited flag set. 
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta, 
-                                                value,
-                                                parent_ptr,
-                                                True,
-                                                saves,
-                                                prev_pv, 
-                                                cur_pv
-                                              ])
-                            for next_move in board.get_all_moves_ref(color):
-                                # Skip over PV moves. 
-                                if tuple(next_move) in prev_pv['best_moves']:
-                                    continue
-                                
-                                next_prev_pv = {"best_moves": [] }
-                                if tuple(next_move) in prev_pv:
-                                    next_prev_pv = prev_pv[tuple(next_move)]
-
-                                call_stack.append([ cur_depth+1, 
-                                                    next_move[:],
-                                                    neg_color, 
-                                                    -beta, 
-                                                    -alpha,
-                                                    float('-inf'),
-                                                    cur_ptr,
-                                                    False,
-                                                    [],
-                                                    next_prev_pv,
-                                                    { "best_moves"    : []}
-                                                ])
-                            # Next consider PV nodes.
-                            if len(prev_pv['best_moves']) > 0:
-                                for next_move in prev_pv['best_moves']:
-                                    # Check if next move is a win. 
-                                    saves = board.apply_moves(next_move, self.color)
-                                    if board.game_over():
-                                        if self.color == "blue":
-                                            if board.brown_lost():
-                                                return next_move
-                                        else:
-                                            if board.blue_lost():
-                                                return next_move
-                                    board.reverse_apply_moves(saves, self.color)
-
-                                    next_prev_pv  = {"best_moves": [] }
-                                    if tuple(next_move) in prev_pv:
-                                        next_prev_pv = prev_pv[tuple(next_move)]
-
-                                    call_stack.append([ 1, 
-                                                    next_move,
-                                                    neg_color, 
-                                                    -beta,
-                                                    -alpha, 
-                                                    float('-inf'),
-                                                    cur_ptr,
-                                                    False,
-                                                    [],
-                                                    next_prev_pv,
-                                                    { "best_moves"    : []}
-                                                    ])
-                    # Otherwise node has been visited, undo moves and propagate values up. 
-                    else:
-                        for i in range(len(saves)-1, -1, -1):
-                            board.reverse_apply_move(saves[i], neg_color)
-                        if -value > call_stack[parent_ptr][id["value"]]:
-                            call_stack[parent_ptr][id["value"]] = -value
-                            if cur_depth == 1:
-                                call_stack[parent_ptr][id["move"]] = move
-                        if -value > call_stack[parent_ptr][id["alpha"]]:
-                            call_stack[parent_ptr][id["alpha"]] = -value
-                            for i in range(parent_ptr, cur_ptr):
-                                call_stack[i][id["alpha"]] = -value
-                            # Update parent PV to include this move. 
-                            call_stack[parent_ptr][id["cur_pv"]]["best_moves"].append(move)
-                        if call_stack[parent_ptr][id["alpha"]] >= call_stack[parent_ptr][id["beta"]]:
-                            nodes_pruned += (len(call_stack) - parent_ptr)
-                            call_stack = call_stack[:parent_ptr+1]
-                        
-                        # Update parent PV to include child's PV. 
-                        call_stack[parent_ptr][id["cur_pv"]][tuple(move)] = cur_pv
-            # Increment depth limit (iterative deepening).
-            depth_limit += 1
-        print("NODES PRUNED:", nodes_pruned)
-        print("MAX DEPTH REACHED:", max_depth)
-        return choice
-
-
-    # Implements Negamax (Minimax) algorithm 
-    # with a very rudimentary move ordering scheme-
-    # on each node expansion, first evaluate the child nodes, 
-    # then sort them based off evaluation and place the best nodes at the end 
-    # of the stack to be considered first. 
-    def negamax_move_ordering(self, board):
-        maximum = float('-inf')
-        choice = []
-        over = False
-        start_time = time.process_time()
-        depth_limit = 1
-        nodes_pruned = 0
-        max_depth = 0
-
-        # Call stack tuple arg_name -> position dictionary.
-        id = {
-                "cur_depth" : 0,
-                "move"      : 1,
-                "color"     : 2,
-                "alpha"     : 3,
-                "beta"      : 4,
-                "value"     : 5,
-                "parent_ptr": 6,
-                "visited"   : 7,
-                "saves"     : 8
-            }
-
-        while not over:
-            call_stack = [[0, [], self.color, float('-inf'), float('inf'), float('-inf'), 0, False, []]]
-            while len(call_stack) > 0:
-
-                if time.process_time() - start_time > self.time_limit:
-                    over = True
+                generated = True
+                for turn in self.ordered_turns(board, color, ply):
+                    if turn != first:
+                        turns.append(turn)
+                self.reached += len(turns) - 1
+                if i == len(turns):
                     break
-
-                # Get reference to location of current node. 
-                cur_ptr = len(call_stack)-1
-                # Pop node from the stack.
-                [   cur_depth, 
-                    move, 
-                    color, 
-                    alpha,
-                    beta,
-                    value, 
-                    parent_ptr, 
-                    visited, 
-                    saves]        = call_stack.pop()
-                if cur_depth > max_depth:
-                    max_depth = cur_depth
-                neg_color = "brown" if color == "blue" else "blue"
-                # If at root node.
-                if cur_depth == 0:
-                    # Check visited as flag to determine if moves need to be 
-                    # generated (Since root move is initially None). 
-                    if False == visited:
-                        # First push the root back onto the stack. 
-                        call_stack.append([0, [], color, alpha, beta, value, cur_ptr, True, []])
-                        # Generate children of root node and push onto stack. 
-                        ordered = []
-                        for next_move in board.get_all_moves_ref(color):
-                            # Check if next move is a win. 
-                            saves = board.apply_moves(next_move, color)
-                            ordered.append( (next_move, self.color_weight[color] * self.evaluate_node(board)))
-
-                            if board.game_over():
-                                if self.color == "blue":
-                                    if board.brown_lost():
-                                        return next_move
-                                else:
-                                    if board.blue_lost():
-                                        return next_move
-                            board.reverse_apply_moves(saves,color)
-
-                        # Order the children nodes.
-                        ordered.sort(key= lambda tup:tup[1], reverse=True)
-                        for next_move in ordered:
-                            call_stack.append([ 1, 
-                                                next_move[0][:],
-                                                neg_color, 
-                                                -beta,
-                                                -alpha, 
-                                                float('-inf'),
-                                                cur_ptr,
-                                                False,
-                                                []])
-                    # Otherwise we are done with current depth-limit 
-                    # iteration. Update max. 
-                    else:
-                        if value > maximum:        
-                            maximum = value
-                            choice = move
-                            depth_limit += 1
-                # Not at root node.
-                else:
-                    # If node hasn't been visited, apply move.
-                    if not visited:
-                        for piece_move in move:
-                            save = board.apply_move_retState(piece_move[0], 
-                                                             piece_move[1], 
-                                                             neg_color)
-                            saves.append(save)
-                        # Check if at depth-limit or terminal node.
-                        if board.game_over() or cur_depth == depth_limit:
-                            if board.game_over():
-                                if self.color == "brown" and board.brown_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "brown" and board.blue_lost():
-                                    value = self.color_weight[color] * 10.0
-                                if self.color == "blue" and board.blue_lost():
-                                    value = self.color_weight[color] * -10.0
-                                if self.color == "blue" and board.brown_lost():
-                                    value = self.color_weight[color] * 10.0
-                            else:
-                                value = self.color_weight[color] * self.evaluate_node(board)
-                            
-                            # Push terminal node back onto stack (with visited flag set).
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta,
-                                                value, 
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                        # Otherwise generate children.
-                        else:
-                            # Push node back onto stack with visited flag set. 
-                            call_stack.append([ cur_depth,
-                                                move[:],
-                                                color,
-                                                alpha,
-                                                beta, 
-                                                value,
-                                                parent_ptr,
-                                                True,
-                                                saves
-                                              ])
-                            # Order the nodes.
-                            ordered = []
-                            for next_move in board.get_all_moves_ref(color):
-                                saves = board.apply_moves(next_move, color)
-                                ordered.append( (next_move, self.color_weight[color] * self.evaluate_node(board)))
-                                board.reverse_apply_moves(saves, color)
-                            
-                            ordered.sort(key= lambda tup:tup[1])
-
-
-                            for next_move in ordered:
-                                call_stack.append([ cur_depth+1, 
-                                                    next_move[0][:],
-                                                    neg_color, 
-                                                    -beta, 
-                                                    -alpha,
-                                                    float('-inf'),
-                                                    cur_ptr,
-                                                    False,
-                                                    []])
-                    # Otherwise node has been visited, undo moves and propagate values up. 
-                    else:
-
-                        for i in range(len(saves)-1, -1, -1):
-                            board.reverse_apply_move(saves[i], neg_color)
-                        if -value > call_stack[parent_ptr][id["value"]]:
-                            call_stack[parent_ptr][id["value"]] = -value
-                            if cur_depth == 1:
-                                call_stack[parent_ptr][id["move"]] = move
-                        if -value > call_stack[parent_ptr][id["alpha"]]:
-                            call_stack[parent_ptr][id["alpha"]] = -value
-                            for i in range(parent_ptr, cur_ptr):
-                                call_stack[i][id["alpha"]] = -value
-                        if call_stack[parent_ptr][id["alpha"]] >= call_stack[parent_ptr][id["beta"]]:
-                            nodes_pruned += (len(call_stack) - parent_ptr)
-                            call_stack = call_stack[:parent_ptr+1]
-        print("NODES PRUNED:", nodes_pruned)
-        print("MAX DEPTH REACHED:", max_depth)
-        return choice
+            saves = board.apply_moves(turns[i], color)
+            try:
+                v = -self.negamax(board, neg_color, depth - 1, ply + 1, -beta,
+                    -alpha, follow if i == 0 else None)
+            finally:
+                board.reverse_apply_moves(saves, color)
+            if v > value:
+                value = v
+                best_turn = turns[i]
+                if ply == 0:
+                    self.root_turn = turns[i]
+            if v > alpha:
+                alpha = v
+                if self.pv_ordering:
+                    self.pv_lines[ply] = [turns[i]] + self.pv_lines[ply+1]
+            # Nothing beats a win, so stop there too. A cutoff by the first
+            # turn leaves the rest ungenerated (and uncounted).
+            if alpha >= beta or v >= WIN_VALUE:
+                if alpha >= beta:
+                    self.record_cutoff(board, color, turns[i], depth, ply)
+                self.pruned += len(turns) - i - 1
+                break
+            i += 1
+
+        # Transposition table caching happens here. 
+        if self.use_tt:
+            if value <= alpha_orig:
+                flag = GT
+            elif value >= beta:
+                flag = LT
+            else:
+                flag = EQ
+            # Keep the earlier best turn if none beat alpha this time.
+            if value > alpha_orig:
+                hash_code = encode_turn(best_turn)
+            self.tt.put(key, value, depth, flag, hash_code)
+        return value
+
+    # The children of a node at ply in the order to search them
+    def ordered_turns(self, board, color, ply):
+        turns = self.get_turns(board, color)
+        if self.eval_ordering:
+            turns = self.order_by_eval(board, color, turns)
+        elif self.killer_moves or self.history_ordering:
+            turns = self.order_by_history(board, color, turns, ply)
+        return turns
+
+    # The killer turns of ply first, then the rest by the sum of their
+    # moves' history scores, highest first (ties keep their generation
+    # order); no child is applied or evaluated.
+    def order_by_history(self, board, color, turns, ply):
+        if self.history_ordering and self.history:
+            if "blue" == color:
+                friendly_locs = board.blue_pieces_locations
+            else:
+                friendly_locs = board.brown_pieces_locations
+            history = self.history
+            scored = []
+            for turn in turns:
+                score = 0
+                for (origin, new_location) in turn:
+                    score += history.get(friendly_locs[origin].rank << 20 |
+                        encode_move(origin, new_location), 0)
+                scored.append((turn, score))
+            scored.sort(key=lambda tup: tup[1], reverse=True)
+            turns = [tup[0] for tup in scored]
+        if self.killer_moves and ply in self.killers:
+            killers = [turn for turn in self.killers[ply] if turn in turns]
+            if killers:
+                turns = killers + [turn for turn in turns
+                    if turn not in killers]
+        return turns
+
+    # Learn from turn, made by color at board, causing a beta cutoff with
+    # depth plies left at ply
+    def record_cutoff(self, board, color, turn, depth, ply):
+        if self.killer_moves:
+            killers = self.killers.setdefault(ply, [])
+            if turn not in killers:
+                killers.insert(0, turn)
+                del killers[NUM_KILLERS:]
+        if self.history_ordering:
+            if "blue" == color:
+                friendly_locs = board.blue_pieces_locations
+            else:
+                friendly_locs = board.brown_pieces_locations
+            for (origin, new_location) in turn:
+                move_key = friendly_locs[origin].rank << 20 | \
+                    encode_move(origin, new_location)
+                self.history[move_key] = self.history.get(move_key, 0) + \
+                    depth * depth
+
+    # The turn with code from the transposition table, or None unless it is a
+    # legal turn for color here. Keys match in full, so only a hash collision
+    # could give a turn of some other position: each move is checked against
+    # the piece's legal moves once the moves before it are made, and no
+    # piece may move twice.
+    def hash_turn(self, board, color, code):
+        turn = decode_turn(code)
+        if len(turn) >= board.moves_max:
+            return None
+        friendly_locs = board.get_locations(color)[0]
+        moved = set()
+        saves = []
+        try:
+            for (origin, new_location) in turn:
+                piece = friendly_locs.get(origin)
+                if piece is None or piece in moved or \
+                    new_location not in board.get_piece_moves(piece):
+                    return None
+                moved.add(piece)
+                saves.append(board.apply_move_retState(origin, new_location,
+                    color))
+        finally:
+            board.reverse_apply_moves(saves, color)
+        return turn
+
+    # A very rudimentary move ordering scheme: evaluate the children, then
+    # sort them best first for color (ties keep their generation order).
+    def order_by_eval(self, board, color, turns):
+        ordered = []
+        for turn in turns:
+            saves = board.apply_moves(turn, color)
+            if board.winner is not None:
+                v = WIN_VALUE if board.winner == color else -WIN_VALUE
+            else:
+                v = self.color_weight[color] * self.evaluate_node(board)
+            board.reverse_apply_moves(saves, color)
+            ordered.append((turn, v))
+        ordered.sort(key=lambda tup: tup[1], reverse=True)
+        return [tup[0] for tup in ordered]
 
     # Apply a move, evaluate it, and return the evaluation.
     def eval_move(self, board, moves, color):
@@ -1242,32 +569,32 @@ class Minimax_Agent(Agent):
 
     # HEURISTICS (Supplanted by the heuristics in the common Heuristics.py file)
     def enemy_royalty_count(self, counts):
-        return 1-((counts["king"] + counts["prince"] + counts["duke"])/3)   
+        return 1-((counts[KING] + counts[PRINCE] + counts[DUKE])/3)   
 
     def friendly_royalty_count(self, counts):
-        return ((counts["king"] + counts["prince"] + counts["duke"])/3) 
+        return ((counts[KING] + counts[PRINCE] + counts[DUKE])/3) 
 
     def enemy_pieces_remaining(self, counts):
         res = 0.0
-        res += counts["knight"]
-        res += counts["sergeant"]
-        res += counts["pikemen"]
-        res += counts["squire"]
-        res += counts["archer"]
+        res += counts[KNIGHT]
+        res += counts[SERGEANT]
+        res += counts[PIKEMEN]
+        res += counts[SQUIRE]
+        res += counts[ARCHER]
         return 1 - (res / 10.0)
 
     def friendly_pieces_remaining(self, counts):
         res = 0.0
-        res += counts["knight"]
-        res += counts["sergeant"]
-        res += counts["pikemen"]
-        res += counts["squire"]
-        res += counts["archer"]
+        res += counts[KNIGHT]
+        res += counts[SERGEANT]
+        res += counts[PIKEMEN]
+        res += counts[SQUIRE]
+        res += counts[ARCHER]
         return (res / 10.0)
 
     def in_enemy_castle(self, board, friendly_locs, enemy_castle):
         if enemy_castle[0] in friendly_locs:
-            if str(friendly_locs[enemy_castle[0]]) == "archer":
+            if friendly_locs[enemy_castle[0]].rank == ARCHER:
                 return 0.0
             return 1
         else:
@@ -1318,19 +645,13 @@ class Minimax_Agent(Agent):
         return .2*v1 + .2*v2 + .2*v3 + .2*v4 + .1*v5 + .1*v6
 
     def friendly_royalty_avengeable(self, board, pieces, friendly_locs, friendly_counts):
-        royalty_locs_covered = set()
-        upper_bound = friendly_counts["king"] + friendly_counts["prince"] + friendly_counts["duke"]
-
-        # Iterate over all piece moves and if a royalty position is covered,
-        # add it to the covered set
-        for piece in pieces:
-            for (x,y) in piece.get_moves_w_avg(board, friendly_locs, dict()):
-                if (x,y) in friendly_locs:
-                    if str(friendly_locs[(x,y)]) in ["king", "prince", "duke"]: 
-                        royalty_locs_covered.add((x,y))
-                if len(royalty_locs_covered) == upper_bound:
-                    break
-        return (len(royalty_locs_covered) / 3)
+        # A royalty position is covered if any friendly piece attacks it
+        attacked = board.get_attack_map(self.color)
+        royalty_locs_covered = 0
+        for loc, piece in friendly_locs.items():
+            if piece.rank in ROYALTY and attacked & SQUARE_BITS[loc]:
+                royalty_locs_covered += 1
+        return (royalty_locs_covered / 3)
 
     def proximity_pieces(self, friendly_locations, friendly_castle):
        
@@ -1343,7 +664,7 @@ class Minimax_Agent(Agent):
     
         pts = []
         for loc,piece in friendly_locations.items():
-            if str(piece) in ["king", "squire", "archer"]:
+            if piece.rank in (KING, SQUIRE, ARCHER):
                 pts.append(loc)
         pts.append(friendly_castle[0])
         res = 0.0
@@ -0,0 +1,176 @@
+from Board import *
+from BatchBoard import BatchBoard, SLOT_RANKS, COLOR_INDEX
+from LocalSearch import *
+from MCTS import MCTS_UCT_LP_Agent
+from time import perf_counter
+import numpy as np
+import random
+
+# Set up a random starting board
+def random_board():
+    board = Board()
+    board.parse_terrain("terrain_3M_official_1.txt")
+    board.place_pieces("blue",
+        HillClimbingFirstChoice(board, "blue").get_random_start())
+    board.place_pieces("brown",
+        HillClimbingFirstChoice(board, "brown").get_random_start())
+    return board
+
+# The batch must agree with every Board on winners, piece squares and moves
+def check_batch(batch, boards):
+    winners = batch.get_winners()
+    for b, board in enumerate(boards):
+        assert winners[b] == {None : -1, "blue" : 0, "brown" : 1}[board.winner]
+    for color in ("blue", "brown"):
+        c = COLOR_INDEX[color]
+        masks = batch.move_masks(color)
+        for b, board in enumerate(boards):
+            pieces = board.get_pieces(color)
+            squares = batch.squares[b, c * 13:(c + 1) * 13]
+            assert sorted(sq for sq in squares if sq >= 0) == \
+                sorted(i*24 + j for (i,j) in pieces.values())
+            friendly_locs, _ = board.get_locations(color)
+            for slot in range(13):
+                if squares[slot] < 0:
+                    assert not masks[b, slot].any()
+                    continue
+                piece = friendly_locs[(squares[slot] // 24,
+                    squares[slot] % 24)]
+                assert piece.rank == SLOT_RANKS[slot]
+                assert list(np.nonzero(masks[b, slot])[0]) == \
+                    sorted(i*24 + j for (i,j) in board.get_piece_moves(piece))
+
+# Play up to num_turns turns preferring captures
+# @return   The color to move next
+def advance(board, num_turns, color="blue"):
+    for turn in range(num_turns):
+        if board.game_over():
+            break
+        choices = board.get_capture_turns(color)
+        board.apply_moves(random.choice(choices) if choices else
+            random.choice(board.get_all_moves_ref(color)), color)
+        color = "brown" if color == "blue" else "blue"
+    return color
+
+# Replay a turn of BatchBoard.apply_random_turns on the Boards, checking the
+# pieces moved in sorted order and none moved once the game was over
+# @return   The number of boards whose game ended while other boards went on
+#           moving pieces
+def replay_turn(boards, moves, color):
+    ended_mid_turn = 0
+    for b, board in enumerate(boards):
+        order = []
+        for i, (slots, origins, dests) in enumerate(moves):
+            if slots[b] < 0:
+                continue
+            assert not board.game_over()
+            origin = (origins[b] // 24, origins[b] % 24)
+            piece = board.get_locations(color)[0][origin]
+            order.append((piece.rank, origin[1], piece.number))
+            board.apply_move(origin, (dests[b] // 24, dests[b] % 24), color)
+            if board.game_over() and i < len(moves) - 1:
+                ended_mid_turn += 1
+        assert order == sorted(order)
+        assert len(order) <= len(moves)
+    return ended_mid_turn
+
+if __name__ == "__main__":
+    random.seed(5)
+    boards = [random_board() for _ in range(8)]
+    # Advance the boards unevenly (preferring captures) so the batch starts
+    # mid-game with captured pieces and finished games
+    for board in boards:
+        advance(board, random.randrange(40))
+    batch = BatchBoard(boards)
+    check_batch(batch, boards)
+
+    # Replay the batch's random moves on the Boards
+    rng = np.random.default_rng(5)
+    color = "blue"
+    for step in range(100):
+        slots, origins, dests = batch.apply_random_moves(color, rng)
+        for b, board in enumerate(boards):
+            if slots[b] < 0:
+                assert board.game_over() or \
+                    board.get_num_all_moves(color) == 0
+                continue
+            board.apply_move((origins[b] // 24, origins[b] % 24),
+                (dests[b] // 24, dests[b] % 24), color)
+        check_batch(batch, boards)
+        color = "brown" if color == "blue" else "blue"
+    print("Batch agrees with Boards after", step + 1, "moves, winners",
+        batch.get_winners())
+
+    # Replay random turns of up to 3 pieces on the Boards
+    boards = [random_board() for _ in range(16)]
+    for board in boards:
+        advance(board, 40)
+    batch = BatchBoard(boards)
+    color = "blue"
+    for turn in range(50):
+        replay_turn(boards, batch.apply_random_turns(color, rng, 3), color)
+        check_batch(batch, boards)
+        color = "brown" if color == "blue" else "blue"
+    print("Batch agrees with Boards after", turn + 1, "turns of 1-3 pieces")
+
+    # A position with a single move win, copied: boards winning with an
+    # early piece of their turn must not move the later ones
+    board = random_board()
+    color = "blue"
+    while not any(len(moves) == 1 for moves in
+        board.get_winning_turns(color)):
+        color = advance(board, 1, color)
+        assert not board.game_over()
+    ended_mid_turn = 0
+    for attempt in range(20):
+        boards = [board.clone() for _ in range(256)]
+        batch = BatchBoard(boards)
+        ended_mid_turn += replay_turn(boards, batch.apply_random_turns(color,
+            rng, 3), color)
+        check_batch(batch, boards)
+        if ended_mid_turn:
+            break
+    print(ended_mid_turn, "of", len(boards), "turns cut short by a win")
+    assert ended_mid_turn > 0
+
+    # Boards rebuilt from the batch keep the Pieces and their numbers
+    for b, board in enumerate(boards):
+        rebuilt = batch.get_board(b, board)
+        assert rebuilt.to_bytes() == board.to_bytes()
+        assert rebuilt.winner == board.winner
+
+    # Playout throughput against Board.apply_random_turn
+    sources = [random_board() for _ in range(4)]
+    num_turns = 0
+    start = perf_counter()
+    for board in sources:
+        board = board.clone()
+        color = "blue"
+        for turn in range(100):
+            if board.game_over():
+                break
+            board.apply_random_turn(color)
+            num_turns += 1
+            color = "brown" if color == "blue" else "blue"
+    end = perf_counter()
+    print("Board: %.1f us per board turn" % ((end - start) /
+        num_turns * 1e6))
+    batch = BatchBoard([sources[i % 4] for i in range(256)])
+    start = perf_counter()
+    winners, turns = batch.run_playouts("blue", rng, 2, 100)
+    end = perf_counter()
+    print("BatchBoard: %.1f us per board turn" % ((end - start) /
+        turns.sum() * 1e6))
+
+    # MCTS leaf simulations on a batch, truncated by an evaluation
+    random.seed(5)
+    board = random_board()
+    agent = MCTS_UCT_LP_Agent("blue", 2, None, None, None, 1.4, "random",
+        turn_limit=20, truncate_function="simplepiece", num_processes=64,
+        batch_playouts=True)
+    choice = agent.get_choice(board)
+    agent.cleanup()
+    assert choice in board.get_all_moves_ref("blue")
+    simulations = agent.get_statistics()["Number of simulations"][0]
+    print("MCTS batch simulations in 2 seconds:", simulations)
+    assert simulations > 0 and simulations % 64 == 0
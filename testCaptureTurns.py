@@ -0,0 +1,70 @@
+from Board import *
+from LocalSearch import *
+from time import perf_counter
+import random
+
+if __name__ == "__main__":
+    random.seed(1)
+    b3 = Board()
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    blue_searcher = HillClimbingFirstChoice(b3, "blue")
+    brown_searcher = HillClimbingFirstChoice(b3, "brown")
+    blue_random = blue_searcher.get_random_start()
+    brown_random = brown_searcher.get_random_start()
+    b3.place_pieces("blue", blue_random)
+    b3.place_pieces("brown", brown_random)
+
+    # Play random turns (preferring captures, to reach tactical positions),
+    # checking the capture and winning turns against filtering every turn
+    color = "blue"
+    for turn in range(60):
+        if b3.game_over():
+            break
+        opponent = "brown" if color == "blue" else "blue"
+        start = perf_counter()
+        all_moves = b3.get_all_moves_ref(color)
+        end = perf_counter()
+        all_time = end - start
+        start = perf_counter()
+        capture_turns = b3.get_capture_turns(color)
+        winning_turns = b3.get_winning_turns(color)
+        end = perf_counter()
+
+        current_counts = b3.get_counts(opponent)[:]
+        expected_captures = []
+        expected_wins = []
+        for moves in all_moves:
+            saves = b3.apply_moves(moves, color)
+            if b3.get_counts(opponent) != current_counts:
+                expected_captures.append(moves)
+            if b3.winner == color:
+                expected_wins.append(moves)
+            b3.reverse_apply_moves(saves, color)
+        assert capture_turns == expected_captures
+        assert winning_turns == expected_wins
+
+        # Walking the turns in place visits the same turns, each in its
+        # post-turn state, and restores the board, also after stopping early
+        hash_key = b3.get_hash_key()
+        visited = []
+        def visit_capture(moves):
+            assert b3.get_counts(opponent) != current_counts
+            visited.append(moves[:])
+        assert b3.for_each_turn(color, visit_capture, captures=True) is None
+        assert visited == capture_turns
+        visited = []
+        b3.for_each_turn(color, lambda moves: visited.append(moves[:]))
+        assert visited == all_moves
+        first = b3.for_each_turn(color, list, captures=True)
+        assert first == (capture_turns[0] if capture_turns else None)
+        stop = all_moves[len(all_moves) // 2]
+        assert b3.for_each_turn(color, lambda moves: moves == stop)
+        assert b3.get_hash_key() == hash_key
+        assert b3.get_all_moves_ref(color) == all_moves
+        print("Turn", turn, "captures", len(capture_turns), "wins",
+            len(winning_turns), "of", len(all_moves),
+            "time: %.4f vs %.4f" % (end - start, all_time))
+
+        choices = capture_turns if capture_turns else all_moves
+        b3.apply_moves(random.choice(choices), color)
+        color = opponent
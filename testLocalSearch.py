@@ -69,3 +69,22 @@ if __name__ == "__main__":
     end = perf_counter()
     print("Time elapsed: ", (end-start))
     print("Count via method: ", count_via_method)
+
+    # A friendly piece on the castle interior is covered by pieces off the
+    # green too (which cannot move there), as in the original avenge rule
+    b4 = Board()
+    b4.parse_terrain("terrain_3M_official_1.txt")
+    blue_searcher = HillClimbingFirstChoice(b4, "blue")
+    config = {"castle_green" : (10, 11), "castle_interior" : (10, 10),
+        "king" : (0, 20), "prince" : (1, 16), "duke" : (7, 8),
+        "knight" : [(7, 14), (9, 21)], "sergeant" : [(1, 12), (2, 2)],
+        "pikemen" : [(5, 22), (10, 10), (1, 10), (1, 8)],
+        "squire" : (6, 21), "archer" : (6, 8)}
+    assert blue_searcher.non_royalty_avengeable(config) == 0.7
+    b4.place_pieces("blue", config)
+    assert b4.is_attacked("blue", (10, 10))
+    assert all(move[0][1] != (10, 10) for move in
+        b4.get_all_moves_ref("blue"))
+    print("Interior piece covered:", [str(p) for p in b4.blue_pieces if
+        (10, 10) in p.get_moves_w_avg(b4, b4.blue_pieces_locations,
+        b4.brown_pieces_locations)])
@@ -0,0 +1,44 @@
+from Board import *
+from LocalSearch import *
+import random
+
+# Every cached move list must match a fresh generation for its piece
+def check_cache(board):
+    for piece, (moves, mask) in board.move_cache.items():
+        friendly_locs, opponent_locs = board.get_locations(piece.color)
+        assert moves == piece.get_moves_list(board, friendly_locs,
+            opponent_locs)
+
+if __name__ == "__main__":
+    random.seed(3)
+    b3 = Board()
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    blue_searcher = HillClimbingFirstChoice(b3, "blue")
+    brown_searcher = HillClimbingFirstChoice(b3, "brown")
+    b3.place_pieces("blue", blue_searcher.get_random_start())
+    b3.place_pieces("brown", brown_searcher.get_random_start())
+
+    # Random walk of single moves, reversing some of them (LIFO), with the
+    # cache checked after every step
+    color = "blue"
+    stack = []
+    for step in range(500):
+        for piece in list(b3.blue_pieces) + list(b3.brown_pieces):
+            b3.get_piece_moves(piece)
+        check_cache(b3)
+        if stack and (random.random() < 0.4 or b3.game_over()):
+            save, color = stack.pop()
+            b3.reverse_apply_move(save, color)
+        else:
+            pieces = [p for p in b3.get_pieces(color)
+                if b3.get_piece_moves(p)]
+            if not pieces:
+                break
+            piece = random.choice(pieces)
+            move = random.choice(b3.get_piece_moves(piece))
+            stack.append((b3.apply_move_retState(piece.location, move,
+                color), color))
+            color = "brown" if color == "blue" else "blue"
+        check_cache(b3)
+    print("Steps", step + 1, "undo depth", len(stack), "cached",
+        len(b3.move_cache))
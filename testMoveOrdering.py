@@ -0,0 +1,52 @@
+from Board import *
+from LocalSearch import *
+from Minimax import *
+import random, time
+
+# A board with a random setup; a fresh one for each search, as searching
+# reorders the piece dictionaries and so the turns under max_turns
+def random_board(seed):
+    random.seed(seed)
+    board = Board()
+    board.parse_terrain("terrain_3M_official_1.txt")
+    board.place_pieces("blue", HillClimbingFirstChoice(board,
+        "blue").get_random_start())
+    board.place_pieces("brown", HillClimbingFirstChoice(board,
+        "brown").get_random_start())
+    return board
+
+if __name__ == "__main__":
+    # Killer and history ordering find the same values, in fewer nodes
+    results = {}
+    for search in ("memory", "history"):
+        b3 = random_board(1)
+        hash_key = b3.get_hash_key()
+        agent = Minimax_Agent("blue", 1000, None, None, None,
+            max_turns=40, search=search)
+        agent.start_time = time.process_time()
+        agent.depth_reached = agent.reached = agent.expanded = 0
+        agent.pruned = agent.hits = 0
+        agent.pv = []
+        agent.killers = {}
+        start = time.process_time()
+        values = [agent.root_search(b3, depth, float('-inf'),
+            float('inf'))[0] for depth in (1, 2, 3)]
+        end = time.process_time()
+        print(search, values, "nodes expanded:", agent.expanded,
+            "reached:", agent.reached, "time: %.2f" % (end - start))
+        results[search] = (values, agent)
+        assert b3.get_hash_key() == hash_key
+    assert results["memory"][0] == results["history"][0]
+    agent = results["history"][1]
+    assert agent.expanded <= results["memory"][1].expanded
+    assert all(len(killers) <= NUM_KILLERS for killers in
+        agent.killers.values())
+    assert agent.history
+
+    # History carries over (halved) to the next decision; killers do not
+    agent.time_limit = 1.0
+    scores = dict(agent.history)
+    agent.get_choice(b3)
+    assert all(agent.history[move_key] >= scores[move_key] >> 1 for
+        move_key in scores)
+    print(agent.get_statistics())
@@ -0,0 +1,66 @@
+from Board import *
+from LocalSearch import *
+from MCTS import *
+import random
+
+# The position a node's action path leads to from the root
+def replay(root, node):
+    path = []
+    while node is not root:
+        path.append(node)
+        node = node.parent
+    board = root.state.clone()
+    for node in reversed(path):
+        board.apply_moves(node.action, node.parent.color)
+    return board
+
+def all_nodes(node):
+    yield node
+    for child in node.children:
+        yield from all_nodes(child)
+
+if __name__ == "__main__":
+    random.seed(7)
+    b3 = Board()
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    blue_searcher = HillClimbingFirstChoice(b3, "blue")
+    brown_searcher = HillClimbingFirstChoice(b3, "brown")
+    b3.place_pieces("blue", blue_searcher.get_random_start())
+    b3.place_pieces("brown", brown_searcher.get_random_start())
+
+    # A deep tree (few turns per node) with room for only a few states, so
+    # most node states are rebuilt from an ancestor
+    agent = MCTS_UCT_Agent("blue", 2, None, None, None, 1.41, "random",
+        turn_limit=6, truncate_function="simplepiece", turn_policy=TURNS_SAMPLE,
+        max_turns=3, state_cache_size=8)
+    tree = agent.new_tree(b3)
+    for _ in range(200):
+        selected = agent.select(tree, time())
+        child = agent.expand(selected, time())
+        agent.back_propagate(agent.simulate(child, time()), child, time())
+    nodes = list(all_nodes(tree))
+    assert len(tree.cache.states) <= 8
+    for node in nodes:
+        expected = replay(tree, node)
+        assert node.state.get_hash_key() == expected.get_hash_key()
+        assert node.state.winner == expected.winner == node.winner
+    print("States agree for", len(nodes), "nodes, max depth",
+        max(node.depth for node in nodes))
+
+    # Expansion applies the action to the parent's state in place and
+    # reverses it; the child's state is built for its playout, not cached
+    tree = agent.new_tree(b3)
+    encoded = tree.state.to_bytes()
+    hash_key = tree.state.get_hash_key()
+    for _ in range(3):
+        child = agent.expand(tree, time())
+        assert tree.state.to_bytes() == encoded
+        assert tree.state.get_hash_key() == hash_key
+        assert child not in tree.cache.states
+        playout_state = child.new_state()
+        assert playout_state.get_hash_key() == \
+            replay(tree, child).get_hash_key()
+        assert child not in tree.cache.states
+        assert child.state.get_hash_key() == playout_state.get_hash_key()
+        assert child in tree.cache.states
+    print("Expansion leaves the parent's state as it was")
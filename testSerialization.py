@@ -0,0 +1,75 @@
+from Board import *
+from LocalSearch import *
+from time import perf_counter
+import hashlib
+import pickle
+import random
+
+# The decoded board must hold the same position and give the same turns
+def check_same(board, decoded):
+    for color in ("blue", "brown"):
+        assert sorted((p.rank, p.number, p.location) for p in
+            board.get_pieces(color)) == sorted((p.rank, p.number, p.location)
+            for p in decoded.get_pieces(color))
+        assert board.get_counts(color) == decoded.get_counts(color)
+        assert sorted(board.get_all_moves_ref(color, True)) == \
+            sorted(decoded.get_all_moves_ref(color, True))
+    assert board.get_hash_key() == decoded.get_hash_key()
+    assert board.winner == decoded.winner
+    assert board.rough == decoded.rough
+    assert board.mountains == decoded.mountains
+    assert board.blue_castle == decoded.blue_castle
+    assert board.brown_castle == decoded.brown_castle
+    assert board.max_dist_blue == decoded.max_dist_blue
+    assert board.max_dist_brown == decoded.max_dist_brown
+
+if __name__ == "__main__":
+    random.seed(4)
+    b3 = Board()
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    check_same(b3, pickle.loads(pickle.dumps(b3)))
+    blue_searcher = HillClimbingFirstChoice(b3, "blue")
+    brown_searcher = HillClimbingFirstChoice(b3, "brown")
+    b3.place_pieces("blue", blue_searcher.get_random_start())
+    b3.place_pieces("brown", brown_searcher.get_random_start())
+    print("Encoded size:", len(b3.to_bytes()), "pickled size:",
+        len(pickle.dumps(b3)))
+
+    # Round trip every position of a game with captures; decoded boards with
+    # the same castles share one terrain
+    color = "blue"
+    for turn in range(100):
+        check_same(b3, Board.from_bytes(b3.to_bytes()))
+        check_same(b3, pickle.loads(pickle.dumps(b3)))
+        assert Board.from_bytes(b3.to_bytes()).terrain is \
+            Board.from_bytes(b3.to_bytes()).terrain
+        if b3.game_over():
+            break
+        capture_turns = b3.get_capture_turns(color)
+        b3.apply_moves(random.choice(capture_turns) if capture_turns else
+            b3.get_random_turn(color), color)
+        color = "brown" if color == "blue" else "blue"
+    print("Round trips agree for", turn + 1, "positions, winner", b3.winner)
+
+    # Games saved before the compact encoding (and Piece __slots__) still
+    # load: the file holds the states of a 1 move game pickled by the old
+    # Board, with digests of their sorted turns and their counts by name
+    with open("testSerialization_baseline.pkl", "rb") as f:
+        saved = pickle.load(f)
+    for board, expected in zip(saved["game_states"], saved["expected"]):
+        for i, color in enumerate(("blue", "brown")):
+            assert hashlib.sha256(repr(sorted(board.get_all_moves_ref(
+                color))).encode()).hexdigest() == expected["moves"][i]
+            assert {name : board.get_counts(color)[TYPE_CODES[name]] for
+                name in TYPE_NAMES} == expected["counts"][i]
+        assert board.game_over() == expected["game_over"]
+        check_same(board, pickle.loads(pickle.dumps(board)))
+        check_same(board, board.clone())
+    print("Loaded", len(saved["game_states"]), "boards pickled by the old "
+        "Board, winner", board.winner)
+
+    start = perf_counter()
+    for _ in range(1000):
+        pickle.loads(pickle.dumps(b3))
+    end = perf_counter()
+    print("Pickle round trip: %.1f us" % ((end - start) * 1000))
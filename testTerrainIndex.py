@@ -0,0 +1,80 @@
+from Board import *
+from LocalSearch import *
+from time import perf_counter
+import math, os, pickle
+import random
+
+# max_dist as place_pieces computed it: over every open square of the board
+def brute_max_dist(board, green):
+    dists = sorted([math.dist(l, green) for l in SQUARE_LOCATIONS
+        if l not in board.mountains], reverse=True)[:13]
+    return sum(dists)
+
+if __name__ == "__main__":
+    random.seed(6)
+    terrain_file = "terrain_3M_official_1.txt"
+    if os.path.exists(terrain_file + INDEX_SUFFIX):
+        os.remove(terrain_file + INDEX_SUFFIX)
+    start = perf_counter()
+    index = get_terrain_index(terrain_file)
+    end = perf_counter()
+    print("Index built and saved: %.3f" % (end - start))
+
+    # A fresh process would load it from disk instead
+    del TERRAIN_INDEXES[terrain_file]
+    start = perf_counter()
+    loaded = get_terrain_index(terrain_file)
+    end = perf_counter()
+    print("Index loaded: %.3f" % (end - start))
+    assert loaded is not index and loaded.stamp == index.stamp
+    assert loaded.rays == index.rays
+    assert loaded.far_squares == index.far_squares
+    assert loaded.neighbours == index.neighbours
+
+    # Index files that fail to load (a missing module, a changed class
+    # layout, a truncated pickle) or whose header no longer matches the
+    # terrain file are rebuilt and saved again
+    info = os.stat(terrain_file)
+    header = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, info.st_mtime_ns,
+        info.st_size)
+    stale = INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION,
+        info.st_mtime_ns + 1, info.st_size)
+    for contents in (header + b"\x80\x04cno_such_module\nTerrainIndex\n)\x81.",
+        header + b"\x80\x04cBoard\nTerrainIndex\n)R.",
+        header + pickle.dumps(index)[:100], stale + pickle.dumps(index),
+        pickle.dumps(index)):
+        with open(terrain_file + INDEX_SUFFIX, "wb") as file:
+            file.write(contents)
+        del TERRAIN_INDEXES[terrain_file]
+        rebuilt = get_terrain_index(terrain_file)
+        assert rebuilt.rays == index.rays
+        with open(terrain_file + INDEX_SUFFIX, "rb") as file:
+            assert file.read(INDEX_HEADER.size) == header
+    print("Unusable index files rebuilt")
+
+    # Castles (some on mountains, which they clear) change the rays and
+    # distances the index has for the castle-free terrain
+    mountains = sorted(loaded.mountains)
+    for trial in range(20):
+        b3 = Board()
+        b3.parse_terrain(terrain_file)
+        blue_searcher = HillClimbingFirstChoice(b3, "blue")
+        brown_searcher = HillClimbingFirstChoice(b3, "brown")
+        blue_config = blue_searcher.get_random_start()
+        brown_config = brown_searcher.get_random_start()
+        if trial % 2:
+            blue_config["castle_interior"] = random.choice([l for l in
+                mountains if l[0] < 12])
+        b3.place_pieces("blue", blue_config)
+        assert b3.max_dist_brown == brute_max_dist(b3, b3.blue_castle[0])
+        b3.place_pieces("brown", brown_config)
+        assert b3.max_dist_blue == brute_max_dist(b3, b3.brown_castle[0])
+        for location in SQUARE_LOCATIONS:
+            if location in b3.mountains:
+                continue
+            for rank in range(KING, ARCHER + 1):
+                piece = PIECE_CLASSES[rank]
+                piece = piece(1, "blue", location) if TARGET_COUNTS[rank] > 1 \
+                    else piece("blue", location)
+                assert b3.get_rays(piece) == b3.build_rays(piece)
+    print("Rays and max distances agree for", trial + 1, "castle placements")
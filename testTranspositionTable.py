@@ -0,0 +1,108 @@
+from Board import *
+from LocalSearch import *
+from Minimax import *
+import random, time
+
+if __name__ == "__main__":
+    # Entries round trip, with the longest (4 move) turn codes
+    tt = TranspositionTable(1)
+    print("Buckets in 1 MB:", tt.num_buckets)
+    turn = encode_turn([((23, 23), (22, 22)), ((0, 0), (1, 1)),
+        ((5, 6), (7, 8)), ((23, 0), (0, 23))])
+    tt.put(12345, 0.25, 3, LT, turn)
+    assert tt.get(12345) == (0.25, 3, LT, turn)
+    assert decode_turn(tt.get(12345)[3])[3] == ((23, 0), (0, 23))
+    assert tt.get(12345 + tt.num_buckets) is None
+
+    # A bucket keeps its deepest entry; shallower ones take the other slot
+    deep = 777
+    tt.put(deep, 1.0, 5, EQ)
+    for i in range(1, 4):
+        tt.put(deep + i * tt.num_buckets, -1.0, 2, GT)
+    assert tt.get(deep) == (1.0, 5, EQ, 0)
+    assert tt.get(deep + 3 * tt.num_buckets) == (-1.0, 2, GT, 0)
+    assert tt.get(deep + tt.num_buckets) is None
+    tt.put(deep + tt.num_buckets, 0.5, 6, EQ)
+    assert tt.get(deep + tt.num_buckets) == (0.5, 6, EQ, 0)
+
+    # A key turned away to the second entry moves to the first once deep
+    # enough, and is never held by both
+    def copies(key):
+        i = 2 * (key % tt.num_buckets)
+        return sum(1 for j in (i, i + 1) if tt.keys[j] == key and tt.infos[j])
+    other = deep + 7 * tt.num_buckets
+    tt.put(other, 0.1, 3, LT)
+    assert tt.get(other) == (0.1, 3, LT, 0) and copies(other) == 1
+    tt.put(other, 0.2, 7, EQ)
+    assert tt.get(other) == (0.2, 7, EQ, 0) and copies(other) == 1
+    tt.put(other, 0.3, 1, GT)
+    assert tt.get(other) == (0.3, 1, GT, 0) and copies(other) == 1
+    tt.put(deep + tt.num_buckets, 0.5, 6, EQ)
+
+    # Entries outlive their search, but give way to newer ones
+    tt.new_search()
+    assert tt.get(deep + tt.num_buckets) == (0.5, 6, EQ, 0)
+    tt.put(deep + 2 * tt.num_buckets, 0.0, 1, LT)
+    assert tt.get(deep + 2 * tt.num_buckets) == (0.0, 1, LT, 0)
+    assert tt.get(deep + tt.num_buckets) is None
+    tt.put(deep, 1.0, 0, EQ)
+    assert tt.get(deep + 2 * tt.num_buckets) == (0.0, 1, LT, 0)
+    tt.clear()
+    assert tt.get(deep + 2 * tt.num_buckets) is None
+
+    # A table too small for the search still finds the same value
+    random.seed(3)
+    b3 = Board()
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    b3.place_pieces("blue", HillClimbingFirstChoice(b3,
+        "blue").get_random_start())
+    b3.place_pieces("brown", HillClimbingFirstChoice(b3,
+        "brown").get_random_start())
+    values = []
+    for size_mb in (0.001, TT_SIZE_MB):
+        agent = Minimax_Agent("brown", 1000, None, None, None,
+            turn_policy=TURNS_BEST, max_turns=12, tt_size_mb=size_mb)
+        agent.start_time = time.process_time()
+        agent.depth_reached = agent.reached = agent.expanded = 0
+        agent.pruned = agent.hits = 0
+        agent.pv = []
+        for depth in (1, 2, 3):
+            values.append(agent.root_search(b3, depth, float('-inf'),
+                float('inf'))[0])
+        print(size_mb, "MB:", values[-3:], agent.hits, "TT hits")
+    assert values[:3] == values[3:]
+
+    # The next turn's search starts warm from the last one
+    agent = Minimax_Agent("brown", 2.0, None, None, None,
+        turn_policy=TURNS_BEST, max_turns=12)
+    agent.get_choice(b3)
+    b3.apply_moves(b3.get_turns("blue", TURNS_BEST, 1)[0], "blue")
+    choice = agent.get_choice(b3)
+    print(agent.get_statistics())
+
+    # The root's entry holds the turn chosen, to be searched first next time
+    tt_entry = agent.tt.get(agent.tt_key(b3, "brown"))
+    assert decode_turn(tt_entry[3]) == list(choice)
+    assert agent.hash_turn(b3, "brown", tt_entry[3]) == list(choice)
+    assert agent.hash_turn(b3, "blue", tt_entry[3]) is None
+    assert agent.get_statistics()["TT hits"][1] > 0
+
+    # A colliding entry's turn is only searched if it is legal here
+    hash_key = b3.get_hash_key()
+    friendly_locs = b3.get_locations("brown")[0]
+    origin = choice[0][0]
+    piece = friendly_locs[origin]
+    moves = b3.get_piece_moves(piece)
+    blocked = [loc for loc in SQUARE_LOCATIONS if loc not in moves and
+        loc != origin][0]
+    assert agent.hash_turn(b3, "brown", encode_turn([(origin, blocked)])) \
+        is None
+    assert agent.hash_turn(b3, "brown", encode_turn([(origin, moves[0])])) \
+        == [(origin, moves[0])]
+    saves = b3.apply_moves([(origin, moves[0])], "brown")
+    again = b3.get_piece_moves(piece)
+    b3.reverse_apply_moves(saves, "brown")
+    assert again
+    assert agent.hash_turn(b3, "brown", encode_turn([(origin, moves[0]),
+        (moves[0], again[0])])) is None
+    assert b3.get_hash_key() == hash_key
@@ -0,0 +1,41 @@
+from Board import *
+from LocalSearch import *
+from time import perf_counter
+import random
+
+if __name__ == "__main__":
+    random.seed(4)
+    b3 = Board(2)
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    blue_searcher = HillClimbingFirstChoice(b3, "blue")
+    brown_searcher = HillClimbingFirstChoice(b3, "brown")
+    b3.place_pieces("blue", blue_searcher.get_random_start())
+    b3.place_pieces("brown", brown_searcher.get_random_start())
+    hash_key = b3.get_hash_key()
+
+    # The lazy generator matches the full lists, and stopping it early
+    # leaves the board untouched
+    all_moves = b3.get_all_moves_ref("blue")
+    capture_turns = b3.get_capture_turns("blue")
+    assert list(b3.iter_turns("blue")) == all_moves
+    assert list(b3.iter_turns("blue", captures=True)) == capture_turns
+    assert b3.get_turns("blue", TURNS_ALL, 10) == all_moves[:10]
+    assert b3.get_hash_key() == hash_key
+    captures_first = b3.get_turns("blue", TURNS_CAPTURES, 100)
+    assert captures_first[:len(capture_turns)] == capture_turns[:100]
+
+    # Best and sampled turns are distinct legal turns
+    codes = {encode_turn(moves) for moves in all_moves}
+    for policy in (TURNS_BEST, TURNS_SAMPLE):
+        turns = b3.get_turns("blue", policy, 50)
+        assert len({encode_turn(moves) for moves in turns}) == len(turns)
+        assert all(encode_turn(moves) in codes for moves in turns)
+    assert b3.get_hash_key() == hash_key
+
+    # Timing with all 4 moves per turn
+    b3.moves_max = 5
+    for policy in (TURNS_ALL, TURNS_CAPTURES, TURNS_BEST, TURNS_SAMPLE):
+        start = perf_counter()
+        turns = b3.get_turns("blue", policy, 100)
+        end = perf_counter()
+        print(policy, len(turns), "time: %.4f" % (end - start))
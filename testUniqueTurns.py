@@ -0,0 +1,43 @@
+from Board import *
+from LocalSearch import *
+from time import perf_counter
+import random
+
+if __name__ == "__main__":
+    random.seed(2)
+    b3 = Board()
+    b3.parse_terrain("terrain_3M_official_1.txt")
+    blue_searcher = HillClimbingFirstChoice(b3, "blue")
+    brown_searcher = HillClimbingFirstChoice(b3, "brown")
+    b3.place_pieces("blue", blue_searcher.get_random_start())
+    b3.place_pieces("brown", brown_searcher.get_random_start())
+
+    # The unique turns must be the first turn reaching each resulting
+    # position, found here by applying every turn
+    color = "blue"
+    for turn in range(30):
+        if b3.game_over():
+            break
+        all_moves = b3.get_all_moves_ref(color)
+        start = perf_counter()
+        unique_moves = b3.get_all_moves_ref(color, unique=True)
+        end = perf_counter()
+        assert b3.get_all_moves_ref(color, True, True) == \
+            [encode_turn(moves) for moves in unique_moves]
+
+        positions = set()
+        expected = []
+        for moves in all_moves:
+            saves = b3.apply_moves(moves, color)
+            if b3.get_hash_key() not in positions:
+                positions.add(b3.get_hash_key())
+                expected.append(moves)
+            b3.reverse_apply_moves(saves, color)
+        assert unique_moves == expected
+        print("Turn", turn, "unique", len(unique_moves), "of", len(all_moves),
+            "time: %.4f" % (end - start))
+
+        capture_turns = b3.get_capture_turns(color)
+        choices = capture_turns if capture_turns else all_moves
+        b3.apply_moves(random.choice(choices), color)
+        color = "brown" if color == "blue" else "blue"